@@ -0,0 +1,184 @@
+import json
+import mmap
+import os
+import struct
+
+from prompt_model import PromptRecord
+
+# Compact binary copy of the JSON snapshot, opened with mmap at startup.
+#
+# Layout (little-endian):
+#   header        HEADER
+#   offset table  record count x RECORD_REF (prompt id, record offset, prompt offset, note offset)
+#   meta          UTF-8 JSON object with next_id, categories and global_tags
+#   records       RECORD_HEADER followed by the UTF-8 title, category, tags and extra of each prompt
+#   bodies        UTF-8 prompt bodies and notes, each distinct text stored once
+#
+# Records are kept apart from the bodies so that loading reads one small contiguous region:
+# titles and metadata are decoded at load time, prompt bodies and notes only when read.
+# Prompts with the same body or note point to the same bytes, and share the string once read.
+
+MAGIC = b'PVSNAP\x00\x01'
+FORMAT_VERSION = 4
+# magic, format version, record count, source mtime (ns), source size, journal seq, meta offset,
+# meta length, bodies offset
+HEADER = struct.Struct('<8sIIqqqQQQ')
+RECORD_REF = struct.Struct('<qQQQ')
+# flags, revision, then the byte length of the title, category, tags, extra, prompt and note
+RECORD_HEADER = struct.Struct('<BQ6I')
+
+TAG_SEPARATOR = '\x1f'
+
+FLAG_FAVORITE = 1
+FLAG_JSON_TAGS = 2 # Tags stored as a JSON list, because one of them contains TAG_SEPARATOR
+
+
+def _encode_record(record):
+    # (record bytes, prompt bytes, note bytes)
+    flags = FLAG_FAVORITE if record.favorite else 0
+    if any(TAG_SEPARATOR in tag for tag in record.tags):
+        tags = json.dumps(record.tags, ensure_ascii=False)
+        flags |= FLAG_JSON_TAGS
+    else:
+        tags = TAG_SEPARATOR.join(record.tags)
+    extra = json.dumps(record.extra, ensure_ascii=False, separators=(',', ':')) if record.extra else ''
+    fields = [value.encode('utf-8') for value in (record.title, record.category, tags, extra)]
+    prompt = record.prompt.encode('utf-8')
+    note = record.note.encode('utf-8')
+    header = RECORD_HEADER.pack(flags, record.rev, *(len(b) for b in fields), len(prompt), len(note))
+    return header + b''.join(fields), prompt, note
+
+
+def write_snapshot(path, state, source_stat, journal_seq):
+    # state['prompts'] maps IDs to PromptRecords. source_stat identifies the JSON snapshot this
+    # file mirrors; journal_seq is the last journal record already contained in it.
+    prompt_ids = list(state['prompts'])
+    meta = json.dumps({'next_id': state['next_id'], 'categories': state['categories'],
+                       'global_tags': state['global_tags']}, ensure_ascii=False).encode('utf-8')
+    meta_offset = HEADER.size + RECORD_REF.size * len(prompt_ids)
+
+    records = []
+    texts = []
+    for prompt_id in prompt_ids:
+        record, prompt, note = _encode_record(state['prompts'][prompt_id])
+        records.append(record)
+        texts.append((prompt, note))
+
+    refs = []
+    bodies = []
+    body_offsets = {} # Content of each body already written -> its offset
+    record_offset = meta_offset + len(meta)
+    bodies_offset = body_offset = record_offset + sum(len(record) for record in records)
+
+    def add_body(body):
+        nonlocal body_offset
+        offset = body_offsets.get(body)
+        if offset is None:
+            offset = body_offsets[body] = body_offset
+            bodies.append(body)
+            body_offset += len(body)
+        return offset
+
+    for prompt_id, record, (prompt, note) in zip(prompt_ids, records, texts):
+        refs.append(RECORD_REF.pack(prompt_id, record_offset, add_body(prompt), add_body(note)))
+        record_offset += len(record)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(prompt_ids), source_stat.st_mtime_ns,
+                            source_stat.st_size, journal_seq, meta_offset, len(meta), bodies_offset))
+        f.write(b''.join(refs))
+        f.write(meta)
+        f.write(b''.join(records))
+        f.write(b''.join(bodies))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_stamp(path):
+    # (source mtime, source size, journal seq) of a snapshot file, or None if missing or unreadable
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, count, mtime_ns, size, journal_seq, *offsets = HEADER.unpack(header)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return mtime_ns, size, journal_seq
+
+
+class BinarySnapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.count, self.source_mtime_ns, self.source_size, self.journal_seq,
+         self._meta_offset, self._meta_length, self._bodies_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a PromptVault binary snapshot.")
+
+    def meta(self):
+        return json.loads(self._map[self._meta_offset:self._meta_offset + self._meta_length].decode('utf-8'))
+
+    def prompts(self):
+        # (prompt_id, PromptRecord) for every record; prompt bodies and notes are only read when used
+        records_offset = self._meta_offset + self._meta_length
+        records = self._map[records_offset:self._bodies_offset]
+        texts = {} # Body offset -> SnapshotText, shared by the prompts with the same body
+        for prompt_id, offset, prompt_offset, note_offset in RECORD_REF.iter_unpack(self._map[HEADER.size:self._meta_offset]):
+            flags, rev, title_length, category_length, tags_length, extra_length, prompt_length, note_length = \
+                RECORD_HEADER.unpack_from(records, offset - records_offset)
+            position = offset - records_offset + RECORD_HEADER.size
+            title = records[position:position + title_length].decode('utf-8')
+            position += title_length
+            category = records[position:position + category_length].decode('utf-8')
+            position += category_length
+            tags = records[position:position + tags_length].decode('utf-8')
+            position += tags_length
+            if flags & FLAG_JSON_TAGS:
+                tags = json.loads(tags)
+            else:
+                tags = tags.split(TAG_SEPARATOR) if tags else ()
+            extra = json.loads(records[position:position + extra_length].decode('utf-8')) if extra_length else None
+            yield prompt_id, PromptRecord(
+                prompt_id,
+                rev,
+                title=title,
+                prompt=self._text(texts, prompt_offset, prompt_length),
+                note=self._text(texts, note_offset, note_length),
+                category=category,
+                tags=tags,
+                favorite=bool(flags & FLAG_FAVORITE),
+                extra=extra)
+
+    def _text(self, texts, offset, length):
+        if not length:
+            return ''
+        text = texts.get(offset)
+        if text is None:
+            text = texts[offset] = SnapshotText(self, offset, offset + length)
+        return text
+
+    def read_text(self, start, end):
+        return self._map[start:end].decode('utf-8')
+
+
+# Text of a prompt or note left in the mapped file until it is needed (see PromptVersion.prompt).
+# Once read, the string is kept for the other prompts sharing this text.
+class SnapshotText:
+    __slots__ = ('snapshot', 'start', 'end', 'text')
+
+    def __init__(self, snapshot, start, end):
+        self.snapshot = snapshot
+        self.start = start
+        self.end = end
+        self.text = None
+
+    def read(self):
+        if self.text is None:
+            self.text = self.snapshot.read_text(self.start, self.end)
+        return self.text
@@ -0,0 +1,41 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QLabel, QDialogButtonBox,
+                             QListWidget, QListWidgetItem)
+from PyQt6.QtCore import Qt
+
+class DuplicatesDialog(QDialog):
+    def __init__(self, parent=None, clusters=None, prompts=None):
+        super().__init__(parent)
+        self.clusters = clusters or [] # Lists of near-duplicate prompt IDs, largest first
+        self.prompts = prompts or {}
+        self.initUI()
+
+    def initUI(self):
+        self.setWindowTitle('Near-Duplicate Prompts')
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel(f"{len(self.clusters)} group(s) of near-duplicate prompts. "
+                                "Show a group to review its prompts."))
+
+        self.clusterList = QListWidget()
+        for cluster in self.clusters:
+            record = self.prompts.get(cluster[0])
+            title = record.title if record is not None and record.title else 'Untitled'
+            item = QListWidgetItem(f"{len(cluster)} × {title}")
+            item.setData(Qt.ItemDataRole.UserRole, cluster)
+            self.clusterList.addItem(item)
+        if self.clusters:
+            self.clusterList.setCurrentRow(0)
+        self.clusterList.itemDoubleClicked.connect(self.accept)
+        layout.addWidget(self.clusterList)
+
+        buttonBox = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        showButton = buttonBox.addButton('Show', QDialogButtonBox.ButtonRole.AcceptRole)
+        showButton.setEnabled(bool(self.clusters))
+        buttonBox.accepted.connect(self.accept)
+        buttonBox.rejected.connect(self.reject)
+        layout.addWidget(buttonBox)
+
+    def getSelectedCluster(self):
+        # The prompt IDs of the selected group, or None
+        item = self.clusterList.currentItem()
+        return item.data(Qt.ItemDataRole.UserRole) if item is not None else None
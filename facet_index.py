@@ -0,0 +1,147 @@
+# Bitsets of prompt IDs are Python ints: bit n is set when prompt n has the facet. Combining filters
+# is then a bitwise AND and counting a facet is int.bit_count(), both done in C on 64-bit words.
+
+# Bit positions set in each byte value, to list the IDs of a bitset
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def bitset_ids(bits):
+    # IDs set in bits, in increasing order
+    ids = []
+    for position, value in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+        if value:
+            offset = position * 8
+            ids.extend([offset + bit for bit in _BYTE_BITS[value]])
+    return ids
+
+
+def ids_bitset(prompt_ids):
+    # Bitset of prompt_ids, built in a bytearray rather than one int per ID
+    prompt_ids = list(prompt_ids)
+    data = bytearray((max(prompt_ids, default=0) >> 3) + 1)
+    for prompt_id in prompt_ids:
+        data[prompt_id >> 3] |= 1 << (prompt_id & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _facet_keys(record):
+    keys = {('all', True), ('category', record.category)}
+    keys.update(('tag', tag) for tag in record.tags)
+    if record.favorite:
+        keys.add(('favorite', True))
+    return keys
+
+
+# Prompt IDs of each category, each tag, of the favorites and of all prompts, kept up to date along with the prompts.
+# A facet without prompts is removed, so the keys of categories and tags are the ones in use.
+# Bitsets are replaced rather than modified, the search thread can read them meanwhile.
+# The number of prompts of each category and tag is counted along (reference counts), so that the
+# side lists get their counts without going over the prompts or the bitsets.
+class FacetIndex:
+    def __init__(self):
+        self.reset({})
+
+    def reset(self, prompts):
+        # prompts: prompt_id -> PromptRecord
+        self.categories = {} # category -> bitset
+        self.tags = {} # tag -> bitset
+        self.category_refs = {} # category -> number of prompts in it
+        self.tag_refs = {} # tag -> number of prompts with it
+        self.favorites = 0
+        self.all = 0
+        self.records = {} # prompt_id -> PromptRecord as indexed, i.e. every current prompt
+        self.add(prompts)
+
+    def add(self, prompts):
+        # Indexes a batch of prompts (e.g. from the loader). Each bitset is built in a bytearray and
+        # merged once, rather than rebuilding the int for every prompt.
+        buffers = {}
+        size = (max(prompts, default=0) >> 3) + 1
+        for prompt_id, record in prompts.items():
+            if prompt_id in self.records:
+                self.update(prompt_id, record)
+                continue
+            self.records[prompt_id] = record
+            for key in _facet_keys(record):
+                buffer = buffers.get(key)
+                if buffer is None:
+                    buffer = buffers[key] = bytearray(size)
+                buffer[prompt_id >> 3] |= 1 << (prompt_id & 7)
+        for key, buffer in buffers.items():
+            bits = self._bits(key) | int.from_bytes(buffer, 'little')
+            self._set_bits(key, bits)
+            refs = self._refs(key)
+            if refs is not None:
+                refs[key[1]] = bits.bit_count()
+
+    def update(self, prompt_id, record):
+        old = self.records.get(prompt_id)
+        self.records[prompt_id] = record
+        old_keys = _facet_keys(old) if old is not None else set()
+        new_keys = _facet_keys(record)
+        bit = 1 << prompt_id
+        for key in old_keys - new_keys:
+            self._set_bits(key, self._bits(key) & ~bit)
+            self._count(key, -1)
+        for key in new_keys - old_keys:
+            self._set_bits(key, self._bits(key) | bit)
+            self._count(key, 1)
+
+    def remove(self, prompt_id):
+        old = self.records.pop(prompt_id, None)
+        if old is not None:
+            bit = 1 << prompt_id
+            for key in _facet_keys(old):
+                self._set_bits(key, self._bits(key) & ~bit)
+                self._count(key, -1)
+
+    def _refs(self, key):
+        kind = key[0]
+        if kind == 'category':
+            return self.category_refs
+        if kind == 'tag':
+            return self.tag_refs
+        return None
+
+    def _count(self, key, change):
+        # Names no prompt uses any more are dropped, like their bitsets
+        refs = self._refs(key)
+        if refs is not None:
+            count = refs.get(key[1], 0) + change
+            if count:
+                refs[key[1]] = count
+            else:
+                del refs[key[1]]
+
+    def _bits(self, key):
+        kind, name = key
+        if kind == 'category':
+            return self.categories.get(name, 0)
+        if kind == 'tag':
+            return self.tags.get(name, 0)
+        if kind == 'all':
+            return self.all
+        return self.favorites
+
+    def _set_bits(self, key, bits):
+        kind, name = key
+        if kind == 'favorite':
+            self.favorites = bits
+            return
+        if kind == 'all':
+            self.all = bits
+            return
+        facets = self.categories if kind == 'category' else self.tags
+        if bits:
+            facets[name] = bits
+        else:
+            facets.pop(name, None)
+
+    def category_counts(self):
+        return dict(self.category_refs)
+
+    def tag_counts(self):
+        return dict(self.tag_refs)
+
+    def favorite_count(self):
+        return self.favorites.bit_count()
@@ -0,0 +1,226 @@
+import difflib
+import json
+from collections.abc import Sequence
+
+from prompt_model import PromptVersion, TextPool
+
+# At most this many versions in a row are stored as deltas before a full copy (keyframe),
+# which bounds the work needed to rebuild any single version
+KEYFRAME_INTERVAL = 16
+
+# Keys of a delta entry; a history entry without any of them is a full copy of a version (keyframe)
+DELTA_KEY = '_delta' # field -> line hunks against the same field of the previous version
+SET_KEY = '_set' # field -> new value, for fields stored in full
+UNSET_KEY = '_unset' # fields that no longer exist
+# Index of the entry a delta applies to. Needed when instances sharing a vault append to the same
+# history concurrently, the entry before a delta is then not always its base.
+BASE_KEY = '_base'
+
+# Key of a keyframe listing the fields it does not store itself: field -> index of an earlier
+# keyframe holding the same text (e.g. a body left unchanged by metadata-only edits)
+REF_KEY = '_ref'
+# Texts shorter than this are stored again rather than referred to
+REF_MIN_LENGTH = 64
+
+
+def _size(value):
+    return len(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def entries_size(entries):
+    # Bytes taken by history entries once written as JSON lines
+    return sum(_size(entry) + 1 for entry in entries)
+
+
+def diff_lines(old_text, new_text):
+    # Hunks [start, end, new_lines] replacing old lines[start:end], in increasing order
+    old_lines = old_text.splitlines(keepends=True)
+    new_lines = new_text.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [[i1, i2, new_lines[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def patch_lines(old_text, hunks):
+    old_lines = old_text.splitlines(keepends=True)
+    result = []
+    position = 0
+    for start, end, new_lines in hunks:
+        result.extend(old_lines[position:start])
+        result.extend(new_lines)
+        position = end
+    result.extend(old_lines[position:])
+    return ''.join(result)
+
+
+def is_delta(entry):
+    return DELTA_KEY in entry or SET_KEY in entry or UNSET_KEY in entry
+
+
+def encode_keyframe(version, literals=None):
+    # literals: (field, text) -> index of the keyframe storing that text, see EncodedHistory
+    if not literals:
+        return dict(version)
+    entry = {}
+    refs = {}
+    for key, value in version.items():
+        index = literals.get((key, value)) if isinstance(value, str) else None
+        if index is None:
+            entry[key] = value
+        else:
+            refs[key] = index
+    if refs:
+        entry[REF_KEY] = refs
+    return entry
+
+
+def encode_version(version, base, chain_length, literals=None):
+    # Encodes version against base (the previous version, or None). chain_length is the number of
+    # deltas since the last keyframe.
+    keyframe = encode_keyframe(version, literals)
+    if base is None or chain_length >= KEYFRAME_INTERVAL - 1:
+        return keyframe
+
+    deltas = {}
+    changed = {}
+    for key, value in version.items():
+        if key in base and base[key] == value:
+            continue
+        old_value = base.get(key)
+        if isinstance(value, str) and isinstance(old_value, str):
+            hunks = diff_lines(old_value, value)
+            if _size(hunks) < _size(value):
+                deltas[key] = hunks
+                continue
+        changed[key] = value
+    removed = [key for key in base if key not in version]
+
+    entry = {}
+    if deltas:
+        entry[DELTA_KEY] = deltas
+    if changed:
+        entry[SET_KEY] = changed
+    if removed:
+        entry[UNSET_KEY] = removed
+    if not entry:
+        # Identical to the previous version; an empty delta still has to be told apart from a keyframe
+        entry[SET_KEY] = {}
+    if _size(entry) >= _size(keyframe):
+        return keyframe
+    return entry
+
+
+def apply_delta(base, entry):
+    version = dict(base)
+    for key in entry.get(UNSET_KEY, []):
+        version.pop(key, None)
+    for key, hunks in entry.get(DELTA_KEY, {}).items():
+        version[key] = patch_lines(base.get(key, ''), hunks)
+    version.update(entry.get(SET_KEY, {}))
+    return version
+
+
+def encode_history(versions):
+    history = EncodedHistory()
+    for version in versions:
+        history.append(version)
+    return history.entries
+
+
+# Past versions of a prompt, oldest first, stored as keyframes and line-level deltas.
+# Versions are only rebuilt when accessed, starting from the closest keyframe.
+# Texts go through a TextPool, so versions sharing a body share one string in memory, and a
+# keyframe refers to an earlier keyframe for a text already stored there.
+class EncodedHistory(Sequence):
+    def __init__(self, entries=None, pool=None):
+        self.pool = pool if pool is not None else TextPool()
+        self.entries = []
+        self._literals = {} # (field, text) -> index of the keyframe storing it
+        for entry in entries or []:
+            self._add_entry(entry)
+
+    def _add_entry(self, entry):
+        if not is_delta(entry):
+            entry = self.pool.intern_fields(entry)
+            for key, value in entry.items():
+                if isinstance(value, str) and len(value) >= REF_MIN_LENGTH:
+                    self._literals.setdefault((key, value), len(self.entries))
+        self.entries.append(entry)
+        return entry
+
+    def _keyframe(self, entry):
+        version = dict(entry)
+        refs = version.pop(REF_KEY, None)
+        if isinstance(refs, dict):
+            for key, index in refs.items():
+                try:
+                    version[key] = self.entries[index][key]
+                except (IndexError, KeyError, TypeError):
+                    pass # Only possible in a damaged file: the field is left out
+        return version
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.entries)
+        if not 0 <= index < len(self.entries):
+            raise IndexError("history index out of range")
+
+        chain = []
+        start = index
+        while start > 0 and is_delta(self.entries[start]):
+            chain.append(start)
+            start = self._base_index(start)
+        entry = self.entries[start]
+        # A delta without any keyframe before it can only come from a damaged file
+        version = apply_delta({}, entry) if is_delta(entry) else self._keyframe(entry)
+        for position in reversed(chain):
+            version = apply_delta(version, self.entries[position])
+        if 'favorite' not in version:
+            version['favorite'] = False
+        return self.pool.intern_fields(version)
+
+    def _base_index(self, index):
+        base = self.entries[index].get(BASE_KEY)
+        if isinstance(base, int) and 0 <= base < index:
+            return base
+        return index - 1
+
+    def chain_length(self):
+        count = 0
+        for entry in reversed(self.entries):
+            if not is_delta(entry):
+                break
+            count += 1
+        return count
+
+    def append(self, version):
+        # Returns the stored entry, which is what has to be written to storage
+        version = self.pool.intern_fields(version)
+        base = self[-1] if self.entries else None
+        entry = encode_version(version, base, self.chain_length(), self._literals)
+        if is_delta(entry):
+            entry[BASE_KEY] = len(self.entries) - 1
+        return self._add_entry(entry)
+
+
+# What the editor shows: the past versions followed by the current one, as PromptVersions
+class HistoryVersions(Sequence):
+    def __init__(self, past_versions, current):
+        self.past_versions = past_versions
+        self.current = current
+
+    def __len__(self):
+        return len(self.past_versions) + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index == len(self.past_versions):
+            return self.current
+        return PromptVersion.from_dict(self.past_versions[index])
@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import sys
+from collections import OrderedDict
+
+from history_codec import EncodedHistory, HistoryVersions, encode_history, entries_size
+from prompt_model import PromptVersion, TextPool
+
+# Number of prompt histories kept in memory once read from storage
+HISTORY_CACHE_SIZE = 64
+
+
+# Reads the past versions of a prompt from storage only when they are needed (i.e. when the
+# prompt is opened in the editor) and keeps the most recently used ones in a bounded LRU cache.
+# The current version of a prompt is its data, it is never stored in the history itself.
+# A history changed here is also kept until the writer has stored the change, so that it is never
+# read back from a file the change has not reached yet.
+class HistoryStore:
+    def __init__(self, storage, writer, capacity=HISTORY_CACHE_SIZE):
+        self.storage = storage
+        self.writer = writer
+        self.capacity = capacity
+        self._cache = OrderedDict() # prompt_id -> EncodedHistory of its past versions
+        # prompt_id -> (EncodedHistory, writer.submitted when it was changed) of the histories whose
+        # changes may still be queued in the writer
+        self._unsynced = {}
+
+    def past_versions(self, prompt_id, current=None):
+        # current: the current version of the prompt, whose texts the past versions then share
+        if prompt_id in self._cache:
+            self._cache.move_to_end(prompt_id)
+            return self._cache[prompt_id]
+
+        self._release_written()
+        unsynced = self._unsynced.get(prompt_id)
+        if unsynced is not None:
+            # Dropped from the cache, or forgotten, before the writer stored it: served from memory
+            # until the history file is up to date
+            return unsynced[0]
+
+        pool = TextPool()
+        if current is not None:
+            pool.intern(current.prompt)
+            pool.intern(current.note)
+        history = EncodedHistory(self.storage.read_history(prompt_id), pool)
+        self._cache_history(prompt_id, history)
+        return history
+
+    def _cache_history(self, prompt_id, history):
+        self._cache[prompt_id] = history
+        self._cache.move_to_end(prompt_id)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def _changed(self, prompt_id, history):
+        # history will be written by the next item the writer is given
+        self._release_written()
+        self._unsynced[prompt_id] = (history, self.writer.submitted)
+
+    def _release_written(self):
+        written = self.writer.written
+        for prompt_id, (history, submitted) in list(self._unsynced.items()):
+            if written > submitted:
+                del self._unsynced[prompt_id]
+
+    def versions(self, prompt_id, current_data):
+        # Full history as shown in the editor: past versions followed by the current one
+        return HistoryVersions(self.past_versions(prompt_id, current_data), current_data)
+
+    def archive(self, prompt_id, version):
+        # version (a PromptVersion) was the current one of the prompt and has just been superseded.
+        # Returns the encoded history entry to write to storage, or None when version already is the
+        # latest past version (e.g. archived by both instances that edited the prompt at the same time).
+        history = self.past_versions(prompt_id)
+        if history and PromptVersion.from_dict(history[-1]) == version.version():
+            return None
+        entry = history.append(version.to_dict())
+        self._changed(prompt_id, history)
+        return entry
+
+    def forget(self, prompt_id):
+        # The history was changed in storage by another instance, it is read again when needed
+        # (once our own changes to it are written)
+        self._cache.pop(prompt_id, None)
+
+    def discard(self, prompt_id):
+        # The prompt was deleted, or its history purged
+        history = EncodedHistory()
+        self._cache_history(prompt_id, history)
+        self._changed(prompt_id, history)
+
+
+def compress_histories(storage, prompt_ids):
+    # Re-encodes every stored history as keyframes and deltas (full copies written by older
+    # versions included). Returns (prompts, versions, bytes before, bytes after).
+    prompt_count = version_count = size_before = size_after = 0
+    for prompt_id in prompt_ids:
+        entries = storage.read_history(prompt_id)
+        if not entries:
+            continue
+        versions = list(EncodedHistory(entries))
+        encoded = encode_history(versions)
+        prompt_count += 1
+        version_count += len(versions)
+        size_before += entries_size(entries)
+        size_after += entries_size(encoded)
+        if encoded != entries:
+            storage.write_history(prompt_id, encoded)
+    return prompt_count, version_count, size_before, size_after
+
+
+if __name__ == '__main__':
+    # One-shot history compression: python history_store.py [prompts_data.json | prompts_data.db]
+    from prompt_storage import JsonPromptStorage
+    from sqlite_storage import SQLitePromptStorage
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, "prompts_data.json")
+    if data_file.endswith('.db'):
+        storage = SQLitePromptStorage(data_file)
+    else:
+        storage = JsonPromptStorage(data_file)
+    try:
+        state = storage.load()
+        if getattr(storage, 'snapshot_outdated', False):
+            storage.compact(state)
+        prompts, versions, before, after = compress_histories(storage, list(state['prompts']))
+    except (IOError, json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"History compression failed: {e}")
+        sys.exit(1)
+    finally:
+        storage.close()
+    saved = before - after
+    percent = (100.0 * saved / before) if before else 0.0
+    print(f"Compressed {versions} past version(s) of {prompts} prompt(s): "
+          f"{before} -> {after} bytes, {saved} bytes saved ({percent:.1f}%).")
@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 import os
 from PyQt6.QtWidgets import QApplication, QMainWindow, QMenuBar, QMenu, QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QMessageBox, QDialog, QLabel, QPushButton
@@ -147,6 +148,11 @@ class MainWindow(QMainWindow):
         fullscreen_action.triggered.connect(lambda: self.toggle_fullscreen(fullscreen_action))
         view_menu.addAction(fullscreen_action)
     
+    def closeEvent(self, event):
+        # Make sure every pending change reaches the disk before quitting
+        self.prompt_manager.flush_saves()
+        super().closeEvent(event)
+
     def toggle_fullscreen(self, action):
         if self.isFullScreen():
             self.showNormal()
@@ -164,6 +170,8 @@ class MainWindow(QMainWindow):
         QDesktopServices.openUrl(url)
 
 if __name__ == '__main__':
+    # Regular expression searches run in a child process started from this executable when frozen
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     main_window = MainWindow()
     # Show the main window maximized
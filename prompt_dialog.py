@@ -4,6 +4,8 @@ from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLineEdit,
                              QTextEdit, QComboBox, QToolTip, QCheckBox, QSizePolicy)
 from PyQt6.QtCore import Qt, pyqtSignal # Added pyqtSignal
 
+from prompt_model import PromptVersion
+
 class PromptDialog(QDialog):
     # Define custom signals for panel mode
     accepted = pyqtSignal()
@@ -62,7 +64,7 @@ class PromptDialog(QDialog):
         if self.history_data and len(self.history_data) > 1:
             history_layout = QHBoxLayout()
             self.historyCombo = QComboBox()
-            for i, version_data in enumerate(reversed(self.history_data)):
+            for i in range(len(self.history_data)):
                 version_label = f"Version {len(self.history_data) - i}"
                 if i == 0:
                     version_label += " (Current)"
@@ -83,12 +85,12 @@ class PromptDialog(QDialog):
         self.titleEdit = QLineEdit()
         self.titleEdit.setPlaceholderText("Add prompt title here")
         if data:
-            self.titleEdit.setText(data.get('title', ''))
+            self.titleEdit.setText(data.title)
         layout.addWidget(self.titleEdit)
 
         self.favoriteCheckbox = QCheckBox("Mark as favorite")
         if data:
-            self.favoriteCheckbox.setChecked(data.get('favorite', False))
+            self.favoriteCheckbox.setChecked(data.favorite)
         layout.addWidget(self.favoriteCheckbox)
 
         layout.addWidget(QLabel('Category:'))
@@ -101,7 +103,7 @@ class PromptDialog(QDialog):
         self.categoryCombo.addItems(display_categories)
         default_category = 'No category'
         if data:
-            default_category = data.get('category', 'No category')
+            default_category = data.category
         self.categoryCombo.setCurrentText(default_category)
         layout.addWidget(self.categoryCombo)
 
@@ -109,21 +111,21 @@ class PromptDialog(QDialog):
         layout.addWidget(QLabel('Tags (comma separated):'))
         self.tagsEdit = QLineEdit()
         if data:
-            self.tagsEdit.setText(", ".join(data.get('tags', [])))
+            self.tagsEdit.setText(", ".join(data.tags))
         layout.addWidget(self.tagsEdit)
 
         layout.addWidget(QLabel('Prompt:'))
         self.promptEdit = QTextEdit()
         self.promptEdit.setPlaceholderText("Add prompt here")
         if data:
-            self.promptEdit.setPlainText(data.get('prompt', ''))
+            self.promptEdit.setPlainText(data.prompt)
         layout.addWidget(self.promptEdit)
 
         layout.addWidget(QLabel('Note:'))
         self.noteEdit = QTextEdit()
         self.noteEdit.setPlaceholderText("Add additional notes or information here...")
         if data:
-            self.noteEdit.setPlainText(data.get('note', ''))
+            self.noteEdit.setPlainText(data.note)
         layout.addWidget(self.noteEdit)
 
         self.diffOutput = QTextEdit()
@@ -160,30 +162,30 @@ class PromptDialog(QDialog):
             version_data = self.history_data[original_history_index]
             
             # Update fields with selected history version
-            self.titleEdit.setText(version_data.get('title', ''))
-            self.favoriteCheckbox.setChecked(version_data.get('favorite', False))
-            self.categoryCombo.setCurrentText(version_data.get('category', 'No category'))
-            self.tagsEdit.setText(", ".join(version_data.get('tags', [])))
-            self.promptEdit.setPlainText(version_data.get('prompt', ''))
-            self.noteEdit.setPlainText(version_data.get('note', ''))
+            self.titleEdit.setText(version_data.title)
+            self.favoriteCheckbox.setChecked(version_data.favorite)
+            self.categoryCombo.setCurrentText(version_data.category)
+            self.tagsEdit.setText(", ".join(version_data.tags))
+            self.promptEdit.setPlainText(version_data.prompt)
+            self.noteEdit.setPlainText(version_data.note)
             
             print(f"Displaying history version index {original_history_index}")
 
             # Generate and display diff
             if self.current_data:
-                current_title = self.current_data.get('title', '')
-                current_prompt = self.current_data.get('prompt', '')
-                current_note = self.current_data.get('note', '')
-                current_category = self.current_data.get('category', 'No category')
-                current_tags = set(self.current_data.get('tags', []))
-                current_favorite = self.current_data.get('favorite', False)
-
-                history_title = version_data.get('title', '')
-                history_prompt = version_data.get('prompt', '')
-                history_note = version_data.get('note', '')
-                history_category = version_data.get('category', 'No category')
-                history_tags = set(version_data.get('tags', []))
-                history_favorite = version_data.get('favorite', False)
+                current_title = self.current_data.title
+                current_prompt = self.current_data.prompt
+                current_note = self.current_data.note
+                current_category = self.current_data.category
+                current_tags = set(self.current_data.tags)
+                current_favorite = self.current_data.favorite
+
+                history_title = version_data.title
+                history_prompt = version_data.prompt
+                history_note = version_data.note
+                history_category = version_data.category
+                history_tags = set(version_data.tags)
+                history_favorite = version_data.favorite
 
                 full_diff_html = []
 
@@ -269,14 +271,15 @@ class PromptDialog(QDialog):
     def getPromptData(self):
         tags_text = self.tagsEdit.text()
         tags = [tag_text.strip() for tag_text in tags_text.split(',') if tag_text.strip()]
-        return {
-            'title': self.titleEdit.text(),
-            'favorite': self.favoriteCheckbox.isChecked(),
-            'category': self.categoryCombo.currentText(),
-            'tags': tags,
-            'prompt': self.promptEdit.toPlainText(),
-            'note': self.noteEdit.toPlainText()
-        }
+        return PromptVersion(
+            title=self.titleEdit.text(),
+            favorite=self.favoriteCheckbox.isChecked(),
+            category=self.categoryCombo.currentText(),
+            tags=tags,
+            prompt=self.promptEdit.toPlainText(),
+            note=self.noteEdit.toPlainText(),
+            extra=self.current_data.extra if self.current_data else None # Keys this dialog does not edit
+        )
 
     def _save_clicked(self):
         title = self.titleEdit.text().strip()
@@ -0,0 +1,133 @@
+import contextlib
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+# Changed fields reported for a prompt that was removed and added again during a batch
+ALL_FIELDS = frozenset(('title', 'prompt', 'note', 'category', 'tags', 'favorite', 'extra'))
+
+
+# What changed in the prompt store during one batch of mutations, coalesced: a prompt added then
+# edited is only added, one edited several times is updated once with all the fields that changed
+class PromptChanges:
+    def __init__(self):
+        self.added = set() # IDs of the prompts added
+        self.updated = {} # prompt_id -> names of its changed fields (see PromptVersion.changed_fields)
+        self.removed = set() # IDs of the prompts removed
+        self.renamed_tags = {} # old name -> new name
+        self.removed_tags = set()
+        self.removed_categories = set()
+        self.categories_changed = False # Managed categories were added or removed
+        self.tags_changed = False # Managed tags were added, renamed or removed
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.removed or self.categories_changed or self.tags_changed)
+
+    def add(self, prompt_id):
+        if prompt_id in self.removed:
+            self.removed.discard(prompt_id)
+            self.updated[prompt_id] = ALL_FIELDS
+        else:
+            self.added.add(prompt_id)
+
+    def update(self, prompt_id, fields):
+        if prompt_id not in self.added:
+            self.updated[prompt_id] = self.updated.get(prompt_id, frozenset()) | fields
+
+    def remove(self, prompt_id):
+        self.added.discard(prompt_id)
+        self.updated.pop(prompt_id, None)
+        self.removed.add(prompt_id)
+
+    def prompt_ids(self):
+        # IDs of the prompts added, updated or removed
+        return self.added | self.updated.keys() | self.removed
+
+    def touches_categories(self):
+        # Whether the category list (names and counts) may differ
+        return (self.categories_changed or bool(self.added or self.removed)
+                or any('category' in fields for fields in self.updated.values()))
+
+    def touches_tags(self):
+        return (self.tags_changed or bool(self.added or self.removed)
+                or any('tags' in fields for fields in self.updated.values()))
+
+
+# Change events of the prompt store (self.prompts and the managed categories and tags of the
+# PromptManager). Every mutation is reported twice:
+# - right away, by promptAdded, promptUpdated and promptRemoved, to the indexes that must stay in
+#   sync with self.prompts while a batch runs;
+# - once the mutation, or the outermost batch() it is part of, is over, by a single changed signal
+#   with the PromptChanges of all of them, to the views and the persistence layer.
+# batchStarted and batchFinished enclose the outermost batch(), for the indexes that apply the changes
+# of a batch all at once at its end.
+# GUI thread only.
+class PromptEvents(QObject):
+    promptAdded = pyqtSignal(int, object) # prompt_id, PromptRecord
+    promptUpdated = pyqtSignal(int, object, object) # prompt_id, PromptRecord, frozenset of changed field names
+    promptRemoved = pyqtSignal(int) # prompt_id
+    changed = pyqtSignal(object) # PromptChanges
+    batchStarted = pyqtSignal()
+    batchFinished = pyqtSignal() # Emitted before changed
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._depth = 0 # Nesting of batch()
+        self._changes = PromptChanges()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Mutations made within are notified all at once when the outermost batch ends
+        self._depth += 1
+        if self._depth == 1:
+            self.batchStarted.emit()
+        try:
+            yield self._changes
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                self.batchFinished.emit()
+            self._notify()
+
+    def prompt_added(self, prompt_id, record):
+        self._changes.add(prompt_id)
+        self.promptAdded.emit(prompt_id, record)
+        self._notify()
+
+    def prompt_updated(self, prompt_id, record, fields):
+        self._changes.update(prompt_id, fields)
+        self.promptUpdated.emit(prompt_id, record, fields)
+        self._notify()
+
+    def prompt_removed(self, prompt_id):
+        self._changes.remove(prompt_id)
+        self.promptRemoved.emit(prompt_id)
+        self._notify()
+
+    def tag_renamed(self, old_name, new_name):
+        renamed = self._changes.renamed_tags
+        for name, current in list(renamed.items()):
+            if current == old_name:
+                renamed[name] = new_name
+        renamed.setdefault(old_name, new_name)
+        self.tags_changed()
+
+    def tag_removed(self, name):
+        self._changes.removed_tags.add(name)
+        self.tags_changed()
+
+    def category_removed(self, name):
+        self._changes.removed_categories.add(name)
+        self.categories_changed()
+
+    def categories_changed(self):
+        self._changes.categories_changed = True
+        self._notify()
+
+    def tags_changed(self):
+        self._changes.tags_changed = True
+        self._notify()
+
+    def _notify(self):
+        if self._depth == 0 and self._changes:
+            changes, self._changes = self._changes, PromptChanges()
+            self.changed.emit(changes)
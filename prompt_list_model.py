@@ -0,0 +1,251 @@
+import bisect
+import os
+
+from PyQt6.QtWidgets import QStyle, QStyledItemDelegate, QStyleOptionViewItem, QToolTip
+from PyQt6.QtGui import QColor, QIcon, QPalette
+from PyQt6.QtCore import QAbstractListModel, QEvent, QModelIndex, QRect, QSize, Qt, pyqtSignal
+
+# The PromptRecord shown by a row
+RECORD_ROLE = Qt.ItemDataRole.UserRole + 1
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+
+# Row layout: margins around the contents, space between the star, the title and the copy icon
+ROW_MARGIN_X, ROW_MARGIN_Y, ROW_SPACING = 2, 5, 5
+COPY_ICON_SIZE = 24
+# Beyond this many row insertions, removals and moves, the rows are replaced all at once (a model
+# reset, which loses the selection) rather than one operation at a time
+DIFF_MAX_OPERATIONS = 100
+
+
+def _increasing_subsequence(positions):
+    # Indexes of a longest increasing subsequence of positions (patience sorting)
+    tails = [] # tails[k]: index of the last element of the best subsequence of length k + 1 found
+    tail_positions = []
+    previous = [-1] * len(positions)
+    for i, position in enumerate(positions):
+        k = bisect.bisect_left(tail_positions, position)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_positions.append(position)
+        else:
+            tails[k] = i
+            tail_positions[k] = position
+    indexes = set()
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        indexes.add(i)
+        i = previous[i]
+    return indexes
+
+
+def _runs(rows):
+    # (first, last) of each run of consecutive rows, rows being ascending
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
+
+# The prompts shown in the prompt list, in display order. Rows hold the PromptRecords themselves, so
+# the view only asks for the few rows on screen and nothing is created per prompt.
+class PromptListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._records = []
+        self._rows = None # prompt_id -> row, built when first needed after a reset
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._records)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self._records[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return record.title
+        if role == Qt.ItemDataRole.UserRole:
+            return record.id
+        if role == RECORD_ROLE:
+            return record
+        return None
+
+    def set_records(self, records):
+        # Shows records, in display order, with the fewest row removals, moves, insertions and data
+        # changes from the rows shown, so that the selection and the scroll position stay put and a
+        # change to one prompt touches one row
+        records = list(records)
+        new_rows = {record.id: row for row, record in enumerate(records)}
+        old_records = self._records
+        removed_rows = [row for row, record in enumerate(old_records) if record.id not in new_rows]
+        kept = [record for record in old_records if record.id in new_rows]
+        kept_ids = {record.id for record in kept}
+        inserted_rows = [row for row, record in enumerate(records) if record.id not in kept_ids]
+
+        # The kept prompts in the longest run already in display order stay, the others move
+        positions = [new_rows[record.id] for record in kept]
+        if all(a < b for a, b in zip(positions, positions[1:])):
+            moved = []
+        else:
+            staying = _increasing_subsequence(positions)
+            moved = sorted((position for i, position in enumerate(positions) if i not in staying))
+
+        removed_runs = _runs(removed_rows)
+        inserted_runs = _runs(inserted_rows)
+        if not old_records or len(removed_runs) + len(moved) + len(inserted_runs) > DIFF_MAX_OPERATIONS:
+            self.beginResetModel()
+            self._records = records
+            self._rows = new_rows
+            self.endResetModel()
+            return
+
+        for first, last in reversed(removed_runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._records[first:last + 1]
+            self.endRemoveRows()
+
+        # Each moved prompt goes right after the one before it in display order, in display order
+        if moved:
+            kept_order = sorted(kept, key=lambda record: new_rows[record.id])
+            order = {record.id: i for i, record in enumerate(kept_order)}
+            for position in moved:
+                record = records[position]
+                current_ids = [kept_record.id for kept_record in self._records]
+                row = current_ids.index(record.id)
+                i = order[record.id]
+                destination = current_ids.index(kept_order[i - 1].id) + 1 if i else 0
+                if destination in (row, row + 1):
+                    continue
+                self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+                del self._records[row]
+                self._records.insert(destination - 1 if destination > row else destination, record)
+                self.endMoveRows()
+
+        for first, last in inserted_runs:
+            self.beginInsertRows(QModelIndex(), first, last)
+            self._records[first:first] = records[first:last + 1]
+            self.endInsertRows()
+
+        # New versions of the prompts shown
+        changed_rows = [row for row, record in enumerate(records) if self._records[row] is not record]
+        self._records = records
+        self._rows = new_rows
+        for first, last in _runs(changed_rows):
+            self.dataChanged.emit(self.index(first), self.index(last))
+
+    def record(self, row):
+        return self._records[row]
+
+    def prompt_id(self, row):
+        return self._records[row].id
+
+    def row_of(self, prompt_id):
+        # Row of the prompt, or None when it is not shown
+        if self._rows is None:
+            self._rows = {record.id: row for row, record in enumerate(self._records)}
+        return self._rows.get(prompt_id)
+
+    def update_record(self, row, record):
+        # A new version of the prompt shown at row, staying at that row
+        self._records[row] = record
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+
+# Paints a prompt row: a star for favorites, the title and a copy icon. A click on the icon is
+# hit-tested here and reported through copyRequested instead of selecting the row. The view still
+# reports double-clicks on the icon, pressed_on_icon tells them apart.
+class PromptItemDelegate(QStyledItemDelegate):
+    copyRequested = pyqtSignal(int, QRect) # prompt_id, icon rectangle in viewport coordinates
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self._icons = {} # file name -> QIcon
+        self._hovered_row = -1 # Row whose copy icon is under the mouse
+        self.pressed_on_icon = False # Whether the last mouse press on a row was on its copy icon
+        view.setMouseTracking(True)
+        view.viewport().installEventFilter(self)
+
+    def _copy_icon(self, option):
+        # The themes have a light and a dark copy icon; the one matching the text color is used
+        dark = option.palette.color(QPalette.ColorRole.Text).lightness() > 128
+        name = "copy_dark.png" if dark else "copy_light.png"
+        icon = self._icons.get(name)
+        if icon is None:
+            icon = self._icons[name] = QIcon(os.path.join(IMAGES_DIR, name))
+        return icon
+
+    def copy_icon_rect(self, rect):
+        return QRect(rect.right() - ROW_MARGIN_X - COPY_ICON_SIZE + 1,
+                     rect.top() + (rect.height() - COPY_ICON_SIZE) // 2, COPY_ICON_SIZE, COPY_ICON_SIZE)
+
+    def sizeHint(self, option, index):
+        height = max(COPY_ICON_SIZE, option.fontMetrics.height()) + 2 * ROW_MARGIN_Y
+        width = option.fontMetrics.horizontalAdvance("⭐ " + (index.data() or "")) + COPY_ICON_SIZE + ROW_SPACING + 2 * ROW_MARGIN_X
+        return QSize(width, height)
+
+    def paint(self, painter, option, index):
+        record = index.data(RECORD_ROLE)
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        widget = opt.widget
+        style = widget.style() if widget is not None else None
+        if style is None:
+            return super().paint(painter, option, index)
+
+        # Background, selection and hover over the whole row
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_PanelItemViewItem, opt, painter, widget)
+
+        icon_rect = self.copy_icon_rect(opt.rect)
+        text_opt = QStyleOptionViewItem(opt)
+        text_opt.text = ("⭐ " if record.favorite else "") + record.title
+        text_opt.rect = QRect(opt.rect.left() + ROW_MARGIN_X, opt.rect.top(),
+                              icon_rect.left() - ROW_SPACING - opt.rect.left() - ROW_MARGIN_X, opt.rect.height())
+        text_opt.state &= ~QStyle.StateFlag.State_HasFocus
+        style.drawControl(QStyle.ControlElement.CE_ItemViewItem, text_opt, painter, widget)
+
+        if index.row() == self._hovered_row:
+            painter.fillRect(icon_rect, QColor(128, 128, 128, 50))
+        self._copy_icon(opt).paint(painter, icon_rect)
+
+    def editorEvent(self, event, model, option, index):
+        # Presses, releases and double-clicks on the copy icon do not reach the view
+        if event.type() in (QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease,
+                            QEvent.Type.MouseButtonDblClick):
+            icon_rect = self.copy_icon_rect(option.rect)
+            on_icon = icon_rect.contains(event.position().toPoint())
+            if event.type() != QEvent.Type.MouseButtonRelease:
+                self.pressed_on_icon = on_icon
+            if on_icon:
+                if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+                    self.copyRequested.emit(index.data(Qt.ItemDataRole.UserRole), icon_rect)
+                return True
+        return super().editorEvent(event, model, option, index)
+
+    def helpEvent(self, event, view, option, index):
+        if event.type() == QEvent.Type.ToolTip and self.copy_icon_rect(option.rect).contains(event.pos()):
+            QToolTip.showText(event.globalPos(), f"Copy prompt '{index.data()}'", view)
+            return True
+        return super().helpEvent(event, view, option, index)
+
+    def eventFilter(self, watched, event):
+        # Repaints the copy icons the mouse enters and leaves
+        if event.type() in (QEvent.Type.MouseMove, QEvent.Type.Leave):
+            row = -1
+            if event.type() == QEvent.Type.MouseMove:
+                position = event.position().toPoint()
+                index = self.view.indexAt(position)
+                if index.isValid() and self.copy_icon_rect(self.view.visualRect(index)).contains(position):
+                    row = index.row()
+            if row != self._hovered_row:
+                for changed in (self._hovered_row, row):
+                    if changed >= 0:
+                        self.view.viewport().update(self.view.visualRect(self.view.model().index(changed, 0)))
+                self._hovered_row = row
+        return super().eventFilter(watched, event)
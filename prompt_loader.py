@@ -0,0 +1,36 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+# Loads the vault on a worker thread. Prompts are passed to the GUI in batches as they are read,
+# the complete state (with the journal replayed) follows once everything has been read.
+class PromptLoader(QThread):
+    promptsLoaded = pyqtSignal(object, int) # {prompt_id: entry}, percentage of the vault read
+    loadFinished = pyqtSignal(object) # Complete state, see JsonPromptStorage.load()
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, storage, parent=None):
+        super().__init__(parent)
+        self.storage = storage
+
+    def run(self):
+        try:
+            state = self.storage.load(on_batch=self._emit_batch)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            self.loadFailed.emit(str(e))
+            return
+        self.loadFinished.emit(state)
+
+    def _emit_batch(self, prompts, done, total):
+        if self.isInterruptionRequested():
+            raise LoadCancelled()
+        self.promptsLoaded.emit(prompts, int(100 * done / total) if total else 100)
+
+    def cancel(self):
+        self.requestInterruption()
+        self.wait()
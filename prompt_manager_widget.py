@@ -1,43 +1,113 @@
-import json
+import bisect
 import os
+import time
 from collections import defaultdict
 import csv
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLineEdit,
                              QPushButton, QMessageBox, QLabel, QListWidget,
-                             QListWidgetItem, QApplication, QAbstractItemView,
+                             QListWidgetItem, QListView, QApplication, QAbstractItemView,
                              QToolTip, QDialog, QCheckBox, QSizePolicy,
-                             QSpacerItem, QFrame, QMenu, QFileDialog, QStackedWidget) # Added QStackedWidget
+                             QSpacerItem, QFrame, QMenu, QFileDialog, QStackedWidget, # Added QStackedWidget
+                             QProgressBar)
 from PyQt6.QtGui import QIcon, QPixmap, QPainter, QColor, QAction
-from PyQt6.QtCore import Qt, QSize, pyqtSignal # Added pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal # Added pyqtSignal
 
 from prompt_dialog import PromptDialog
 from category_dialog import CategoryDialog
 from tag_dialog import TagDialog
+from duplicates_dialog import DuplicatesDialog
+from prompt_storage import JsonPromptStorage, journal_record_applies, prompt_from_journal_record
+from sqlite_storage import SQLitePromptStorage
+from save_writer import BackgroundWriter, SynchronousWriter
+from history_store import HistoryStore
+from prompt_loader import PromptLoader
+from prompt_events import PromptEvents
+from prompt_model import PromptRecord, PromptVersion
+from prompt_list_model import PromptItemDelegate, PromptListModel
+from search_index import RANKED_RESULTS_LIMIT, PromptFilter, SearchIndex, filter_prompts
+from search_worker import SearchWorker
+from vault_watcher import VaultWatcher
+
+# Minimum time between two refreshes of the lists while prompts are still being loaded (seconds)
+LOAD_REFRESH_INTERVAL = 0.25
+# Time spent building the search index before letting the window handle events again (seconds)
+INDEX_SLICE_TIME = 0.05
+# The search starts once no key has been typed in the search bar for this many milliseconds
+SEARCH_DELAY_MS = 150
 
 class PromptManager(QWidget):
     # Define a signal to request the main window to show/hide the editor panel
     showEditorPanel = pyqtSignal(bool)
+    # Emitted (possibly from the writer thread) when saving to disk failed
+    saveFailed = pyqtSignal(str)
+    # Emitted from the search thread: search number, PromptFilter, matching PromptRecords sorted by title
+    searchFinished = pyqtSignal(int, object, object)
+    # Emitted from the writer thread: records of the other instances sharing the vault, or None and a
+    # fresh load of the vault (see save_writer.BackgroundWriter.read_changes())
+    externalChangesRead = pyqtSignal(object, object)
 
     def __init__(self):
         super().__init__()
 
         script_dir = os.path.dirname(os.path.abspath(__file__))
         self.data_file = os.path.join(script_dir, "prompts_data.json")
+        db_file = os.path.join(script_dir, "prompts_data.db")
+        if os.path.exists(db_file):
+            # The SQLite backend is opt-in: it is used once the vault has been migrated with sqlite_storage.py
+            self.data_file = db_file
+            self.storage = SQLitePromptStorage(db_file)
+        else:
+            self.storage = JsonPromptStorage(self.data_file)
 
         self.prompts = {}
         self.next_id = 0
         self.categories = []
         self.global_tags = set() # New attribute for globally managed tags
-        self.load_prompts()
+        self._pending_records = [] # Journal records not yet written by save_prompts()
+        self._saved_meta = None # Last next_id/categories/global_tags written to storage
+        self.loading = False # True while load_prompts() runs, editing is disabled meanwhile
+        self.watcher = None # Reports changes made to the vault by other instances, once loaded
+
+        if isinstance(self.storage, SQLitePromptStorage):
+            # Row-level updates are cheap and keep the search index in sync with self.prompts
+            self.writer = SynchronousWriter(self.storage)
+        else:
+            self.writer = BackgroundWriter(self.storage, on_error=self.saveFailed.emit)
+        # Folded texts of the prompts and the trigram index narrowing searches down, see update_prompt_list()
+        self.search_index = SearchIndex()
+        self.search_worker = SearchWorker(on_result=self.searchFinished.emit)
+        self.searchFinished.connect(self._show_search_results)
+        self._search_running = False # A search was submitted and its results have not been shown yet
+        self.saveFailed.connect(self._show_save_error)
+        # Queued even from the GUI thread (SynchronousWriter), the merge always runs from the event loop
+        self.externalChangesRead.connect(self._on_external_changes_read, Qt.ConnectionType.QueuedConnection)
+        self.history_store = HistoryStore(self.storage, self.writer)
+        # Every change to the prompts, categories and tags is reported here, see _record_prompt_change():
+        # the index follows each one, the lists and the storage each batch of them
+        self.events = PromptEvents(self)
+        self.events.promptAdded.connect(self.search_index.update)
+        self.events.promptUpdated.connect(lambda prompt_id, record, fields: self.search_index.update(prompt_id, record))
+        self.events.promptRemoved.connect(self.search_index.remove)
+        self.events.batchStarted.connect(self.search_index.begin_batch)
+        self.events.batchFinished.connect(self.search_index.end_batch)
+        self.events.changed.connect(self._on_prompts_changed)
         
         self.editor_dock = None
         self.editor_content_widget = None
         self.current_editor_instance = None # To keep track of the active PromptDialog instance
 
         self.initUI()
+        self.indexTimer = QTimer(self)
+        self.indexTimer.setInterval(0)
+        self.indexTimer.timeout.connect(self._build_search_index)
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(SEARCH_DELAY_MS)
+        self.searchTimer.timeout.connect(self._start_search)
         self.update_category_list()
         self.update_tag_list()
         self.update_prompt_list()
+        self.load_prompts()
 
     def set_editor_panel(self, dock_widget, content_widget):
         self.editor_dock = dock_widget
@@ -62,6 +132,7 @@ class PromptManager(QWidget):
         left_layout.addWidget(self.manageCategoriesButton)
 
         self.categoryList = QListWidget()
+        self.categoryList.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection) # Ctrl+click selects several
         self.categoryList.itemClicked.connect(self.filter_prompts_by_category)
         left_layout.addWidget(self.categoryList)
 
@@ -73,9 +144,15 @@ class PromptManager(QWidget):
         left_layout.addWidget(self.manageTagsButton)
 
         self.tagList = QListWidget()
+        self.tagList.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.tagList.itemClicked.connect(self.filter_prompts_by_tag)
         left_layout.addWidget(self.tagList)
 
+        self.matchAllTagsCheckbox = QCheckBox("Match All Selected Tags")
+        self.matchAllTagsCheckbox.setToolTip("Show the prompts having every selected tag rather than any of them")
+        self.matchAllTagsCheckbox.stateChanged.connect(self.toggle_tag_matching)
+        left_layout.addWidget(self.matchAllTagsCheckbox)
+
         line = QFrame()
         line.setFrameShape(QFrame.Shape.HLine)
         line.setFrameShadow(QFrame.Shadow.Sunken)
@@ -93,6 +170,11 @@ class PromptManager(QWidget):
         self.showAllButton.clicked.connect(self.show_all_prompts)
         left_layout.addWidget(self.showAllButton)
 
+        self.findDuplicatesButton = QPushButton("🔍 Find Duplicates")
+        self.findDuplicatesButton.setToolTip("List the groups of near-duplicate prompts")
+        self.findDuplicatesButton.clicked.connect(self.find_duplicate_prompts)
+        left_layout.addWidget(self.findDuplicatesButton)
+
         left_layout.addSpacerItem(QSpacerItem(20, 40, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding))
 
         main_layout.addLayout(left_layout, 1) # Decrease left column stretch (using integer ratio)
@@ -102,7 +184,11 @@ class PromptManager(QWidget):
         search_layout = QHBoxLayout()
         self.searchBar = QLineEdit()
         self.searchBar.setPlaceholderText("Search in title, prompt, note...")
-        self.searchBar.textChanged.connect(self.filter_prompts_by_search)
+        self.searchBar.setToolTip('Words are searched for in title, prompt and note; "quoted phrases" as a whole.\n'
+                                  'title:, prompt:, note: search one field; category:, tag:, fav:yes|no filter prompts;\n'
+                                  'similar:<id> finds the near-duplicates of a prompt, id:<id>,<id> shows those prompts.\n'
+                                  '-term excludes, a OR b matches either, (...) groups terms.')
+        self.searchBar.textChanged.connect(self.schedule_search)
         search_layout.addWidget(self.searchBar, 1)
 
         self.caseSensitiveCheckbox = QCheckBox("Case Sensitive")
@@ -110,11 +196,41 @@ class PromptManager(QWidget):
         self.caseSensitiveCheckbox.stateChanged.connect(self.filter_prompts_by_search)
         search_layout.addWidget(self.caseSensitiveCheckbox, 0)
 
+        self.regexCheckbox = QCheckBox("Regex")
+        self.regexCheckbox.setToolTip("Search title, prompt and note with a regular expression")
+        self.regexCheckbox.stateChanged.connect(self.filter_prompts_by_search)
+        search_layout.addWidget(self.regexCheckbox, 0)
+
+        self.ignoreAccentsCheckbox = QCheckBox("Ignore Accents")
+        self.ignoreAccentsCheckbox.setToolTip("Match letters with and without accents alike (e.g. 'cafe' finds 'café') in case-insensitive searches")
+        self.ignoreAccentsCheckbox.stateChanged.connect(self.toggle_accent_folding)
+        search_layout.addWidget(self.ignoreAccentsCheckbox, 0)
+
+        self.relevanceCheckbox = QCheckBox("Best Matches First")
+        self.relevanceCheckbox.setToolTip(f"Order the results of a search by relevance rather than by title "
+                                          f"(only the {RANKED_RESULTS_LIMIT} best matches are shown)")
+        self.relevanceCheckbox.stateChanged.connect(self.filter_prompts_by_search)
+        search_layout.addWidget(self.relevanceCheckbox, 0)
+
         right_layout.addLayout(search_layout)
 
-        self.promptList = QListWidget()
+        self.loadProgressBar = QProgressBar()
+        self.loadProgressBar.setRange(0, 100)
+        self.loadProgressBar.setFormat("Loading prompts... %p%")
+        self.loadProgressBar.hide()
+        right_layout.addWidget(self.loadProgressBar)
+
+        # Only the rows on screen are painted, by the delegate; nothing is created per prompt
+        self.promptList = QListView()
+        self.promptModel = PromptListModel(self)
+        self.promptList.setModel(self.promptModel)
+        self.promptDelegate = PromptItemDelegate(self.promptList)
+        self.promptDelegate.copyRequested.connect(self.copy_prompt_text_from_row)
+        self.promptList.setItemDelegate(self.promptDelegate)
+        self.promptList.setUniformItemSizes(True)
+        self.promptList.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         self.promptList.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
-        self.promptList.itemDoubleClicked.connect(self.editPrompt)
+        self.promptList.doubleClicked.connect(self._prompt_double_clicked)
         self.promptList.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.promptList.customContextMenuRequested.connect(self.show_context_menu)
         right_layout.addWidget(self.promptList)
@@ -155,164 +271,216 @@ class PromptManager(QWidget):
             self.editor_dock.setVisible(show)
 
     def update_category_list(self):
-        self.categoryList.clear()
-        categories_in_use = set(p['data'].get('category', 'No category') for p in self.prompts.values())
-        all_display_categories = categories_in_use.union(set(self.categories))
-
-        sorted_display_categories = sorted(list(all_display_categories))
-        self.categoryList.addItems(sorted_display_categories)
-
+        # The categories in use and their number of prompts come from the facet index
+        counts = self.search_index.facets.category_counts()
+        all_display_categories = set(counts).union(set(self.categories))
+        self._update_facet_list(self.categoryList, all_display_categories, counts)
 
     def update_tag_list(self):
-        self.tagList.clear()
-        all_tags_from_prompts = set()
-        for prompt_info in self.prompts.values():
-            all_tags_from_prompts.update(prompt_info['data'].get('tags', []))
-        
+        counts = self.search_index.facets.tag_counts()
         # Combine tags from prompts and globally managed tags
-        all_display_tags = all_tags_from_prompts.union(self.global_tags)
+        all_display_tags = set(counts).union(self.global_tags)
+        self._update_facet_list(self.tagList, all_display_tags, counts)
+
+    def _update_facet_list(self, list_widget, names, counts):
+        # Shows names sorted as "name (count)" in list_widget, only adding, removing or renaming the
+        # items that differ from the ones shown; the other items, and their selection, stay as they are
+        shown = [list_widget.item(row).data(Qt.ItemDataRole.UserRole) for row in range(list_widget.count())]
+        for row in reversed(range(len(shown))):
+            if shown[row] not in names:
+                list_widget.takeItem(row)
+                del shown[row]
+        for name in sorted(names):
+            text = f"{name} ({counts.get(name, 0)})"
+            row = bisect.bisect_left(shown, name)
+            if row < len(shown) and shown[row] == name:
+                item = list_widget.item(row)
+                if item.text() != text:
+                    item.setText(text)
+            else:
+                item = QListWidgetItem(text)
+                item.setData(Qt.ItemDataRole.UserRole, name)
+                list_widget.insertItem(row, item)
+                shown.insert(row, name)
+
+    def update_prompt_list(self, prompt_filter=None):
+        # Shows the prompts matching prompt_filter (the search bar and the selections beside it by
+        # default) right away; a search still to come or running is out of date
+        self.searchTimer.stop()
+        self.search_worker.cancel()
+        self._search_running = False
+
+        if prompt_filter is None:
+            prompt_filter = self.current_filter()
+        if prompt_filter.time_budget is not None:
+            self._start_search(prompt_filter)
+            return
 
-        for tag in sorted(list(all_display_tags)):
-            self.tagList.addItem(tag)
+        def text_candidates(term):
+            candidate_ids = self.search_index.candidates(term)
+            # The storage may still be in use by the loader thread, the partially loaded prompts are scanned instead
+            if candidate_ids is None and prompt_filter.case_sensitive and not self.loading:
+                # The index is still being built. SQLite's full-text index folds case its own way,
+                # it only narrows down case-sensitive searches.
+                candidate_ids = self.storage.search_ids(term, True)
+            return candidate_ids
+
+        self._show_prompts(filter_prompts(self.prompts, prompt_filter, text_candidates))
+
+    def _show_prompts(self, records):
+        self.promptModel.set_records(records)
+
+    def current_filter(self):
+        return PromptFilter(self.search_index, self.searchBar.text(), self.caseSensitiveCheckbox.isChecked(),
+                            self.current_filter_categories(), self.current_filter_tags(),
+                            self.is_favorites_filter_active(), self.relevanceCheckbox.isChecked(),
+                            self.regexCheckbox.isChecked(), self.is_all_tags_filter_active())
+
+    def schedule_search(self, text=None):
+        # Typing in the search bar: the search runs on the search thread once typing pauses
+        self.search_worker.cancel()
+        self.searchTimer.start()
+
+    def _start_search(self, prompt_filter=None):
+        if prompt_filter is None:
+            prompt_filter = self.current_filter()
+        if prompt_filter.error is not None:
+            # Likely still being typed: the list is left as it is
+            self._show_search_error(f"Invalid regular expression: {prompt_filter.error}")
+            return
+        # PromptRecords are never modified, a copy of the dict is a snapshot the search thread can use
+        self.search_worker.submit(prompt_filter, dict(self.prompts))
+        self._search_running = True
 
-    def update_prompt_list(self, filter_category=None, filter_tag=None, search_term="", filter_favorites=False):
-        self.promptList.clear()
+    def _show_search_results(self, generation, prompt_filter, records):
+        if not self.search_worker.is_current(generation):
+            return
+        self._search_running = False
+        if records is None:
+            self._show_search_error(f"The search took longer than {prompt_filter.time_budget:g} s and was stopped.")
+            return
+        print(f"Search: '{prompt_filter.search_term}', Categories: {prompt_filter.categories}, Tags: {prompt_filter.tags}, "
+              f"Case Sensitive: {prompt_filter.case_sensitive}, Favorites: {prompt_filter.favorites}: {len(records)} prompt(s)")
+        self._show_prompts(records)
+
+    def _show_search_error(self, message):
+        print(f"Search: {message}")
+        QToolTip.showText(self.searchBar.mapToGlobal(self.searchBar.rect().bottomLeft()), message,
+                          widget=self.searchBar, msecShowTime=3000)
+
+    def _refresh_prompt_rows(self, prompt_ids):
+        # Updates the rows of the given prompts in place; the list is rebuilt instead when one of
+        # them has to appear, disappear or move
+        if self.searchTimer.isActive():
+            return # The search about to start replaces the list, with these changes
+        if self._search_running:
+            # The running search replaces the list, but it started before these changes
+            self._start_search()
+            return
 
-        case_sensitive = self.caseSensitiveCheckbox.isChecked()
+        prompt_filter = self.current_filter()
+        if prompt_filter.time_budget is not None:
+            self._start_search(prompt_filter) # Not matched on the GUI thread, even for a few prompts
+            return
 
-        processed_search_term = search_term if case_sensitive else search_term.lower()
-
-        filtered_prompts = []
-
-        for prompt_id, prompt_info in self.prompts.items():
-            data = prompt_info['data']
-            category = data.get('category') if data.get('category') else 'No category'
-            tags = data.get('tags', [])
-            is_favorite = data.get('favorite', False)
-
-            title_text = data.get('title', '')
-            prompt_text = data.get('prompt', '')
-            note_text = data.get('note', '')
-
-            processed_title = title_text if case_sensitive else title_text.lower()
-            processed_prompt = prompt_text if case_sensitive else prompt_text.lower()
-            processed_note = note_text if case_sensitive else note_text.lower()
-
-            category_match = filter_category is None or category == filter_category
-            tag_match = filter_tag is None or filter_tag in tags
-            search_match = (
-                processed_search_term == "" or
-                processed_search_term in processed_title or
-                processed_search_term in processed_prompt or
-                processed_search_term in processed_note
-            )
-            favorite_match = (not filter_favorites) or is_favorite
-            if category_match and tag_match and search_match and favorite_match:
-                filtered_prompts.append({'id': prompt_id, **data})
-
-        sorted_prompts = sorted(filtered_prompts, key=lambda p: p.get('title', ''))
-
-        for prompt_data in sorted_prompts:
-            prompt_id = prompt_data['id']
-            title = prompt_data.get('title', 'Untitled')
-            is_favorite = prompt_data.get('favorite', False)
-
-            item_widget = QWidget()
-            item_layout = QHBoxLayout(item_widget)
-            item_layout.setContentsMargins(2, 5, 2, 5)
-            item_layout.setSpacing(5)
-
-            if is_favorite:
-                fav_label = QLabel("⭐")
-                item_layout.addWidget(fav_label, 0)
-
-            title_label = QLabel(title)
-            item_layout.addWidget(title_label, 1)
-
-            copy_button = QPushButton()
-            copy_button.setObjectName("copyPromptButton") # Add objectName for QSS targeting
-            copy_button.setFixedSize(QSize(24, 24))
-            copy_button.setToolTip(f"Copy prompt '{title}'")
-            copy_button.setStyleSheet("""
-                QPushButton { border: none; background-color: transparent; padding: 0px; }
-                QPushButton:hover { background-color: rgba(128, 128, 128, 50); }
-                QPushButton:pressed { background-color: rgba(128, 128, 128, 100); }
-            """)
-            copy_button.setProperty("prompt_id", prompt_id)
-            copy_button.clicked.connect(self.copy_prompt_text_from_button)
-            copy_button.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
-            item_layout.addWidget(copy_button, 0)
-
-            item_widget.setLayout(item_layout)
-
-            list_item = QListWidgetItem(self.promptList)
-            list_item.setSizeHint(item_widget.sizeHint())
-            list_item.setData(Qt.ItemDataRole.UserRole, prompt_id)
-
-            self.promptList.addItem(list_item)
-            self.promptList.setItemWidget(list_item, item_widget)
-
-    def copy_prompt_text_from_button(self):
-        sender_button = self.sender()
-        if sender_button:
-            prompt_id = sender_button.property("prompt_id")
-            if prompt_id is not None and prompt_id in self.prompts:
-                prompt_text = self.prompts[prompt_id]['data'].get('prompt', '')
-                clipboard = QApplication.clipboard()
-                clipboard.setText(prompt_text)
-                QToolTip.showText(sender_button.mapToGlobal(sender_button.rect().bottomLeft()),
-                                  "Prompt copied!", widget=sender_button, msecShowTime=1500)
-                print(f"Prompt ID {prompt_id} copied via integrated button.")
-            else:
-                print(f"Error: Could not find prompt ID {prompt_id} from button.")
+        for prompt_id in prompt_ids:
+            record = self.prompts.get(prompt_id)
+            row = self.promptModel.row_of(prompt_id)
+            visible = record is not None and prompt_filter.matches(record)
+            # A change may move any prompt in relevance order, the list is rebuilt then
+            if visible != (row is not None) or (visible and (prompt_filter.is_ranked()
+                                                             or not self._row_in_order(row, record))):
+                self.update_prompt_list()
+                return
+
+        for prompt_id in prompt_ids:
+            row = self.promptModel.row_of(prompt_id)
+            if row is not None:
+                self.promptModel.update_record(row, self.prompts[prompt_id])
+
+    def _row_in_order(self, row, record):
+        # Whether the row of this prompt can stay at this position of the list in title order
+        sort_key = self.search_index.titles.sort_key
+        own_key = sort_key(record)
+        for neighbour in (row - 1, row + 1):
+            if 0 <= neighbour < self.promptModel.rowCount():
+                neighbour_key = sort_key(self.promptModel.record(neighbour))
+                if (neighbour < row and neighbour_key > own_key) or (neighbour > row and neighbour_key < own_key):
+                    return False
+        return True
+
+    def copy_prompt_text_from_row(self, prompt_id, icon_rect):
+        # The copy icon of a row was clicked; icon_rect is in the list's viewport coordinates
+        if prompt_id in self.prompts:
+            prompt_text = self.prompts[prompt_id].prompt
+            clipboard = QApplication.clipboard()
+            clipboard.setText(prompt_text)
+            viewport = self.promptList.viewport()
+            QToolTip.showText(viewport.mapToGlobal(icon_rect.bottomLeft()),
+                              "Prompt copied!", widget=viewport, msecShowTime=1500)
+            print(f"Prompt ID {prompt_id} copied via integrated button.")
+        else:
+            print(f"Error: Could not find prompt ID {prompt_id} from button.")
+
+    def _prompt_double_clicked(self, index):
+        # A double-click on the copy icon of a row copies twice rather than opening the editor
+        if not self.promptDelegate.pressed_on_icon:
+            self.editPrompt()
 
     def get_selected_prompt_id(self):
-        selected_items = self.promptList.selectedItems()
-        if selected_items:
-            return selected_items[0].data(Qt.ItemDataRole.UserRole)
+        selected_indexes = self.promptList.selectionModel().selectedIndexes()
+        if selected_indexes:
+            return selected_indexes[0].data(Qt.ItemDataRole.UserRole)
         return None
 
     def get_selected_prompt_ids(self):
         selected_ids = []
-        selected_items = self.promptList.selectedItems()
-        for item in selected_items:
-            prompt_id = item.data(Qt.ItemDataRole.UserRole)
+        for index in self.promptList.selectionModel().selectedIndexes():
+            prompt_id = index.data(Qt.ItemDataRole.UserRole)
             if prompt_id is not None:
                 selected_ids.append(prompt_id)
         return selected_ids
 
     def filter_prompts_by_category(self, item):
-        category = item.text()
-        current_tag = self.current_filter_tag()
+        categories = self.current_filter_categories()
+        current_tags = self.current_filter_tags()
         current_search = self.searchBar.text()
         favorites_only = self.is_favorites_filter_active()
-        print(f"Filtering by Category: {category}, Tag: {current_tag}, Search: {current_search}, Favorites: {favorites_only}")
-        self.update_prompt_list(filter_category=category, filter_tag=current_tag, search_term=current_search, filter_favorites=favorites_only)
+        print(f"Filtering by Categories: {categories}, Tags: {current_tags}, Search: {current_search}, Favorites: {favorites_only}")
+        self.update_prompt_list()
 
     def filter_prompts_by_tag(self, item):
-        tag = item.text()
-        current_category = self.current_filter_category()
+        tags = self.current_filter_tags()
+        current_categories = self.current_filter_categories()
         current_search = self.searchBar.text()
         favorites_only = self.is_favorites_filter_active()
-        print(f"Filtering by Tag: {tag}, Category: {current_category}, Search: {current_search}, Favorites: {favorites_only}")
-        self.update_prompt_list(filter_category=current_category, filter_tag=tag, search_term=current_search, filter_favorites=favorites_only)
+        print(f"Filtering by Tags: {tags} ({'all' if self.is_all_tags_filter_active() else 'any'}), Categories: {current_categories}, Search: {current_search}, Favorites: {favorites_only}")
+        self.update_prompt_list()
+
+    def toggle_tag_matching(self, state=None):
+        print(f"Tag Filter: prompts with {'all' if self.is_all_tags_filter_active() else 'any'} of the selected tags")
+        self.update_prompt_list()
 
     def filter_prompts_by_search(self, text=None):
         search_term = self.searchBar.text()
-        current_category = self.current_filter_category()
-        current_tag = self.current_filter_tag()
+        current_categories = self.current_filter_categories()
+        current_tags = self.current_filter_tags()
         case_sensitive = self.caseSensitiveCheckbox.isChecked()
         favorites_only = self.is_favorites_filter_active()
-        print(f"Filtering by Search: '{search_term}', Category: {current_category}, Tag: {current_tag}, Case Sensitive: {case_sensitive}, Favorites: {favorites_only}")
-        self.update_prompt_list(filter_category=current_category, filter_tag=current_tag, search_term=search_term, filter_favorites=favorites_only)
+        print(f"Filtering by Search: '{search_term}', Categories: {current_categories}, Tags: {current_tags}, Case Sensitive: {case_sensitive}, Favorites: {favorites_only}")
+        self.update_prompt_list()
+
+    def toggle_accent_folding(self, state=None):
+        # The search texts are folded accordingly, searches scan the prompts until they are all folded again
+        self.search_index.reset(self.prompts, fold_accents=self.ignoreAccentsCheckbox.isChecked())
+        if not self.loading:
+            self.indexTimer.start()
+        self.filter_prompts_by_search()
 
     def toggle_favorites_filter(self):
         favorites_only = self.is_favorites_filter_active()
-        current_category = self.current_filter_category()
-        current_tag = self.current_filter_tag()
-        current_search = self.searchBar.text()
         print(f"Toggling Favorites Filter: {'Activated' if favorites_only else 'Deactivated'}")
-        self.update_prompt_list(filter_category=current_category, filter_tag=current_tag, search_term=current_search, filter_favorites=favorites_only)
+        self.update_prompt_list()
 
     def show_all_prompts(self):
         self.categoryList.clearSelection()
@@ -325,23 +493,26 @@ class PromptManager(QWidget):
     def is_favorites_filter_active(self):
         return self.showFavoritesButton.isChecked()
 
-    def current_filter_category(self):
-        selected_items = self.categoryList.selectedItems()
-        return selected_items[0].text() if selected_items else None
+    def current_filter_categories(self):
+        return [item.data(Qt.ItemDataRole.UserRole) for item in self.categoryList.selectedItems()]
+
+    def current_filter_tags(self):
+        return [item.data(Qt.ItemDataRole.UserRole) for item in self.tagList.selectedItems()]
 
-    def current_filter_tag(self):
-        selected_items = self.tagList.selectedItems()
-        return selected_items[0].text() if selected_items else None
+    def is_all_tags_filter_active(self):
+        return self.matchAllTagsCheckbox.isChecked()
 
     def addPrompt(self):
+        if self._editing_blocked():
+            return
         selected_category_items = self.categoryList.selectedItems()
         default_category = 'No category'
         if selected_category_items:
-            default_category = selected_category_items[0].text()
+            default_category = selected_category_items[0].data(Qt.ItemDataRole.UserRole)
         elif self.categories:
             default_category = self.categories[0]
 
-        initial_data = {'category': default_category, 'favorite': False}
+        initial_data = PromptVersion(category=default_category)
 
         self.clear_editor_panel() # Clear any previous content
 
@@ -360,6 +531,8 @@ class PromptManager(QWidget):
         print("Opened Add Prompt panel.")
 
     def editPrompt(self):
+        if self._editing_blocked():
+            return
         prompt_id = self.get_selected_prompt_id()
 
         if prompt_id is None:
@@ -377,8 +550,8 @@ class PromptManager(QWidget):
             QMessageBox.critical(self, "Error", f"Could not find prompt with ID {prompt_id}.")
             return
 
-        current_data = self.prompts[prompt_id]['data']
-        history = self.prompts[prompt_id]['history']
+        current_data = self.prompts[prompt_id]
+        history = self.history_store.versions(prompt_id, current_data)
 
         self.clear_editor_panel() # Clear any previous content
 
@@ -394,17 +567,19 @@ class PromptManager(QWidget):
         self.current_editor_instance.rejected.connect(self._cancel_prompt_edit_from_panel)
 
         self.show_editor_panel(True) # Show the dock widget
-        self.editor_dock.setWindowTitle(f"Edit Prompt: {current_data.get('title', 'Untitled')}")
+        self.editor_dock.setWindowTitle(f"Edit Prompt: {current_data.title or 'Untitled'}")
         print(f"Opened Edit Prompt panel for ID {prompt_id}.")
 
     def deleteSelectedPrompts(self):
+        if self._editing_blocked():
+            return
         selected_ids = self.get_selected_prompt_ids()
 
         if not selected_ids:
             QMessageBox.warning(self, "No Selection", "Please select at least one prompt to delete.")
             return
 
-        prompts_to_delete_titles = [self.prompts[pid]['data'].get('title', 'Untitled') for pid in selected_ids if pid in self.prompts]
+        prompts_to_delete_titles = [self.prompts[pid].title or 'Untitled' for pid in selected_ids if pid in self.prompts]
 
         count = len(selected_ids)
         if count == 1:
@@ -424,95 +599,328 @@ class PromptManager(QWidget):
 
         if msgBox.clickedButton() == yesButton:
             deleted_count = 0
-            for prompt_id in selected_ids:
-                if prompt_id in self.prompts:
-                    del self.prompts[prompt_id]
-                    deleted_count += 1
-                    print(f"Prompt ID {prompt_id} deleted.")
+            with self.events.batch():
+                for prompt_id in selected_ids:
+                    if prompt_id in self.prompts:
+                        removed = self.prompts.pop(prompt_id)
+                        self._record_prompt_removal(prompt_id, removed.rev)
+                        deleted_count += 1
+                        print(f"Prompt ID {prompt_id} deleted.")
 
             if deleted_count > 0:
                 print(f"{deleted_count} prompt(s) deleted.")
-                self.update_category_list()
-                self.update_tag_list()
-                self.update_prompt_list(filter_category=self.current_filter_category(),
-                                        filter_tag=self.current_filter_tag(),
-                                        search_term=self.searchBar.text(),
-                                        filter_favorites=self.is_favorites_filter_active())
-                self.save_prompts()
-
-    def current_filter_category(self):
-        selected_items = self.categoryList.selectedItems()
-        return selected_items[0].text() if selected_items else None
-
-    def current_filter_tag(self):
-        selected_items = self.tagList.selectedItems()
-        return selected_items[0].text() if selected_items else None
+
+    def _record_prompt_change(self, prompt_id, past_version=None, new_history=False):
+        # past_version: the previous PromptRecord, when this change created a new version of the prompt;
+        # new_history: the prompt was just created, or its history purged.
+        # self.prompts[prompt_id] still has the revision it was changed from, the next one is set here.
+        # The search index still has the version the prompt was changed from, if any.
+        previous = self.search_index.facets.records.get(prompt_id)
+        base_rev = self.prompts[prompt_id].rev
+        self.prompts[prompt_id] = self.prompts[prompt_id].replace(rev=base_rev + 1)
+        data = self.prompts[prompt_id].to_dict()
+        if new_history:
+            record = {'op': 'put', 'id': prompt_id, 'data': data}
+            self.history_store.discard(prompt_id)
+        else:
+            record = {'op': 'update', 'id': prompt_id, 'data': data}
+            # A version is not archived again, nor while it is the current one (e.g. our version
+            # of a concurrent edit that turned out to be the one kept)
+            if past_version is not None and past_version.version() != self.prompts[prompt_id].version():
+                entry = self.history_store.archive(prompt_id, past_version)
+                if entry is not None:
+                    record['past_version'] = entry
+        record['rev'] = base_rev + 1
+        record['base_rev'] = base_rev
+        self._pending_records.append(record)
+        self._notify_prompt_change(prompt_id, previous, self.prompts[prompt_id])
+
+    def _record_prompt_removal(self, prompt_id, base_rev):
+        self._pending_records.append({'op': 'delete', 'id': prompt_id, 'base_rev': base_rev})
+        self.history_store.discard(prompt_id)
+        self.events.prompt_removed(prompt_id)
+
+    def _notify_prompt_change(self, prompt_id, previous, record):
+        # previous: the PromptRecord before the change, None for a new prompt
+        if previous is None:
+            self.events.prompt_added(prompt_id, record)
+        else:
+            self.events.prompt_updated(prompt_id, record, record.changed_fields(previous))
+
+    def _on_prompts_changed(self, changes):
+        # Refreshes what a batch of changes touched, then hands it to the writer
+        selection = (self.current_filter_categories(), self.current_filter_tags())
+        if changes.touches_categories():
+            self.update_category_list()
+        if changes.touches_tags():
+            self.update_tag_list()
+            # A selected tag that was renamed stays selected under its new name
+            renamed = {changes.renamed_tags[tag] for tag in selection[1] if tag in changes.renamed_tags}
+            if renamed:
+                for row in range(self.tagList.count()):
+                    item = self.tagList.item(row)
+                    if item.data(Qt.ItemDataRole.UserRole) in renamed:
+                        item.setSelected(True)
+        if (self.current_filter_categories(), self.current_filter_tags()) != selection:
+            # A selected item was removed or renamed: the filter changed for every prompt
+            self.update_prompt_list()
+        elif changes.prompt_ids():
+            self._refresh_prompt_rows(changes.prompt_ids())
+        self.save_prompts()
+
+    def _current_meta(self):
+        return {
+            'next_id': self.next_id,
+            'categories': list(self.categories),
+            'global_tags': sorted(list(self.global_tags))
+        }
+
+    def _snapshot_state(self):
+        # Shallow copy that stays consistent while the writer serializes it: PromptRecords are
+        # never modified, only replaced
+        state = self._current_meta()
+        state['prompts'] = dict(self.prompts)
+        return state
 
     def save_prompts(self):
+        # Hands the changes recorded since the last call to the writer, which appends them to the
+        # journal, and folds the journal into a new snapshot once it has grown large enough
         try:
             self.categories.sort()
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                prompts_to_save = {str(k): v for k, v in self.prompts.items()}
-                # Save global_tags along with other data
-                save_data = {
-                    'next_id': self.next_id,
-                    'prompts': prompts_to_save,
-                    'categories': self.categories,
-                    'global_tags': sorted(list(self.global_tags)) # Save as sorted list
-                }
-                json.dump(save_data, f, ensure_ascii=False, indent=4)
+            meta = self._current_meta()
+            if meta != self._saved_meta:
+                self._pending_records.append({'op': 'meta', **meta})
+            records, self._pending_records = self._pending_records, []
+            self.writer.append(records)
+            self._saved_meta = meta
+            if self.writer.needs_compaction():
+                self.writer.compact(self._snapshot_state())
         except IOError as e:
             QMessageBox.critical(self, "Save Error", f"Could not save prompts: {e}")
         except Exception as e:
              QMessageBox.critical(self, "Unknown Save Error", f"An unexpected error occurred while saving: {e}")
 
+    def flush_saves(self):
+        # Called on exit: waits for every pending write, and rewrites the snapshot if a write failed
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.searchTimer.stop()
+        self.search_worker.close()
+        self.search_index.regex_matcher.close()
+        if self.loading:
+            # Nothing can have been changed yet, and the prompts are incomplete
+            self.loader.cancel()
+            self.writer.close()
+            return
+        self.save_prompts()
+        try:
+            if self.writer.failed:
+                self.writer.compact(self._snapshot_state())
+            self.writer.close()
+        except Exception as e:
+            QMessageBox.critical(self, "Save Error", f"Could not save prompts: {e}")
+
+    def _show_save_error(self, message):
+        QMessageBox.critical(self, "Save Error", f"Could not save prompts: {message}")
+
 
     def load_prompts(self):
-        if not os.path.exists(self.data_file):
-            self.prompts = {}
-            self.next_id = 0
-            self.categories = []
-            self.global_tags = set() # Initialize global_tags if file doesn't exist
-            return
+        # Reads the vault on a worker thread; the lists fill in as batches of prompts arrive
+        self.loading = True
+        self._set_editing_enabled(False)
+        self.loadProgressBar.setValue(0)
+        self.loadProgressBar.show()
+        self._next_list_refresh = 0.0
+        self.loader = PromptLoader(self.storage, self)
+        self.loader.promptsLoaded.connect(self._on_prompts_loaded)
+        self.loader.loadFinished.connect(self._on_load_finished)
+        self.loader.loadFailed.connect(self._on_load_failed)
+        self.loader.start()
+
+    def _on_prompts_loaded(self, prompts, percent):
+        self.prompts.update(prompts)
+        self.search_index.prompts_loaded(prompts)
+        self.loadProgressBar.setValue(percent)
+        if time.monotonic() >= self._next_list_refresh:
+            self._refresh_lists()
+
+    def _on_load_finished(self, loaded_data):
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                loaded_data = json.load(f)
-                self.next_id = loaded_data.get('next_id', 0)
-                loaded_prompts = {}
-                for k, v in loaded_data.get('prompts', {}).items():
-                    try:
-                        prompt_id = int(k)
-                        if isinstance(v, dict) and 'data' in v and 'history' in v:
-                             if 'category' not in v['data'] or not v['data']['category']:
-                                 v['data']['category'] = 'No category'
-                             if 'favorite' not in v['data']:
-                                 v['data']['favorite'] = False
-                             for history_entry in v.get('history', []):
-                                 if 'favorite' not in history_entry:
-                                     history_entry['favorite'] = False
-                             loaded_prompts[prompt_id] = v
-                        else:
-                             print(f"Warning: Invalid structure for prompt ID '{k}', ignored.")
-                    except ValueError:
-                         print(f"Warning: Invalid prompt key '{k}', ignored.")
-
-                self.prompts = loaded_prompts
-                self.categories = loaded_data.get('categories', [])
-                self.categories.sort()
-                self.global_tags = set(loaded_data.get('global_tags', [])) # Load global_tags
-
-        except (IOError, json.JSONDecodeError) as e:
-            QMessageBox.critical(self, "Load Error", f"Could not load prompts from {self.data_file}: {e}")
-            self.prompts = {}
-            self.next_id = 0
-            self.categories = []
-            self.global_tags = set() # Reset global_tags on error
+            self.prompts = loaded_data['prompts']
+            self.next_id = loaded_data['next_id']
+            self.categories = loaded_data['categories']
+            self.categories.sort()
+            self.global_tags = set(loaded_data['global_tags']) # Load global_tags
+            self._saved_meta = self._current_meta()
         except Exception as e:
-            QMessageBox.critical(self, "Unknown Error", f"An unexpected error occurred while loading: {e}")
-            self.prompts = {}
-            self.next_id = 0
-            self.categories = []
-            self.global_tags = set() # Reset global_tags on error
+            self._on_load_failed(f"An unexpected error occurred while loading: {e}")
+            return
+        # The facets are rebuilt from the complete prompts (the loader batches miss the journal
+        # replay) before the lists are
+        self.search_index.reset(self.prompts)
+        self._finish_loading()
+        self.indexTimer.start()
+        if getattr(self.storage, 'snapshot_outdated', False):
+            # Rewrite the snapshot without the histories that the load moved out of it,
+            # or to create the binary snapshot read at the next start
+            self.writer.compact(self._snapshot_state())
+        self._start_watching()
+
+    def _build_search_index(self):
+        # Indexes the loaded prompts a slice at a time, searches scan them until it is done
+        if self.search_index.build(self.prompts, INDEX_SLICE_TIME):
+            self.indexTimer.stop()
+            print(f"Search index built for {len(self.prompts)} prompt(s).")
+            # similar: queries and relevance order only cover the prompts indexed when they ran
+            self.update_prompt_list()
+
+    def _start_watching(self):
+        watched_files = self.storage.watched_files()
+        if watched_files:
+            self.watcher = VaultWatcher(watched_files, self)
+            self.watcher.filesChanged.connect(self._merge_external_changes)
+            # Changes made since the journal was read, before the watcher existed
+            self._merge_external_changes()
+
+    def _merge_external_changes(self):
+        # The vault files changed. Unless only by our own writes, the changes of the other instances
+        # are read on the writer thread, after our own changes so that both are ordered the same
+        # everywhere, and merged by _on_external_changes_read().
+        if self.loading or not self.storage.has_external_changes():
+            return
+        self.save_prompts()
+        self.writer.read_changes(self.externalChangesRead.emit)
+
+    def _on_external_changes_read(self, records, state):
+        # Merges the changes other instances made to the vault into self.prompts, and refreshes
+        # only what they touched. records is None when they have to be found by comparing with
+        # state, a fresh load of the vault.
+        if self.watcher is None:
+            return # Closing
+        if records is None:
+            records = self._records_from_state(state)
+        if not records:
+            return
+
+        conflicts = [] # (our version that lost, record of the version that won)
+        # The lists are refreshed, and the conflicts saved, once everything is merged
+        with self.events.batch() as changes:
+            for record in records:
+                try:
+                    if record.get('op') == 'meta':
+                        self._merge_external_meta(record)
+                    else:
+                        self._merge_external_record(record, conflicts)
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Warning: Invalid change {record.get('seq')} from another instance, ignored: {e}")
+            changed_ids = changes.prompt_ids()
+            if changed_ids:
+                self.next_id = max(self.next_id, max(changed_ids) + 1)
+            self._saved_meta = self._current_meta()
+
+            for lost, record in conflicts:
+                if record['op'] == 'put' and record.get('base_rev') == 0:
+                    # Both instances created a prompt with this ID: ours is kept under a new one
+                    prompt_id = self.next_id
+                    self.next_id += 1
+                    self.prompts[prompt_id] = PromptRecord.from_version(prompt_id, lost)
+                    self._record_prompt_change(prompt_id, new_history=True)
+                elif lost.id in self.prompts:
+                    # Our version is kept in the history of the one that won
+                    self._record_prompt_change(lost.id, past_version=lost)
+            print(f"Merged {len(records)} change(s) made by another instance, {len(changes.prompt_ids())} prompt(s) updated.")
+
+        if conflicts:
+            titles = "\n".join(f"- {lost.title or 'Untitled'}" for lost, record in conflicts)
+            QMessageBox.warning(self, "Conflicting Changes",
+                                "These prompts were changed in another PromptVault window at the same time. "
+                                f"The other version was kept, yours is in the prompt history (or saved as a new prompt):\n{titles}")
+
+    def _merge_external_meta(self, record):
+        self.next_id = max(self.next_id, record.get('next_id', self.next_id))
+        categories = sorted(record.get('categories', self.categories))
+        global_tags = set(record.get('global_tags', self.global_tags))
+        categories_changed = categories != self.categories
+        tags_changed = global_tags != self.global_tags
+        self.categories = categories
+        self.global_tags = global_tags
+        if categories_changed:
+            self.events.categories_changed()
+        if tags_changed:
+            self.events.tags_changed()
+
+    def _merge_external_record(self, record, conflicts):
+        # Applies a put/update/delete record of another instance, with the same rules as a journal
+        # replay
+        prompt_id = int(record['id'])
+        current = self.prompts.get(prompt_id)
+        if record['op'] == 'delete':
+            if current is None or not journal_record_applies(current, record):
+                return
+            del self.prompts[prompt_id]
+            prompt = None
+        else:
+            prompt = prompt_from_journal_record(record, current)
+            if prompt is None or not journal_record_applies(current, record, prompt):
+                return
+            self.prompts[prompt_id] = prompt
+            if (current is not None and record.get('base_rev', current.rev) != current.rev
+                    and current.version() != prompt.version()):
+                conflicts.append((current, record))
+        # The other instance may have added versions to the history file
+        self.history_store.forget(prompt_id)
+        if prompt is None:
+            self.events.prompt_removed(prompt_id)
+        else:
+            self._notify_prompt_change(prompt_id, current, prompt)
+
+    def _records_from_state(self, state):
+        # Records turning self.prompts into a freshly loaded state, for _merge_external_changes()
+        records = [{'op': 'meta', 'next_id': state['next_id'], 'categories': state['categories'],
+                    'global_tags': state['global_tags']}]
+        for prompt_id, prompt in state['prompts'].items():
+            current = self.prompts.get(prompt_id)
+            if current is None or current.rev != prompt.rev or current.version() != prompt.version():
+                records.append({'op': 'put', 'id': prompt_id, 'data': prompt.to_dict(), 'rev': prompt.rev})
+        for prompt_id in self.prompts.keys() - state['prompts'].keys():
+            records.append({'op': 'delete', 'id': prompt_id})
+        return records
+
+    def _on_load_failed(self, message):
+        QMessageBox.critical(self, "Load Error", f"Could not load prompts from {self.data_file}: {message}")
+        self.prompts = {}
+        self.search_index.reset(self.prompts)
+        self.next_id = 0
+        self.categories = []
+        self.global_tags = set() # Reset global_tags on error
+        self._finish_loading()
+
+    def _finish_loading(self):
+        self.loading = False
+        self.loadProgressBar.hide()
+        self._set_editing_enabled(True)
+        self._refresh_lists()
+        print(f"Loaded {len(self.prompts)} prompt(s) from {self.data_file}.")
+
+    def _refresh_lists(self):
+        started = time.monotonic()
+        self.update_category_list()
+        self.update_tag_list()
+        self.update_prompt_list()
+        # Rebuilding the lists gets slower as prompts arrive, keep it from taking most of the time
+        now = time.monotonic()
+        self._next_list_refresh = now + max(LOAD_REFRESH_INTERVAL, 2 * (now - started))
+
+    def _set_editing_enabled(self, enabled):
+        for button in (self.addButton, self.editButton, self.deleteButton,
+                       self.manageCategoriesButton, self.manageTagsButton):
+            button.setEnabled(enabled)
+
+    def _editing_blocked(self):
+        if self.loading:
+            print("Prompts are still loading, editing is disabled.")
+        return self.loading
 
     def show_context_menu(self, position):
         menu = QMenu()
@@ -522,28 +930,64 @@ class PromptManager(QWidget):
         copy_prompt_action = menu.addAction("Copy Prompt")
         export_action = menu.addAction("Export")
         toggle_favorite_action = menu.addAction("Add to Favorites" if not self.is_selected_prompt_favorite() else "Remove from Favorites")
+        find_similar_action = menu.addAction("Find Similar")
 
         edit_action.triggered.connect(self.editPrompt)
         delete_action.triggered.connect(self.deleteSelectedPrompts)
         copy_prompt_action.triggered.connect(self.copy_selected_prompt_text)
         export_action.triggered.connect(self.export_selected_prompts)
         toggle_favorite_action.triggered.connect(self.toggle_selected_prompt_favorite)
+        find_similar_action.triggered.connect(self.find_similar_to_selected_prompt)
 
-        selected_items = self.promptList.selectedItems()
-        num_selected = len(selected_items)
+        num_selected = len(self.get_selected_prompt_ids())
 
         edit_action.setEnabled(num_selected == 1)
         copy_prompt_action.setEnabled(num_selected == 1)
         export_action.setEnabled(num_selected > 0)
         toggle_favorite_action.setEnabled(num_selected >= 1)
         delete_action.setEnabled(num_selected >= 1)
+        find_similar_action.setEnabled(num_selected == 1)
 
         menu.exec(self.promptList.mapToGlobal(position))
 
+    def find_similar_to_selected_prompt(self):
+        prompt_id = self.get_selected_prompt_id()
+        if prompt_id is not None and prompt_id in self.prompts:
+            self.show_similar_prompts(prompt_id)
+
+    def show_similar_prompts(self, prompt_id):
+        # Searches for the near-duplicates of the prompt (see similarity_index), in every category
+        self._search_everywhere(f"similar:{prompt_id}")
+
+    def _search_everywhere(self, search_term):
+        self.categoryList.clearSelection()
+        self.tagList.clearSelection()
+        self.showFavoritesButton.setChecked(False)
+        self.regexCheckbox.setChecked(False)
+        self.searchBar.setText(search_term)
+        self.update_prompt_list()
+
+    def find_duplicate_prompts(self):
+        # The signatures are computed by the indexing pass after loading
+        if not self.search_index.ready:
+            QMessageBox.information(self, "Still Indexing",
+                                    "The prompts are still being indexed, please try again in a moment.")
+            return
+        clusters = self.search_index.similarity.clusters()
+        if not clusters:
+            QMessageBox.information(self, "No Duplicates", "No near-duplicate prompts found.")
+            return
+        dialog = DuplicatesDialog(self, clusters, self.prompts)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            cluster = dialog.getSelectedCluster()
+            if cluster:
+                # The group as found, including the prompts only similar to it through other members
+                self._search_everywhere("id:" + ",".join(map(str, cluster)))
+
     def copy_selected_prompt_text(self):
         prompt_id = self.get_selected_prompt_id()
         if prompt_id is not None and prompt_id in self.prompts:
-            prompt_text = self.prompts[prompt_id]['data'].get('prompt', '')
+            prompt_text = self.prompts[prompt_id].prompt
             clipboard = QApplication.clipboard()
             clipboard.setText(prompt_text)
             QToolTip.showText(self.promptList.mapToGlobal(self.promptList.viewport().rect().center()),
@@ -556,9 +1000,11 @@ class PromptManager(QWidget):
         selected_ids = self.get_selected_prompt_ids()
         if not selected_ids:
             return False
-        return all(self.prompts[pid]['data'].get('favorite', False) for pid in selected_ids if pid in self.prompts)
+        return all(self.prompts[pid].favorite for pid in selected_ids if pid in self.prompts)
 
     def toggle_selected_prompt_favorite(self):
+        if self._editing_blocked():
+            return
         selected_ids = self.get_selected_prompt_ids()
         if not selected_ids:
             QMessageBox.warning(self, "No Selection", "Please select at least one prompt to change its favorite status.")
@@ -568,22 +1014,17 @@ class PromptManager(QWidget):
         new_favorite_state = not current_state_all_favorite
 
         prompts_changed = False
-        for prompt_id in selected_ids:
-            if prompt_id in self.prompts:
-                current_favorite = self.prompts[prompt_id]['data'].get('favorite', False)
-                if current_favorite != new_favorite_state:
-                    self.prompts[prompt_id]['data']['favorite'] = new_favorite_state
-                    if self.prompts[prompt_id]['history']:
-                        self.prompts[prompt_id]['history'][-1]['favorite'] = new_favorite_state
-                    prompts_changed = True
-                    print(f"Prompt ID {prompt_id} favorite toggled to {new_favorite_state}.")
+        with self.events.batch():
+            for prompt_id in selected_ids:
+                if prompt_id in self.prompts:
+                    current_favorite = self.prompts[prompt_id].favorite
+                    if current_favorite != new_favorite_state:
+                        self.prompts[prompt_id] = self.prompts[prompt_id].replace(favorite=new_favorite_state)
+                        self._record_prompt_change(prompt_id)
+                        prompts_changed = True
+                        print(f"Prompt ID {prompt_id} favorite toggled to {new_favorite_state}.")
 
         if prompts_changed:
-            self.update_prompt_list(filter_category=self.current_filter_category(),
-                                    filter_tag=self.current_filter_tag(),
-                                    search_term=self.searchBar.text(),
-                                    filter_favorites=self.is_favorites_filter_active())
-            self.save_prompts()
             QToolTip.showText(self.promptList.mapToGlobal(self.promptList.viewport().rect().center()),
                               f"Favorite status updated for {len(selected_ids)} prompt(s)!", msecShowTime=1500)
         else:
@@ -611,6 +1052,8 @@ class PromptManager(QWidget):
                 QMessageBox.critical(self, "Export Error", f"Failed to export selected prompts: {e}")
 
     def export_prompts(self):
+        if self._editing_blocked():
+            return
         file_name, _ = QFileDialog.getSaveFileName(self, "Export Prompts", "",
                                                   "CSV Files (*.csv);;Markdown Files (*.md);;All Files (*)")
         if file_name:
@@ -636,15 +1079,14 @@ class PromptManager(QWidget):
             if prompt_ids is not None:
                 prompts_to_export = [(pid, self.prompts[pid]) for pid in prompt_ids if pid in self.prompts]
 
-            for prompt_id, prompt_info in prompts_to_export:
-                data = prompt_info['data']
+            for prompt_id, record in prompts_to_export:
                 row = {
-                    'title': data.get('title', ''),
-                    'prompt': data.get('prompt', ''),
-                    'note': data.get('note', ''),
-                    'category': data.get('category', 'No category'),
-                    'tags': ', '.join(data.get('tags', [])),
-                    'favorite': 'Yes' if data.get('favorite', False) else 'No'
+                    'title': record.title,
+                    'prompt': record.prompt,
+                    'note': record.note,
+                    'category': record.category,
+                    'tags': ', '.join(record.tags),
+                    'favorite': 'Yes' if record.favorite else 'No'
                 }
                 writer.writerow(row)
 
@@ -654,20 +1096,21 @@ class PromptManager(QWidget):
             if prompt_ids is not None:
                 prompts_to_export = [(pid, self.prompts[pid]) for pid in prompt_ids if pid in self.prompts]
 
-            for prompt_id, prompt_info in prompts_to_export:
-                data = prompt_info['data']
-                mdfile.write(f"# {data.get('title', 'Untitled')}\n\n")
-                mdfile.write(f"**Category:** {data.get('category', 'No category')}\n")
-                mdfile.write(f"**Tags:** {', '.join(data.get('tags', []))}\n")
-                mdfile.write(f"**Favorite:** {'Yes' if data.get('favorite', False) else 'No'}\n\n")
+            for prompt_id, record in prompts_to_export:
+                mdfile.write(f"# {record.title or 'Untitled'}\n\n")
+                mdfile.write(f"**Category:** {record.category}\n")
+                mdfile.write(f"**Tags:** {', '.join(record.tags)}\n")
+                mdfile.write(f"**Favorite:** {'Yes' if record.favorite else 'No'}\n\n")
                 mdfile.write("## Prompt\n")
-                mdfile.write(f"{data.get('prompt', '')}\n\n")
-                if data.get('note'):
+                mdfile.write(f"{record.prompt}\n\n")
+                if record.note:
                     mdfile.write("## Note\n")
-                    mdfile.write(f"{data.get('note', '')}\n\n")
+                    mdfile.write(f"{record.note}\n\n")
                 mdfile.write("---\n\n") # Separator
 
     def import_prompts(self):
+        if self._editing_blocked():
+            return
         file_name, _ = QFileDialog.getOpenFileName(self, "Import Prompts", "",
                                                   "CSV Files (*.csv);;Markdown Files (*.md);;All Files (*)")
         if file_name:
@@ -685,18 +1128,15 @@ class PromptManager(QWidget):
                     QMessageBox.information(self, "Import Complete", "No prompts found in the selected file.")
                     return
 
+                # Near-duplicates in the vault of the imported prompts, looked up all at once
+                similar_prompts = self.search_index.similarity.similar_texts(
+                    [prompt_data.prompt for prompt_data in imported_prompts])
                 imported_count = 0
-                for prompt_data in imported_prompts:
-                    if self._handle_imported_prompt(prompt_data):
-                        imported_count += 1
-
-                self.update_category_list()
-                self.update_tag_list()
-                self.update_prompt_list(filter_category=self.current_filter_category(),
-                                        filter_tag=self.current_filter_tag(),
-                                        search_term=self.searchBar.text(),
-                                        filter_favorites=self.is_favorites_filter_active())
-                self.save_prompts()
+                with self.events.batch():
+                    for prompt_data, similar in zip(imported_prompts, similar_prompts):
+                        if self._handle_imported_prompt(prompt_data, similar):
+                            imported_count += 1
+
                 QMessageBox.information(self, "Import Successful", f"Successfully imported {imported_count} prompt(s).")
 
             except Exception as e:
@@ -714,7 +1154,7 @@ class PromptManager(QWidget):
                     row['tags'] = [tag.strip() for tag in row['tags'].split(',')]
                 else:
                     row['tags'] = []
-                prompts.append(row)
+                prompts.append(PromptVersion.from_dict(row))
         return prompts
 
     def _import_from_markdown(self, file_path):
@@ -762,22 +1202,34 @@ class PromptManager(QWidget):
                 current_prompt['note'] = current_prompt['note'].strip()
 
                 if current_prompt.get('title') or current_prompt.get('prompt'): # Only add if it has some content
-                    prompts.append(current_prompt)
+                    prompts.append(PromptVersion.from_dict(current_prompt))
         return prompts
 
-    def _handle_imported_prompt(self, imported_data):
-        # Check for existing prompt with the same title
+    def _handle_imported_prompt(self, imported_data, similar=None):
+        # imported_data: a PromptVersion; similar: (similarity, prompt_id) of its near-duplicates in
+        # the vault, most similar first. Check for existing prompt with the same title
         existing_prompt_id = None
-        for pid, p_info in self.prompts.items():
-            if p_info['data'].get('title') == imported_data.get('title'):
+        for pid, record in self.prompts.items():
+            if record.title == imported_data.title:
                 existing_prompt_id = pid
                 break
+        window_title = "Duplicate Prompt Detected"
+        message = f"A prompt with the title '{imported_data.title or 'Untitled'}' already exists."
+
+        if existing_prompt_id is None and similar:
+            # Otherwise check for a prompt with nearly the same text
+            score, similar_id = similar[0]
+            if similar_id in self.prompts:
+                existing_prompt_id = similar_id
+                window_title = "Similar Prompt Detected"
+                message = (f"The prompt '{imported_data.title or 'Untitled'}' is {score:.0%} similar to the existing "
+                           f"prompt '{self.prompts[similar_id].title or 'Untitled'}'.")
 
         if existing_prompt_id is not None:
             # Duplicate found, ask user for action
             msg_box = QMessageBox(self)
-            msg_box.setWindowTitle("Duplicate Prompt Detected")
-            msg_box.setText(f"A prompt with the title '{imported_data.get('title', 'Untitled')}' already exists.")
+            msg_box.setWindowTitle(window_title)
+            msg_box.setText(message)
             msg_box.setInformativeText("What would you like to do?")
             
             skip_button = msg_box.addButton("Skip", QMessageBox.ButtonRole.RejectRole)
@@ -790,29 +1242,34 @@ class PromptManager(QWidget):
 
             if msg_box.clickedButton() == overwrite_button:
                 # Overwrite existing prompt
-                self.prompts[existing_prompt_id]['data'] = imported_data
-                self.prompts[existing_prompt_id]['history'].append(imported_data) # Add to history
-                print(f"Prompt '{imported_data.get('title')}' overwritten.")
+                previous_data = self.prompts[existing_prompt_id]
+                self.prompts[existing_prompt_id] = PromptRecord.from_version(existing_prompt_id, imported_data, previous_data.rev)
+                self._record_prompt_change(existing_prompt_id, past_version=previous_data) # Add to history
+                print(f"Prompt '{imported_data.title}' overwritten.")
                 return True
             elif msg_box.clickedButton() == keep_both_button:
                 # Add as a new prompt
                 prompt_id = self.next_id
                 self.next_id += 1
-                self.prompts[prompt_id] = {'data': imported_data, 'history': [imported_data]}
-                print(f"Prompt '{imported_data.get('title')}' imported as new.")
+                self.prompts[prompt_id] = PromptRecord.from_version(prompt_id, imported_data)
+                self._record_prompt_change(prompt_id, new_history=True)
+                print(f"Prompt '{imported_data.title}' imported as new.")
                 return True
             else: # Skip
-                print(f"Prompt '{imported_data.get('title')}' skipped.")
+                print(f"Prompt '{imported_data.title}' skipped.")
                 return False
         else:
             # No duplicate, add as a new prompt
             prompt_id = self.next_id
             self.next_id += 1
-            self.prompts[prompt_id] = {'data': imported_data, 'history': [imported_data]}
-            print(f"Prompt '{imported_data.get('title')}' imported.")
+            self.prompts[prompt_id] = PromptRecord.from_version(prompt_id, imported_data)
+            self._record_prompt_change(prompt_id, new_history=True)
+            print(f"Prompt '{imported_data.title}' imported.")
             return True
 
     def manageCategories(self):
+        if self._editing_blocked():
+            return
         dialog = CategoryDialog(self, self.categories)
 
         if dialog.exec() == QDialog.DialogCode.Accepted:
@@ -823,24 +1280,19 @@ class PromptManager(QWidget):
                 removed_categories = set(self.categories) - set(new_managed_categories)
                 self.categories = new_managed_categories
 
-                prompts_updated = False
-                if removed_categories:
-                    print(f"Categories removed from management: {removed_categories}")
-                    for prompt_id, prompt_info in self.prompts.items():
-                        current_category = prompt_info['data'].get('category', 'No category')
-                        if current_category in removed_categories:
-                            prompt_info['data']['category'] = 'No category'
-                            if prompt_info['history']:
-                                 prompt_info['history'][-1]['category'] = 'No category'
-                            print(f"Prompt ID {prompt_id} moved to 'No category' because its category '{current_category}' was removed.")
-                            prompts_updated = True
-
-                self.update_category_list()
-                self.update_prompt_list(filter_category=self.current_filter_category(),
-                                        filter_tag=self.current_filter_tag(),
-                                        search_term=self.searchBar.text(),
-                                        filter_favorites=self.is_favorites_filter_active())
-                self.save_prompts()
+                with self.events.batch():
+                    self.events.categories_changed()
+                    if removed_categories:
+                        print(f"Categories removed from management: {removed_categories}")
+                        for prompt_id, record in list(self.prompts.items()):
+                            current_category = record.category
+                            if current_category in removed_categories:
+                                self.prompts[prompt_id] = record.replace(category='No category')
+                                self._record_prompt_change(prompt_id)
+                                print(f"Prompt ID {prompt_id} moved to 'No category' because its category '{current_category}' was removed.")
+                        for category in removed_categories:
+                            self.events.category_removed(category)
+
                 print("Managed categories list and prompts updated and saved.")
             else:
                 print("No changes detected in managed categories.")
@@ -848,6 +1300,8 @@ class PromptManager(QWidget):
             print("Category management cancelled.")
 
     def manageTags(self):
+        if self._editing_blocked():
+            return
         # Pass the current global_tags to the dialog
         dialog = TagDialog(self, tags=list(self.global_tags))
 
@@ -858,55 +1312,46 @@ class PromptManager(QWidget):
                 print("No tag changes to apply.")
                 return
 
-            prompts_updated = False
-            # Apply renames and removals to existing prompts
-            for prompt_id, prompt_info in self.prompts.items():
-                current_prompt_tags = set(prompt_info['data'].get('tags', []))
-                new_prompt_tags = set()
-                tags_changed_for_prompt = False
-
-                for tag in current_prompt_tags:
-                    if tag in removed_tags:
-                        tags_changed_for_prompt = True
-                        continue
-                    elif tag in renamed_tags:
-                        new_prompt_tags.add(renamed_tags[tag])
-                        tags_changed_for_prompt = True
-                    else:
-                        new_prompt_tags.add(tag)
-
-                if tags_changed_for_prompt:
-                    sorted_new_tags = sorted(list(new_prompt_tags))
-                    prompt_info['data']['tags'] = sorted_new_tags
-                    if prompt_info['history']:
-                        prompt_info['history'][-1]['tags'] = sorted_new_tags
-                    print(f"Tags updated for Prompt ID {prompt_id}: {sorted_new_tags}")
-                    prompts_updated = True
-
-            # Update global_tags based on changes from the dialog
-            for old_name, new_name in renamed_tags.items():
-                if old_name in self.global_tags:
-                    self.global_tags.remove(old_name)
-                self.global_tags.add(new_name)
-
-            for tag in removed_tags:
-                if tag in self.global_tags:
-                    self.global_tags.remove(tag)
-
-            for tag in added_tags:
-                self.global_tags.add(tag)
-
-            # Always mark as updated if any changes were made to global_tags or prompts
-            if prompts_updated or renamed_tags or removed_tags or added_tags:
-                print("Updating UI and saving after tag changes...")
-                self.update_tag_list()
-                self.update_prompt_list(filter_category=self.current_filter_category(),
-                                        filter_tag=self.current_filter_tag(),
-                                        search_term=self.searchBar.text(),
-                                        filter_favorites=self.is_favorites_filter_active())
-                self.save_prompts()
-            else:
-                print("No changes detected in tags.")
+            print("Updating UI and saving after tag changes...")
+            with self.events.batch():
+                # Apply renames and removals to existing prompts
+                for prompt_id, record in list(self.prompts.items()):
+                    current_prompt_tags = set(record.tags)
+                    new_prompt_tags = set()
+                    tags_changed_for_prompt = False
+
+                    for tag in current_prompt_tags:
+                        if tag in removed_tags:
+                            tags_changed_for_prompt = True
+                            continue
+                        elif tag in renamed_tags:
+                            new_prompt_tags.add(renamed_tags[tag])
+                            tags_changed_for_prompt = True
+                        else:
+                            new_prompt_tags.add(tag)
+
+                    if tags_changed_for_prompt:
+                        sorted_new_tags = sorted(list(new_prompt_tags))
+                        self.prompts[prompt_id] = record.replace(tags=sorted_new_tags)
+                        self._record_prompt_change(prompt_id)
+                        print(f"Tags updated for Prompt ID {prompt_id}: {sorted_new_tags}")
+
+                # Update global_tags based on changes from the dialog
+                for old_name, new_name in renamed_tags.items():
+                    if old_name in self.global_tags:
+                        self.global_tags.remove(old_name)
+                    self.global_tags.add(new_name)
+                    self.events.tag_renamed(old_name, new_name)
+
+                for tag in removed_tags:
+                    if tag in self.global_tags:
+                        self.global_tags.remove(tag)
+                    self.events.tag_removed(tag)
+
+                for tag in added_tags:
+                    self.global_tags.add(tag)
+                if added_tags:
+                    self.events.tags_changed()
         else:
             print("Tag management cancelled.")
 
@@ -916,7 +1361,7 @@ class PromptManager(QWidget):
             return
 
         data = self.current_editor_instance.getPromptData()
-        if not data['title']:
+        if not data.title:
             QMessageBox.warning(self, "Missing Title", "Prompt title cannot be empty.")
             return
 
@@ -925,39 +1370,30 @@ class PromptManager(QWidget):
         if prompt_id is None: # This is an add operation
             prompt_id = self.next_id
             self.next_id += 1
-            self.prompts[prompt_id] = {'data': data, 'history': [data]}
+            self.prompts[prompt_id] = PromptRecord.from_version(prompt_id, data)
+            self._record_prompt_change(prompt_id, new_history=True)
             print(f"New prompt ID {prompt_id} added from panel.")
         else: # This is an edit operation
             if prompt_id not in self.prompts:
                 QMessageBox.critical(self, "Error", f"Could not find prompt with ID {prompt_id} to save.")
                 return
 
-            current_data = self.prompts[prompt_id]['data']
-            history = self.prompts[prompt_id]['history']
+            current_data = self.prompts[prompt_id]
             
-            data_changed = data != current_data
+            data_changed = data != current_data.version()
 
             if self.current_editor_instance.history_purged:
-                self.prompts[prompt_id]['history'] = [data]
-                self.prompts[prompt_id]['data'] = data
+                self.prompts[prompt_id] = PromptRecord.from_version(prompt_id, data, current_data.rev)
+                self._record_prompt_change(prompt_id, new_history=True)
                 print(f"History purged and updated for ID {prompt_id} from panel.")
             elif data_changed:
-                self.prompts[prompt_id]['data'] = data
-                if not self.prompts[prompt_id]['history'] or data != self.prompts[prompt_id]['history'][-1]:
-                    self.prompts[prompt_id]['history'].append(data)
-                    print(f"New version added to history for ID {prompt_id} from panel.")
-                else:
-                    print(f"Data identical to last history version for ID {prompt_id}, history not modified from panel.")
+                # The current version is always the last one of the history, so any change is a new version
+                self.prompts[prompt_id] = PromptRecord.from_version(prompt_id, data, current_data.rev)
+                self._record_prompt_change(prompt_id, past_version=current_data)
+                print(f"New version added to history for ID {prompt_id} from panel.")
             else:
                 print(f"No changes detected for ID {prompt_id}, history not modified from panel.")
 
-        self.update_category_list()
-        self.update_tag_list()
-        self.update_prompt_list(filter_category=self.current_filter_category(),
-                                filter_tag=self.current_filter_tag(),
-                                search_term=self.searchBar.text(),
-                                filter_favorites=self.is_favorites_filter_active())
-        self.save_prompts()
         self.clear_editor_panel()
         self.show_editor_panel(False) # Hide the panel after saving
         print("Prompt saved and panel closed.")
@@ -0,0 +1,165 @@
+import sys
+
+NO_CATEGORY = 'No category'
+
+# Keys of the JSON data object that map to a field of PromptVersion
+DATA_KEYS = ('title', 'prompt', 'note', 'category', 'tags', 'favorite')
+
+
+def _text(data, key):
+    value = data.get(key)
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+# Content-hash table of field values: equal texts passed through intern() come back as one shared
+# string object. Unlike sys.intern(), the texts are released together with the pool.
+class TextPool:
+    __slots__ = ('_texts',)
+
+    def __init__(self):
+        self._texts = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def intern(self, value):
+        if value.__class__ is not str or not value:
+            return value
+        return self._texts.setdefault(value, value)
+
+    def intern_fields(self, data):
+        # Copy of data (a dict of field values) holding the pooled strings
+        return {key: self.intern(value) for key, value in data.items()}
+
+
+# The content of a prompt at one point in time: its current data, or one of its past versions.
+# Versions are never modified once created, a change creates a new one with replace(). This keeps
+# them safe to share with the writer thread and the history without copying.
+# Categories and tags are interned, so each distinct name is stored once however many prompts use it.
+class PromptVersion:
+    __slots__ = ('title', '_prompt', '_note', 'category', 'tags', 'favorite', 'extra')
+
+    def __init__(self, title='', prompt='', note='', category=NO_CATEGORY, tags=(), favorite=False, extra=None):
+        self.title = title
+        # prompt and note may also be objects with a read() method (binary_snapshot.SnapshotText),
+        # read on first access
+        self._prompt = prompt
+        self._note = note
+        self.category = sys.intern(category) if category else NO_CATEGORY
+        self.tags = tuple(sys.intern(tag) for tag in tags)
+        self.favorite = favorite
+        self.extra = extra or None # Keys of the JSON data object that have no field of their own
+
+    @property
+    def prompt(self):
+        value = self._prompt
+        if value.__class__ is not str:
+            value = self._prompt = value.read()
+        return value
+
+    @property
+    def note(self):
+        value = self._note
+        if value.__class__ is not str:
+            value = self._note = value.read()
+        return value
+
+    def _fields(self):
+        # Constructor arguments; prompt and note are passed on as they are, read or not
+        return {'title': self.title, 'prompt': self._prompt, 'note': self._note, 'category': self.category,
+                'tags': self.tags, 'favorite': self.favorite, 'extra': self.extra}
+
+    def _content(self):
+        return (self.title, self.prompt, self.note, self.category, self.tags, self.favorite, self.extra)
+
+    def replace(self, **changes):
+        fields = self._fields()
+        fields.update(changes)
+        return self._with_fields(fields)
+
+    def _with_fields(self, fields):
+        return PromptVersion(**fields)
+
+    def version(self):
+        return PromptVersion(**self._fields())
+
+    def changed_fields(self, other):
+        # Names of the fields (constructor arguments) whose values differ from those of other.
+        # A text not read yet is only read when other holds a different object for it.
+        other_fields = other._fields()
+        changed = set()
+        for name, value in self._fields().items():
+            other_value = other_fields[name]
+            if value is other_value:
+                continue
+            if name in ('prompt', 'note'):
+                value, other_value = getattr(self, name), getattr(other, name)
+            if value != other_value:
+                changed.add(name)
+        return frozenset(changed)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._content() == other._content()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+    # Adapters for the JSON schema of the data object (see prompts_data_sample.json)
+
+    @classmethod
+    def from_dict(cls, data, pool=None, **kwargs):
+        # pool: TextPool sharing the prompt and note with equal ones already read.
+        # kwargs: the additional constructor arguments of cls (id for a PromptRecord)
+        extra = {key: value for key, value in data.items() if key not in DATA_KEYS}
+        tags = data.get('tags')
+        tags = [tag for tag in tags if isinstance(tag, str)] if isinstance(tags, (list, tuple)) else ()
+        prompt = _text(data, 'prompt')
+        note = _text(data, 'note')
+        if pool is not None:
+            prompt = pool.intern(prompt)
+            note = pool.intern(note)
+        return cls(title=_text(data, 'title'), prompt=prompt, note=note,
+                   category=_text(data, 'category') or NO_CATEGORY, tags=tags,
+                   favorite=bool(data.get('favorite', False)), extra=extra, **kwargs)
+
+    def to_dict(self):
+        data = {
+            'title': self.title,
+            'prompt': self.prompt,
+            'category': self.category,
+            'tags': list(self.tags),
+            'favorite': self.favorite,
+            'note': self.note
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+# A prompt of the vault: its ID and current version.
+# rev counts the changes made to the prompt; instances sharing a vault use it to tell whether a
+# change was made on top of the version they have (see prompt_storage.journal_record_applies).
+class PromptRecord(PromptVersion):
+    __slots__ = ('id', 'rev')
+
+    def __init__(self, id, rev=0, **fields):
+        super().__init__(**fields)
+        self.id = id
+        self.rev = rev
+
+    @classmethod
+    def from_version(cls, id, version, rev=0):
+        return cls(id, rev, **version._fields())
+
+    def _with_fields(self, fields):
+        rev = fields.pop('rev', self.rev)
+        return PromptRecord(self.id, rev, **fields)
+
+    def _content(self):
+        return (self.id,) + super()._content()
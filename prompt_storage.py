@@ -0,0 +1,584 @@
+import json
+import os
+import shutil
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+from binary_snapshot import BinarySnapshot, read_stamp, write_snapshot
+from history_codec import encode_history, entries_size
+from prompt_model import PromptRecord, TextPool
+from snapshot_reader import JsonSnapshotReader
+
+# Number of journal records after which the journal is folded into a new snapshot
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# Number of prompts handed to the on_batch callback of load() at a time
+LOAD_BATCH_SIZE = 1000
+
+
+def normalize_prompt_entry(entry):
+    # Returns a normalized {'data': ...} entry, or None if the structure is invalid.
+    # Older files also embed a 'history' list, which is kept for the migration to history files.
+    if not isinstance(entry, dict) or not isinstance(entry.get('data'), dict):
+        return None
+    if 'category' not in entry['data'] or not entry['data']['category']:
+        entry['data']['category'] = 'No category'
+    if 'favorite' not in entry['data']:
+        entry['data']['favorite'] = False
+    for history_entry in entry.get('history', []):
+        if 'favorite' not in history_entry:
+            history_entry['favorite'] = False
+    return entry
+
+
+def past_versions_from_history(history, data):
+    # The last version of a full history is the current data, which is not stored twice
+    if history and history[-1] == data:
+        return history[:-1]
+    return list(history)
+
+
+def fsync_directory(path):
+    # Makes a rename within the directory durable; not supported (nor needed) on Windows
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomically(path, write):
+    # Writes into a temporary file next to path, then renames it over path, so a crash
+    # leaves either the old or the new file on disk, never a truncated one
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def file_stamp(path):
+    # (mtime, size) of a file, or None if it does not exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def locked_file(path):
+    # Exclusive lock shared by the PromptVault instances using the same vault. Advisory only, and
+    # skipped where the lock file cannot be created (read-only directory) or locking is unsupported.
+    try:
+        f = open(path, 'a+b')
+    except OSError:
+        yield
+        return
+    with f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Collects prompts as load() reads them and passes them on in batches of LOAD_BATCH_SIZE.
+# on_batch(prompts, done, total) receives {prompt_id: PromptRecord} and the progress, in whatever
+# unit the storage counts (records or bytes).
+class LoadBatches:
+    def __init__(self, on_batch, batch_size=LOAD_BATCH_SIZE):
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.batch = {}
+        self.done = self.total = 0
+
+    def add(self, prompt_id, entry, done, total):
+        if self.on_batch is None:
+            return
+        self.batch[prompt_id] = entry
+        self.done, self.total = done, total
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.on_batch is not None and self.batch:
+            self.on_batch(self.batch, self.done, self.total)
+            self.batch = {}
+
+
+def _record_rev(record, current):
+    # Records written before revisions existed count as one change
+    if 'rev' in record:
+        return record['rev']
+    return current.rev + 1 if current is not None else 0
+
+
+def prompt_from_journal_record(record, current, pool=None):
+    # The PromptRecord written by a put or update record, or None if its data is invalid.
+    # current: the prompt as stored so far (None if absent)
+    entry = normalize_prompt_entry({'data': record['data']})
+    if entry is None:
+        return None
+    return PromptRecord.from_dict(entry['data'], pool, id=int(record['id']), rev=_record_rev(record, current))
+
+
+def _version_key(prompt):
+    return prompt.rev, json.dumps(prompt.to_dict(), ensure_ascii=False, sort_keys=True)
+
+
+def journal_record_applies(current, record, candidate=None):
+    # Whether a put/update/delete record replaces current, the prompt as stored so far (None if
+    # absent); candidate is the prompt written by a put or update. Records name the revision they
+    # were made on. When two instances changed a prompt concurrently, every instance (and every
+    # later load) keeps the same version: the higher revision, then the greater content.
+    if 'base_rev' not in record or current is None:
+        # Written before revisions existed, or an update of a prompt deleted meanwhile, which brings it back
+        return record['op'] != 'delete' or current is not None
+    if current.rev == record['base_rev']:
+        return True
+    if record['op'] == 'delete':
+        # Changed since the other instance deleted it: the change is kept
+        return False
+    return _version_key(candidate) > _version_key(current)
+
+
+def apply_journal_record(state, record, legacy_histories, pool=None):
+    # legacy_histories collects the past versions found in records written before history files existed;
+    # pool is the TextPool of the load, if any
+    op = record.get('op')
+    if op == 'meta':
+        # next_id never goes back, even when another instance wrote the last meta record
+        state['next_id'] = max(state['next_id'], record.get('next_id', state['next_id']))
+        state['categories'] = list(record.get('categories', state['categories']))
+        state['global_tags'] = list(record.get('global_tags', state['global_tags']))
+        return
+
+    prompt_id = int(record['id'])
+    prompts = state['prompts']
+    current = prompts.get(prompt_id)
+    if op == 'put':
+        entry = normalize_prompt_entry({'data': record['data'], 'history': record.get('history', [])})
+        if entry is None:
+            return
+        prompt = prompt_from_journal_record(record, current, pool)
+        if not journal_record_applies(current, record, prompt):
+            return
+        if 'history' in record:
+            legacy_histories[prompt_id] = past_versions_from_history(entry['history'], entry['data'])
+        else:
+            legacy_histories.pop(prompt_id, None)
+        prompts[prompt_id] = prompt
+    elif op == 'update':
+        if current is None and 'base_rev' not in record:
+            print(f"Warning: Journal update for unknown prompt ID '{prompt_id}', ignored.")
+            return
+        prompt = prompt_from_journal_record(record, current, pool)
+        if prompt is None or not journal_record_applies(current, record, prompt):
+            return
+        if 'history_append' in record and prompt_id in legacy_histories:
+            legacy_histories[prompt_id].append(current.to_dict())
+        prompts[prompt_id] = prompt
+    elif op == 'delete':
+        if journal_record_applies(current, record):
+            prompts.pop(prompt_id, None)
+            legacy_histories.pop(prompt_id, None)
+    else:
+        print(f"Warning: Unknown journal operation '{op}', ignored.")
+
+
+# Snapshot file plus an append-only journal of the changes made since that snapshot.
+# Past versions of each prompt live in their own file under the history directory and
+# are only read when a prompt is opened in the editor.
+# With binary_snapshot, every snapshot is also written in the binary format of binary_snapshot.py,
+# which load() maps instead of parsing the JSON file as long as both describe the same snapshot.
+# Several instances can share the files: writes are serialized by a lock file, journal records
+# are numbered across instances, and read_changes() returns what the others appended.
+class JsonPromptStorage:
+    compact_threshold = JOURNAL_COMPACT_THRESHOLD
+
+    def __init__(self, data_file, binary_snapshot=True):
+        self.data_file = data_file
+        base_name = os.path.splitext(data_file)[0]
+        self.journal_file = base_name + '.journal'
+        # The journal folded into the last snapshot, kept for the instances that had not read it all
+        self.previous_journal_file = base_name + '.journal.old'
+        self.lock_file = base_name + '.lock'
+        self.history_dir = base_name + '.history'
+        self.binary_file = base_name + '.snapshot' if binary_snapshot else None
+        self.origin = uuid.uuid4().hex[:12] # Tells the records of this instance from the others' in the journal
+        self.journal_seq = 0 # Sequence number of the last record written to (or read from) the journal
+        self.journal_records = 0 # Records currently in the journal, i.e. not yet folded into the snapshot
+        self.journal_offset = 0 # Bytes of the journal read or written so far
+        # Set by load() when the snapshot must be rewritten: older format, or missing binary snapshot
+        self.snapshot_outdated = False
+        self._snapshot_stamp = None # file_stamp() of the snapshot the journal offset refers to
+        self._unread = [] # Records of other instances read while writing, for read_changes()
+        self._resync_needed = False
+        self._lock = threading.RLock() # The writer thread and the GUI both use the storage
+
+    def watched_files(self):
+        # Files changed by the other instances sharing the vault
+        return [self.data_file, self.journal_file]
+
+    def has_external_changes(self):
+        # Whether the watched files may hold changes read_changes() has not returned yet, rather than
+        # only the journal appends and compactions of this instance. Takes no lock: the GUI calls it
+        # on every change to the files, while the writer thread may be updating what it compares.
+        journal_stamp = file_stamp(self.journal_file)
+        journal_size = journal_stamp[1] if journal_stamp is not None else 0
+        return (bool(self._unread) or self._resync_needed or journal_size != self.journal_offset
+                or file_stamp(self.data_file) != self._snapshot_stamp)
+
+    def _open_binary_snapshot(self):
+        # The binary snapshot is only used if it was written from the current JSON snapshot
+        if self.binary_file is None:
+            return None
+        stamp = read_stamp(self.binary_file)
+        try:
+            stat = os.stat(self.data_file)
+        except OSError:
+            return None
+        if stamp is None or stamp[:2] != (stat.st_mtime_ns, stat.st_size):
+            return None
+        try:
+            return BinarySnapshot(self.binary_file)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Warning: Could not open {self.binary_file}, reading {self.data_file} instead: {e}")
+            return None
+
+    def load(self, on_batch=None):
+        # Returns the state of the vault, with state['prompts'] mapping IDs to PromptRecords.
+        # on_batch, if given, is called with batches of the prompts read from the snapshot
+        # (see LoadBatches) while the rest is still being read
+        with self._lock:
+            return self._load(on_batch)
+
+    def _load(self, on_batch):
+        state = {'next_id': 0, 'prompts': {}, 'categories': [], 'global_tags': []}
+        legacy_histories = {}
+        snapshot_seq = 0
+        self.snapshot_outdated = False
+        self._snapshot_stamp = None
+        batches = LoadBatches(on_batch)
+        # Shares equal prompt bodies and notes between the prompts read (copies, imports)
+        pool = TextPool()
+
+        snapshot = self._open_binary_snapshot()
+        if snapshot is not None:
+            self._snapshot_stamp = (snapshot.source_mtime_ns, snapshot.source_size)
+            meta = snapshot.meta()
+            state['next_id'] = meta['next_id']
+            state['categories'] = meta['categories']
+            state['global_tags'] = meta['global_tags']
+            snapshot_seq = snapshot.journal_seq
+            for done, (prompt_id, record) in enumerate(snapshot.prompts(), 1):
+                state['prompts'][prompt_id] = record
+                batches.add(prompt_id, record, done, snapshot.count)
+        elif os.path.exists(self.data_file):
+            self.snapshot_outdated = self.binary_file is not None
+            snapshot_seq = self._load_json_snapshot(state, legacy_histories, batches, pool)
+        batches.flush()
+
+        self.journal_seq = snapshot_seq
+        self.journal_records = 0
+        self._unread = []
+        self._resync_needed = False
+        with locked_file(self.lock_file):
+            if file_stamp(self.data_file) != self._snapshot_stamp:
+                # Another instance compacted while the snapshot was read; its journal is gone,
+                # the changes are picked up by read_changes()
+                self._resync_needed = True
+            records, self.journal_offset = self._read_journal(self.journal_file)
+        for record in records:
+            seq = record.get('seq', 0)
+            if seq <= snapshot_seq:
+                # Already folded into the snapshot (compaction interrupted before the journal was cleared)
+                continue
+            try:
+                apply_journal_record(state, record, legacy_histories, pool)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Warning: Invalid journal record {seq}, ignored: {e}")
+                continue
+            self.journal_seq = max(self.journal_seq, seq)
+            self.journal_records += 1
+
+        if self.journal_records:
+            print(f"Replayed {self.journal_records} journal record(s) from {self.journal_file}.")
+
+        if legacy_histories:
+            # Move the histories embedded by older versions into history files; the caller then
+            # compacts so the snapshot no longer carries them, empty ones included
+            self.snapshot_outdated = True
+            legacy_histories = {prompt_id: past_versions for prompt_id, past_versions in legacy_histories.items()
+                                if past_versions}
+        if legacy_histories:
+            size_before = size_after = 0
+            for prompt_id, past_versions in legacy_histories.items():
+                entries = encode_history(past_versions)
+                self.write_history(prompt_id, entries)
+                size_before += entries_size(past_versions)
+                size_after += entries_size(entries)
+            print(f"Moved the history of {len(legacy_histories)} prompt(s) to {self.history_dir} "
+                  f"({size_before} bytes as full copies, {size_after} bytes stored).")
+        return state
+
+    def _load_json_snapshot(self, state, legacy_histories, batches, pool):
+        # Returns the journal seq stored in the snapshot. Damaged prompt entries are skipped one by
+        # one; the file is then copied aside, since the next compaction will leave them out.
+        snapshot_seq = 0
+        damaged = False
+        reader = JsonSnapshotReader(self.data_file)
+        self._snapshot_stamp = (reader.stat.st_mtime_ns, reader.stat.st_size)
+        try:
+            for kind, key, value in reader.entries():
+                if kind == 'field':
+                    if key == 'journal_seq':
+                        snapshot_seq = value
+                    elif key in ('next_id', 'categories', 'global_tags'):
+                        state[key] = value
+                    continue
+                if kind == 'invalid':
+                    print(f"Warning: Damaged prompt entry {key!r}... in {self.data_file}, ignored: {value}")
+                    damaged = True
+                    continue
+                try:
+                    prompt_id = int(key)
+                except ValueError:
+                    print(f"Warning: Invalid prompt key '{key}', ignored.")
+                    continue
+                entry = normalize_prompt_entry(value)
+                if entry is None:
+                    print(f"Warning: Invalid structure for prompt ID '{key}', ignored.")
+                    continue
+                if 'history' in entry:
+                    legacy_histories[prompt_id] = past_versions_from_history(entry['history'], entry['data'])
+                rev = entry.get('rev', 0)
+                state['prompts'][prompt_id] = PromptRecord.from_dict(entry['data'], pool, id=prompt_id, rev=rev)
+                batches.add(prompt_id, state['prompts'][prompt_id], reader.bytes_read, reader.size)
+        except ValueError as e:
+            # Keep whatever could be read before the damage
+            print(f"Warning: {self.data_file} is damaged, only {len(state['prompts'])} prompt(s) could be read: {e}")
+            damaged = True
+        finally:
+            reader.close()
+
+        if damaged:
+            damaged_copy = os.path.splitext(self.data_file)[0] + '.damaged.json'
+            shutil.copyfile(self.data_file, damaged_copy)
+            print(f"Copied the damaged file to {damaged_copy}.")
+        return snapshot_seq
+
+    def _read_journal(self, path, offset=0):
+        # (records, end offset) of a journal file from offset on. Called with the lock file held,
+        # so a last line without its newline was torn by a crash, not being written.
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                content = f.read()
+        except FileNotFoundError:
+            return [], 0
+        records = []
+        for line in content.split(b"\n"):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                record = None
+            if not isinstance(record, dict):
+                # Most likely a write torn by a crash, only that record is lost
+                print(f"Warning: Corrupted journal line in {path}, ignored.")
+                continue
+            records.append(record)
+        return records, offset + len(content)
+
+    def _read_others(self):
+        # Collects the records appended by other instances since the journal was last read.
+        # Called with self._lock and the lock file held.
+        stamp = file_stamp(self.data_file)
+        journal_size = file_stamp(self.journal_file)[1] if os.path.exists(self.journal_file) else 0
+        if stamp == self._snapshot_stamp and journal_size >= self.journal_offset:
+            records, self.journal_offset = self._read_journal(self.journal_file, self.journal_offset)
+        else:
+            # Another instance compacted: the rest of the journal read so far is in the previous one.
+            # Records are numbered without gaps, a gap means it compacted more than once meanwhile.
+            previous, _ = self._read_journal(self.previous_journal_file)
+            current, self.journal_offset = self._read_journal(self.journal_file)
+            records = [record for record in previous + current if record.get('seq', 0) > self.journal_seq]
+            if records and records[0].get('seq', 0) > self.journal_seq + 1:
+                self._resync_needed = True
+            self._snapshot_stamp = stamp
+        for record in records:
+            self.journal_seq = max(self.journal_seq, record.get('seq', 0))
+            if record.get('origin') != self.origin:
+                self._unread.append(record)
+
+    def read_changes(self):
+        # Records appended to the journal by other instances since the last call, oldest first.
+        # Returns None when some were folded into a snapshot before they could be read (another
+        # instance compacted twice meanwhile); the caller then compares with a fresh load().
+        with self._lock, locked_file(self.lock_file):
+            self._read_others()
+            records, self._unread = self._unread, []
+            if self._resync_needed:
+                self._resync_needed = False
+                return None
+            return records
+
+    def _history_file(self, prompt_id):
+        return os.path.join(self.history_dir, f"{prompt_id}.jsonl")
+
+    def read_history(self, prompt_id):
+        # Encoded entries (see history_codec) of the past versions of a prompt, oldest first
+        path = self._history_file(prompt_id)
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    entry = None
+                if not isinstance(entry, dict):
+                    print(f"Warning: Corrupted history line in {path}, ignored.")
+                    continue
+                entries.append(entry)
+        return entries
+
+    def write_history(self, prompt_id, entries):
+        path = self._history_file(prompt_id)
+        if not entries:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(self.history_dir, exist_ok=True)
+        write_file_atomically(path, lambda f: f.writelines(_dumps(entry) + "\n" for entry in entries))
+
+    def append(self, records):
+        if not records:
+            return
+        with self._lock, locked_file(self.lock_file):
+            # Records of other instances come first, the new ones are numbered after them
+            self._read_others()
+            if any(record['op'] == 'meta' for record in records):
+                # Replaced by the meta record written now, as it will be when the journal is replayed
+                self._unread = [record for record in self._unread if record.get('op') != 'meta']
+            self._append(records)
+
+    def _append(self, records):
+        lines = []
+        history_changes = {} # prompt_id -> [drop existing history, versions to append to it]
+        for record in records:
+            prompt_id = record.get('id')
+            if record['op'] in ('put', 'delete'):
+                # New prompt, purged history or deleted prompt: any previous history is dropped
+                history_changes[prompt_id] = [True, []]
+            if 'past_version' in record:
+                record = dict(record)
+                history_changes.setdefault(prompt_id, [False, []])[1].append(record.pop('past_version'))
+            self.journal_seq += 1
+            lines.append(_dumps({'seq': self.journal_seq, 'origin': self.origin, **record}))
+
+        for prompt_id, (drop_existing, versions) in history_changes.items():
+            path = self._history_file(prompt_id)
+            if drop_existing and os.path.exists(path):
+                os.remove(path)
+            if versions:
+                os.makedirs(self.history_dir, exist_ok=True)
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.writelines(_dumps(version) + "\n" for version in versions)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        with open(self.journal_file, 'ab') as f:
+            if f.tell() > 0:
+                # Starts on a new line even after a torn write
+                lines.insert(0, "")
+            f.write(("\n".join(lines) + "\n").encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self.journal_offset = f.tell()
+        self.journal_records += len(records)
+
+    def needs_compaction(self):
+        return self.journal_records >= self.compact_threshold
+
+    def search_ids(self, search_term, case_sensitive=False):
+        # No search index for the JSON files, callers scan every prompt
+        return None
+
+    def compact(self, state):
+        # Write a full snapshot covering every journal record so far, then start a new journal.
+        # Records of other instances not read yet are folded in too, and still returned by
+        # read_changes() (state is the caller's copy).
+        with self._lock, locked_file(self.lock_file):
+            self._read_others()
+            for record in self._unread:
+                try:
+                    apply_journal_record(state, record, {})
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Warning: Invalid journal record {record.get('seq')}, ignored: {e}")
+            self._compact(state)
+
+    def _compact(self, state):
+        save_data = {
+            'next_id': state['next_id'],
+            'prompts': {str(k): {'data': v.to_dict(), 'rev': v.rev} for k, v in state['prompts'].items()},
+            'categories': state['categories'],
+            'global_tags': state['global_tags'],
+            'journal_seq': self.journal_seq
+        }
+        write_file_atomically(self.data_file, lambda f: json.dump(save_data, f, ensure_ascii=False, indent=4))
+        if self.binary_file is not None:
+            self._write_binary_snapshot(state)
+        if os.path.exists(self.journal_file):
+            os.replace(self.journal_file, self.previous_journal_file)
+        self._snapshot_stamp = file_stamp(self.data_file)
+        self.journal_offset = 0
+        self.journal_records = 0
+        self.snapshot_outdated = False
+        print(f"Journal compacted into {self.data_file}.")
+
+    def _write_binary_snapshot(self, state):
+        # The JSON file stays the reference; failing to write its binary copy only costs startup time
+        try:
+            write_snapshot(self.binary_file, state, os.stat(self.data_file), self.journal_seq)
+        except OSError as e:
+            # On Windows the file cannot be replaced while it is mapped; it is rewritten after the next start
+            print(f"Warning: Could not write {self.binary_file}: {e}")
+
+    def close(self):
+        pass
@@ -0,0 +1,123 @@
+import heapq
+import math
+import re
+from array import array
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Weight of a token in the title, prompt and note of a prompt (BM25F): a title word counts as
+# several body words
+FIELD_WEIGHTS = (3.0, 1.0, 0.5)
+# Scoring a prompt from its own text costs about as much as going through this many posting entries
+DOCUMENT_COST = 64
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokens(text):
+    return _TOKEN.findall(text)
+
+
+def weighted_tokens(fields):
+    # fields: folded (title, prompt, note). Returns (token -> weighted frequency, weighted length).
+    weights = {}
+    length = 0.0
+    for text, weight in zip(fields, FIELD_WEIGHTS):
+        field_tokens = tokens(text)
+        length += weight * len(field_tokens)
+        for token in field_tokens:
+            weights[token] = weights.get(token, 0.0) + weight
+    return weights, length
+
+
+# Inverted index from the tokens (words) of the prompts to the prompts containing them, with the
+# weighted frequency of the token in each, for BM25 relevance ranking.
+# Each version of a prompt added gets a new document number. Posting lists are only appended to:
+# the entries of the earlier versions of a prompt are skipped until the index is rebuilt.
+class TokenIndex:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._postings = {} # token -> (document numbers, weighted frequencies)
+        self._documents = [] # document number -> (prompt_id, weighted length), None once replaced
+        self._numbers = {} # prompt_id -> current document number
+        self._frequencies = {} # token -> number of prompts containing it
+        self._total_length = 0.0
+        self.entries = 0 # Posting entries in total
+        self.stale = 0 # Posting entries of replaced documents
+
+    def add(self, prompt_id, fields, old_fields=None):
+        # fields: folded (title, prompt, note) of the current version of the prompt; old_fields: those
+        # of the version added before, if any
+        if old_fields is not None:
+            self.remove(prompt_id, old_fields)
+        weights, length = weighted_tokens(fields)
+        number = len(self._documents)
+        self._documents.append((prompt_id, length))
+        self._numbers[prompt_id] = number
+        postings = self._postings
+        frequencies = self._frequencies
+        for token, weight in weights.items():
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = (array('i'), array('f'))
+            posting[0].append(number)
+            posting[1].append(weight)
+            frequencies[token] = frequencies.get(token, 0) + 1
+        self._total_length += length
+        self.entries += len(weights)
+
+    def remove(self, prompt_id, old_fields):
+        number = self._numbers.pop(prompt_id, None)
+        if number is None:
+            return
+        self._documents[number] = None
+        weights, length = weighted_tokens(old_fields)
+        for token in weights:
+            self._frequencies[token] -= 1
+        self._total_length -= length
+        self.stale += len(weights)
+
+    def _idf(self, token):
+        count = len(self._numbers)
+        frequency = self._frequencies.get(token, 0)
+        return math.log(1.0 + (count - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, prompt_ids, query_tokens, fields_of):
+        # BM25 score of each of prompt_ids for query_tokens. fields_of(prompt_id) returns the folded
+        # fields of a prompt, used instead of the posting lists when there are few prompts to score.
+        postings = self._postings # The search thread reads them while the GUI thread adds to them
+        documents = self._documents
+        count = len(self._numbers)
+        average_length = self._total_length / count if count else 1.0
+        scores = dict.fromkeys(prompt_ids, 0.0)
+        query_tokens = [token for token in set(query_tokens) if token in postings]
+        if not scores or not query_tokens:
+            return scores
+
+        def term_score(idf, weight, length):
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * length / average_length)
+            return idf * weight * (BM25_K1 + 1.0) / (weight + norm)
+
+        idfs = {token: self._idf(token) for token in query_tokens}
+        if len(scores) * DOCUMENT_COST < sum(len(postings[token][0]) for token in query_tokens):
+            for prompt_id in scores:
+                weights, length = weighted_tokens(fields_of(prompt_id))
+                scores[prompt_id] = sum(term_score(idf, weights[token], length)
+                                        for token, idf in idfs.items() if token in weights)
+            return scores
+
+        for token, idf in idfs.items():
+            numbers, weights = postings[token]
+            for number, weight in zip(numbers, weights):
+                document = documents[number]
+                if document is not None and document[0] in scores:
+                    scores[document[0]] += term_score(idf, weight, document[1])
+        return scores
+
+
+def top_ranked(records, scores, limit):
+    # The limit best scored records, best first; records with equal scores keep their order
+    return heapq.nlargest(limit, records, key=lambda record: scores.get(record.id, 0.0))
@@ -0,0 +1,102 @@
+import multiprocessing
+import re
+import time
+
+# Prompts sent to the matching process at once; cancellation is checked between two batches of them
+MATCH_BATCH_SIZE = 256
+# Compiled patterns kept by the matching process
+PATTERN_CACHE_SIZE = 16
+# Seconds the matching process may take to start, e.g. on a slow disk; not part of the search time
+START_TIMEOUT = 30.0
+
+
+def _serve(connection):
+    # Main loop of the matching process: keeps the texts of the prompts it was sent, and answers each
+    # (pattern, flags, texts, prompt_ids) request with the IDs of the prompts the pattern is found in
+    texts = {} # prompt_id -> (title, prompt, note)
+    patterns = {}
+    connection.send(None) # Ready
+    while True:
+        try:
+            pattern, flags, new_texts, prompt_ids = connection.recv()
+        except (EOFError, OSError):
+            return
+        texts.update(new_texts)
+        compiled = patterns.get((pattern, flags))
+        if compiled is None:
+            if len(patterns) >= PATTERN_CACHE_SIZE:
+                patterns.clear()
+            compiled = patterns[(pattern, flags)] = re.compile(pattern, flags)
+        search = compiled.search
+        connection.send([prompt_id for prompt_id in prompt_ids
+                         if any(search(text) is not None for text in texts[prompt_id])])
+
+
+# Searches regular expressions in the prompts from a separate process. re holds the GIL while it
+# matches, and a pattern such as (a+)+$ can take longer than the age of the universe on one prompt:
+# searched on the search thread, it would freeze the GUI too, with no way of stopping it. The matching
+# process is killed instead once out of time, and started again for the next search.
+# The process keeps the texts it was sent, only new or changed prompts are sent again.
+# Search thread only.
+class RegexMatcher:
+    def __init__(self):
+        self._process = None
+        self._connection = None
+        self._sent = {} # prompt_id -> PromptRecord whose texts the process has
+
+    def search(self, pattern, records, deadline, cancelled=None):
+        # IDs of the records (PromptRecords) with a title, prompt or note that pattern (compiled) is
+        # found in. Returns None once cancelled() is true, raises TimeoutError once time.monotonic()
+        # is past deadline.
+        if self._process is None:
+            started = time.monotonic()
+            self._start()
+            deadline += time.monotonic() - started
+        matching = set()
+        for start in range(0, len(records), MATCH_BATCH_SIZE):
+            if cancelled is not None and cancelled():
+                return None
+            batch = records[start:start + MATCH_BATCH_SIZE]
+            new_texts = {record.id: (record.title, record.prompt, record.note)
+                         for record in batch if self._sent.get(record.id) is not record}
+            try:
+                self._connection.send((pattern.pattern, pattern.flags, new_texts, [record.id for record in batch]))
+                self._sent.update((record.id, record) for record in batch)
+                answered = self._connection.poll(max(0.0, deadline - time.monotonic()))
+                if answered:
+                    matching.update(self._connection.recv())
+            except (EOFError, OSError):
+                # The process died, e.g. out of memory: the next search starts a new one
+                self.close()
+                raise
+            if not answered:
+                self.close()
+                raise TimeoutError("Regular expression search out of time")
+        return matching
+
+    def close(self):
+        # Stops the matching process, whatever it is doing
+        if self._process is None:
+            return
+        self._connection.close()
+        self._process.kill()
+        self._process.join()
+        self._process = None
+        self._connection = None
+        self._sent = {}
+
+    def _start(self):
+        # spawn rather than fork: the GUI process runs several threads, a forked copy of it could
+        # inherit a lock held by one of them
+        context = multiprocessing.get_context('spawn')
+        self._connection, connection = context.Pipe()
+        self._process = context.Process(target=_serve, args=(connection,), name="PromptVaultRegex", daemon=True)
+        self._process.start()
+        connection.close()
+        try:
+            if not self._connection.poll(START_TIMEOUT):
+                raise OSError("The regular expression search process did not start")
+            self._connection.recv()
+        except (EOFError, OSError):
+            self.close()
+            raise
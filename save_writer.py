@@ -0,0 +1,182 @@
+import threading
+import time
+
+# Changes submitted within this many seconds of each other are written together
+SAVE_DELAY = 0.3
+# Upper bound on how long a continuous burst of changes can postpone a write
+MAX_SAVE_DELAY = 2.0
+
+
+def _read_changes(storage):
+    # (records appended by the other instances sharing the vault, None), or (None, a fresh load() of
+    # the vault) when some were compacted before they could be read (see storage.read_changes())
+    try:
+        records = storage.read_changes()
+        if records is not None:
+            return records, None
+        print("Changes made by another instance were compacted before they could be read, comparing with the vault.")
+        return None, storage.load()
+    except (IOError, ValueError) as e:
+        print(f"Warning: Could not read the changes made by another instance: {e}")
+        return [], None
+
+
+# Writes storage changes immediately on the calling thread (used for storages that
+# must stay in sync with the in-memory prompts, such as the SQLite search index)
+class SynchronousWriter:
+    def __init__(self, storage):
+        self.storage = storage
+        self.failed = False
+        self.submitted = 0 # See BackgroundWriter
+        self.written = 0
+
+    def append(self, records):
+        if not records:
+            return
+        self.storage.append(records)
+        self.submitted = self.written = self.submitted + 1
+
+    def needs_compaction(self):
+        return self.storage.needs_compaction()
+
+    def compact(self, state):
+        self.storage.compact(state)
+        self.submitted = self.written = self.submitted + 1
+
+    def read_changes(self, on_changes):
+        on_changes(*_read_changes(self.storage))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.storage.close()
+
+
+# Coalesces storage changes and writes them from a worker thread so the GUI never waits on disk I/O.
+# Everything handed to append()/compact() must not be mutated afterwards: prompt data and history
+# entries are replaced rather than edited in place, and containers are copied by the caller.
+class BackgroundWriter:
+    def __init__(self, storage, on_error=None, delay=SAVE_DELAY, max_delay=MAX_SAVE_DELAY):
+        self.storage = storage
+        self.on_error = on_error
+        self.delay = delay
+        self.max_delay = max_delay
+        self.failed = False # Set when a write failed, a full snapshot is then needed to recover
+        self.journal_records = storage.journal_records # Journal size once every queued item is written
+        # Items queued so far, and written so far (in submission order): an item queued when submitted
+        # was n is written once written > n
+        self.submitted = 0
+        self.written = 0
+
+        self._condition = threading.Condition()
+        self._items = [] # ('records', [record, ...]), ('snapshot', state) or ('read', on_changes), in submission order
+        self._first_submit = 0.0
+        self._last_submit = 0.0
+        self._busy = False
+        self._flush_requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="PromptVaultWriter", daemon=True)
+        self._thread.start()
+
+    def append(self, records):
+        if not records:
+            return
+        with self._condition:
+            self._submit(('records', list(records)))
+            self.journal_records += len(records)
+
+    def needs_compaction(self):
+        return self.journal_records >= self.storage.compact_threshold
+
+    def compact(self, state):
+        with self._condition:
+            self._submit(('snapshot', state))
+            self.journal_records = 0
+            self.failed = False
+
+    def read_changes(self, on_changes):
+        # Reads the changes of the other instances once everything queued before is written, so that
+        # our records come first in the journal, and passes them to on_changes(records, state) (see
+        # _read_changes()) on the writer thread. The read takes the lock file, which another
+        # instance may hold for a while when it compacts.
+        with self._condition:
+            self._submit(('read', on_changes))
+
+    def _submit(self, item):
+        now = time.monotonic()
+        if not self._items:
+            self._first_submit = now
+        self._last_submit = now
+        self._items.append(item)
+        self.submitted += 1
+        self._condition.notify_all()
+
+    def flush(self):
+        # Blocks until every queued change has been written
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._items or self._busy:
+                self._condition.wait()
+            self._flush_requested = False
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.storage.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._closed:
+                    self._condition.wait()
+                if not self._items:
+                    return
+                # Debounce: wait until changes stop arriving, or the burst has lasted max_delay.
+                # A read is not delayed, nor are the changes queued before it, even when it is
+                # queued during the wait.
+                while not self._flush_requested and not self._closed and not self._read_queued():
+                    deadline = min(self._last_submit + self.delay, self._first_submit + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                items, self._items = self._items, []
+                self._busy = True
+
+            try:
+                self._write(items)
+            except Exception as e:
+                self.failed = True
+                print(f"Error: Background save failed: {e}")
+                if self.on_error:
+                    self.on_error(str(e))
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self.written += len(items)
+                    self._condition.notify_all()
+
+    def _read_queued(self):
+        return any(kind == 'read' for kind, payload in self._items)
+
+    def _write(self, items):
+        records = []
+        for kind, payload in items:
+            if kind == 'read':
+                self.storage.append(records)
+                records = []
+                payload(*_read_changes(self.storage))
+            elif kind == 'snapshot':
+                # The snapshot already contains the changes queued before it; they still go to the
+                # journal first, where other instances sharing the vault read them
+                self.storage.append(records)
+                records = []
+                self.storage.compact(payload)
+            else:
+                records.extend(payload)
+        self.storage.append(records)
@@ -0,0 +1,455 @@
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+
+from facet_index import FacetIndex, bitset_ids
+from rank_index import TokenIndex, tokens, top_ranked
+from regex_matcher import RegexMatcher
+from search_query import (FacetTerm, FavoriteTerm, Or, RegexTerm, conjuncts, make_and, make_or, parse_query,
+                          positive_terms, regex_query)
+from similarity_index import SimilarityIndex
+from title_index import TitleIndex
+
+# Length of the substrings indexed; shorter search terms are matched by scanning every prompt
+TRIGRAM_LENGTH = 3
+# Checking the text of a candidate costs about as much as going through this many posting entries,
+# so intersecting stops once the remaining lists are longer than that many times the candidates
+CHECK_COST = 32
+# Prompts indexed between two checks of the time budget given to build()
+BUILD_CHECK_INTERVAL = 256
+# Prompts checked by filter_prompts() between two checks for cancellation
+CANCEL_CHECK_INTERVAL = 1024
+# A regular expression search is stopped after this many seconds, see SearchTimeout
+REGEX_TIME_BUDGET = 2.0
+# Number of recent search results kept to narrow down the next searches (see ResultCache)
+RESULT_CACHE_SIZE = 16
+# Relevance order only shows this many of the best matches
+RANKED_RESULTS_LIMIT = 200
+# A cached result this small is refined without looking at the trigram index for fewer candidates
+SMALL_RESULT_SIZE = 256
+# Joins the title, prompt and note in the search text of a prompt, so that a term never matches
+# across two fields; it cannot be typed in the search bar
+FIELD_SEPARATOR = '\x00'
+
+_combining_marks = None # str.translate table deleting every combining mark, built when first needed
+
+
+def _strip_combining_marks(text):
+    global _combining_marks
+    if _combining_marks is None:
+        _combining_marks = dict.fromkeys(cp for cp in range(sys.maxunicode + 1) if unicodedata.combining(chr(cp)))
+    return unicodedata.normalize('NFD', text).translate(_combining_marks)
+
+
+def fold_text(text, fold_accents=False):
+    # Case-insensitive form of text (Unicode case folding, e.g. 'Straße' -> 'strasse'),
+    # also without accents when fold_accents is set ('Café' -> 'cafe')
+    text = text.casefold()
+    if fold_accents and not text.isascii():
+        text = _strip_combining_marks(text)
+    return text
+
+
+def trigrams(text):
+    return set(map(''.join, zip(text, text[1:], text[2:])))
+
+
+# Search texts of the prompts, an inverted index from their trigrams to the IDs of the prompts
+# containing them, the tokens of the prompts for relevance ranking (see rank_index), the facets
+# (categories, tags, favorites) of the prompts, their MinHash signatures (see similarity_index), and
+# their display order (see title_index).
+# The search text of a prompt is its folded title, prompt and note, computed once per version of the
+# prompt so that case-insensitive searches compare against it directly. The index only narrows a
+# search down: a prompt containing a term contains all of its trigrams, but the candidates still have
+# to be checked against the term itself.
+# Reading every prompt body takes a while on a large vault, so the texts, trigrams and signatures are
+# built a slice at a time by build() and the index is only used once complete; update() and remove()
+# keep them current meanwhile. The facets are cheap to build and always complete.
+# Posting lists are only appended to: trigrams that a prompt lost stay in them until the index is
+# rebuilt, and only cost a candidate that fails the final check.
+# Changes are made on the GUI thread while searches may run on the search thread: cached search texts
+# are replaced along with their PromptRecord, and a search over prompts that changed meanwhile is
+# dropped by the caller anyway.
+class SearchIndex:
+    def __init__(self, fold_accents=False):
+        self.fold_accents = fold_accents
+        self.revision = 0 # Incremented whenever the prompts change, see prompts_changed()
+        self.results = ResultCache()
+        self.facets = FacetIndex()
+        self.tokens = TokenIndex()
+        self.similarity = SimilarityIndex()
+        self.titles = TitleIndex()
+        self.regex_matcher = RegexMatcher() # Used by the search thread, see filter_prompts()
+        self.reset()
+        self.ready = False # No text is indexed until reset() is given the loaded prompts
+
+    def prompts_changed(self):
+        # Called for every change to the prompts; search results computed before are out of date
+        self.revision += 1
+
+    def prompts_loaded(self, prompts):
+        # A batch of prompts from the loader: only the facets are kept up to date until reset()
+        self.prompts_changed()
+        self.facets.add(prompts)
+
+    def reset(self, prompts=None, fold_accents=None):
+        # Starts over with prompts (prompt_id -> PromptRecord, e.g. once the vault is loaded)
+        prompts = prompts if prompts is not None else {}
+        self.prompts_changed()
+        if fold_accents is not None:
+            self.fold_accents = fold_accents
+        self.facets.reset(prompts)
+        self.titles.reset(prompts)
+        self.similarity.reset()
+        self._reset_texts(prompts)
+
+    def _reset_texts(self, prompt_ids):
+        self.ready = False
+        self._postings = {} # trigram -> array of prompt IDs
+        self._texts = {} # prompt_id -> (PromptRecord as indexed, its search text)
+        self._unindexed = list(prompt_ids)
+        self._unindexed.reverse()
+        self._entries = 0 # Posting entries in total
+        self._stale = 0 # Posting entries of trigrams their prompt no longer contains
+        self.tokens.reset()
+        self.ready = not self._unindexed
+
+    def fold(self, text):
+        return fold_text(text, self.fold_accents)
+
+    def _search_text(self, record):
+        return FIELD_SEPARATOR.join((self.fold(record.title), self.fold(record.prompt), self.fold(record.note)))
+
+    def search_text(self, record):
+        # What a folded search term is looked for in; cached for the indexed version of each prompt
+        cached = self._texts.get(record.id)
+        if cached is not None and cached[0] is record:
+            return cached[1]
+        return self._search_text(record)
+
+    def build(self, prompts, time_budget=None):
+        # Indexes the prompts given to reset(), for at most time_budget seconds.
+        # prompts: prompt_id -> current PromptRecord. Returns whether the index is complete.
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        unindexed = self._unindexed
+        while unindexed:
+            for prompt_id in unindexed[-BUILD_CHECK_INTERVAL:]:
+                record = prompts.get(prompt_id)
+                # Prompts changed since reset() were indexed by update(), deleted ones are left out
+                if record is not None and prompt_id not in self._texts:
+                    text = self._search_text(record)
+                    self._add(prompt_id, trigrams(text))
+                    self.tokens.add(prompt_id, text.split(FIELD_SEPARATOR))
+                    self.similarity.update(prompt_id, record)
+                    self._texts[prompt_id] = (record, text)
+            del unindexed[-BUILD_CHECK_INTERVAL:]
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self.ready = not unindexed
+        return self.ready
+
+    def candidates(self, search_term):
+        # IDs of the prompts that may contain search_term (a superset, may include deleted IDs),
+        # or None when the index cannot tell: the term is too short or the index is incomplete
+        key = self.fold(search_term)
+        index = self._postings # Read before ready, reset() clears ready before replacing it
+        if len(key) < TRIGRAM_LENGTH or not self.ready:
+            return None
+
+        postings = []
+        for trigram in trigrams(key):
+            posting = index.get(trigram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result or len(posting) > CHECK_COST * len(result):
+                break
+            result.intersection_update(posting)
+        return result
+
+    def _add(self, prompt_id, new_trigrams):
+        postings = self._postings
+        for trigram in new_trigrams:
+            posting = postings.get(trigram)
+            if posting is None:
+                posting = postings[trigram] = array('i')
+            posting.append(prompt_id)
+        self._entries += len(new_trigrams)
+
+    def update(self, prompt_id, record):
+        # record is the new current version of the prompt (added, edited or imported)
+        self.prompts_changed()
+        self.facets.update(prompt_id, record)
+        self.titles.update(prompt_id, record)
+        old_text = self._texts.get(prompt_id, (None, None))[1]
+        text = self._search_text(record)
+        self._texts[prompt_id] = (record, text)
+        if text == old_text:
+            return # e.g. a favorite, category or tag change
+        self.similarity.update(prompt_id, record)
+        new_trigrams = trigrams(text)
+        old_trigrams = trigrams(old_text) if old_text is not None else set()
+        self._add(prompt_id, new_trigrams - old_trigrams)
+        self._stale += len(old_trigrams - new_trigrams)
+        self.tokens.add(prompt_id, text.split(FIELD_SEPARATOR),
+                        old_text.split(FIELD_SEPARATOR) if old_text is not None else None)
+        self._compact_if_stale()
+
+    def begin_batch(self):
+        # Changes until end_batch() are applied to the title order all at once
+        self.titles.begin_batch()
+
+    def end_batch(self):
+        self.titles.end_batch()
+
+    def remove(self, prompt_id):
+        self.prompts_changed()
+        self.facets.remove(prompt_id)
+        self.titles.remove(prompt_id)
+        self.similarity.remove(prompt_id)
+        cached = self._texts.pop(prompt_id, None)
+        if cached is not None:
+            self._stale += len(trigrams(cached[1]))
+            self.tokens.remove(prompt_id, cached[1].split(FIELD_SEPARATOR))
+            self._compact_if_stale()
+
+    def _compact_if_stale(self):
+        # Rebuilt once half the posting entries are stale, which keeps the cost of the rebuild
+        # proportional to the edits that made it necessary
+        if self.ready and (self._stale * 2 > self._entries or self.tokens.stale * 2 > self.tokens.entries):
+            records = {prompt_id: record for prompt_id, (record, text) in self._texts.items()}
+            self._reset_texts(records)
+            self.build(records)
+
+    def similar_ids(self, prompt_id):
+        # IDs of the near-duplicates of a prompt, itself included, among the prompts indexed so far;
+        # GUI thread only
+        return self.similarity.similar_ids(prompt_id)
+
+    def rank(self, records, terms, limit=RANKED_RESULTS_LIMIT):
+        # The limit records most relevant to the search terms, best first, or None when they cannot
+        # be ranked: no words searched for, or the index is incomplete
+        query_tokens = [token for term in terms for token in tokens(self.fold(term))]
+        if not query_tokens or not self.ready:
+            return None
+        by_id = {record.id: record for record in records}
+        scores = self.tokens.scores(by_id, query_tokens,
+                                    lambda prompt_id: self.search_text(by_id[prompt_id]).split(FIELD_SEPARATOR))
+        return top_ranked(records, scores, limit)
+
+
+# What the prompt list shows: the prompts matching a search bar query (see search_query) or regular
+# expression, and the category, tag and favorites selected beside it, in title or relevance order.
+# Never modified, so that searches can run on the search thread.
+class PromptFilter:
+    def __init__(self, search_index, search_term="", case_sensitive=False, categories=(), tags=(), favorites=False,
+                 ranked=False, regex=False, all_tags=False):
+        self.search_index = search_index
+        self.search_term = search_term
+        self.case_sensitive = case_sensitive
+        self.categories = sorted(categories) # Prompts of any of them
+        self.tags = sorted(tags) # Prompts with all of them if all_tags, any of them otherwise
+        self.all_tags = all_tags
+        self.favorites = favorites
+        self.ranked = ranked # Best matches first, see SearchIndex.rank(); the result cache is in title order
+        self.regex = regex
+        self.error = None # Why the search bar text is not a valid regular expression
+        # A regular expression can take arbitrarily long, it is only searched for on the search thread,
+        # by the RegexMatcher of the index
+        self.time_budget = REGEX_TIME_BUDGET if regex else None
+        # Text terms are folded once here rather than for every prompt
+        fold = (lambda text: text) if case_sensitive else search_index.fold
+        if regex:
+            try:
+                query = regex_query(search_term, case_sensitive, fold)
+            except re.error as e:
+                self.error = str(e)
+                query = Or([]) # Matches no prompt
+        else:
+            query = parse_query(search_term, fold, search_index.similar_ids)
+        self.regex_pattern = query.pattern if isinstance(query, RegexTerm) else None
+        # The selections are unions and intersections of the facet bitsets
+        selected = []
+        if self.categories:
+            selected.append(make_or([FacetTerm('category', category, exact=True) for category in self.categories]))
+        if self.tags:
+            tag_terms = [FacetTerm('tag', tag, exact=True) for tag in self.tags]
+            selected.extend(tag_terms if all_tags else [make_or(tag_terms)])
+        if favorites:
+            selected.append(FavoriteTerm())
+        self.query = make_and(selected + conjuncts(query))
+        self.revision = search_index.revision # Of the prompts this filter is applied to
+        self.key = (self.query.key, case_sensitive)
+
+    def refines(self, other):
+        # Whether every prompt matching this filter also matches other (e.g. a longer search term, an
+        # added term or facet)
+        if self.case_sensitive != other.case_sensitive:
+            return False
+        own = conjuncts(self.query)
+        return all(any(term.implies(other_term) for term in own) for other_term in conjuncts(other.query))
+
+    def plan(self, text_candidates=None):
+        # (bits, residual): the bitset of the only prompts that may match, or None for all of them, and
+        # the part of the query still to check on each of them, or None when every one of them matches.
+        # text_candidates(term): IDs of the prompts that may contain term, or None.
+        return self.query.plan(self, text_candidates or self.search_index.candidates)
+
+    def field_text(self, record, field):
+        # What a text term of field (None for any) is looked for in
+        if self.case_sensitive:
+            if field is None:
+                return FIELD_SEPARATOR.join((record.title, record.prompt, record.note))
+            return getattr(record, field)
+        text = self.search_index.search_text(record)
+        if field is None:
+            return text
+        return text.split(FIELD_SEPARATOR)[('title', 'prompt', 'note').index(field)]
+
+    def matches(self, record):
+        return self.query.matches(record, self)
+
+    def regex_matches(self, term, record):
+        # Whether the RegexTerm term is found in record; filter_prompts() searches them all at once instead
+        search = term.pattern.search
+        return search(record.title) is not None or search(record.prompt) is not None or search(record.note) is not None
+
+    def is_ranked(self):
+        # Whether the results are in relevance order rather than by title
+        return self.ranked and bool(positive_terms(self.query)) and self.search_index.ready
+
+
+# The context a regular expression query is first checked in: every RegexTerm is taken to match, the
+# prompts that pass are then searched by the RegexMatcher of the index
+class _RegexCandidates:
+    def __init__(self, prompt_filter):
+        self.prompt_filter = prompt_filter
+        self.search_index = prompt_filter.search_index
+
+    def field_text(self, record, field):
+        return self.prompt_filter.field_text(record, field)
+
+    def regex_matches(self, term, record):
+        return True
+
+
+# Recent search results, most recent last. A search refining one of them (a longer term, an added
+# filter) only checks the prompts of that result, and a search made again (e.g. after a backspace)
+# reuses its result as is. The results the latest search refines are the last ones dropped, so that
+# backspacing finds them. Results only apply to the revision of the prompts they were computed on.
+# Shared by the GUI and search threads.
+class ResultCache:
+    def __init__(self, capacity=RESULT_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = [] # (PromptFilter, its PromptRecords sorted by title)
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt_filter):
+        # (True, result) for the same search, (False, result) for the smallest result containing every
+        # match of prompt_filter, or (False, None)
+        best = None
+        with self._lock:
+            for cached_filter, records in reversed(self._entries):
+                if cached_filter.revision != prompt_filter.revision:
+                    continue
+                if cached_filter.key == prompt_filter.key:
+                    return True, records
+                if prompt_filter.refines(cached_filter) and (best is None or len(records) < len(best)):
+                    best = records
+        return False, best
+
+    def add(self, prompt_filter, records):
+        with self._lock:
+            self._entries = [(cached_filter, cached) for cached_filter, cached in self._entries
+                             if cached_filter.revision == prompt_filter.revision and cached_filter.key != prompt_filter.key]
+            if len(self._entries) >= self.capacity:
+                drop = next((i for i, (cached_filter, cached) in enumerate(self._entries)
+                             if not prompt_filter.refines(cached_filter)), 0)
+                del self._entries[drop]
+            self._entries.append((prompt_filter, records))
+
+
+# Raised by filter_prompts() once a search has taken longer than the time budget of its filter
+class SearchTimeout(Exception):
+    pass
+
+
+def filter_prompts(prompts, prompt_filter, text_candidates=None, cancelled=None):
+    # PromptRecords of prompts (prompt_id -> PromptRecord) matching prompt_filter, sorted by title, or
+    # the best of them by relevance for a ranked filter.
+    # The returned list is shared with the result cache and must not be modified.
+    # text_candidates: see PromptFilter.plan(); only called when no cached result can be refined.
+    # Returns None once cancelled() is true, raises SearchTimeout once out of time.
+    matches = _matching_prompts(prompts, prompt_filter, text_candidates, cancelled)
+    if matches is not None and prompt_filter.ranked:
+        ranked = prompt_filter.search_index.rank(matches, positive_terms(prompt_filter.query))
+        if ranked is not None:
+            return ranked
+    return matches
+
+
+def _matching_prompts(prompts, prompt_filter, text_candidates, cancelled):
+    deadline = None
+    if prompt_filter.time_budget is not None:
+        deadline = time.monotonic() + prompt_filter.time_budget
+    cache = prompt_filter.search_index.results
+    exact, base = cache.lookup(prompt_filter)
+    if exact:
+        cache.add(prompt_filter, base)
+        return base
+    records = base # Already sorted
+    residual = prompt_filter.query
+    in_order = True
+    titles = prompt_filter.search_index.titles
+    if base is None or len(base) > SMALL_RESULT_SIZE:
+        bits, plan_residual = prompt_filter.plan(text_candidates)
+        if prompt_filter.search_index.revision != prompt_filter.revision:
+            # The facets changed since the prompts were copied, they may disagree with them
+            plan_residual = prompt_filter.query
+        if bits is not None and (base is None or bits.bit_count() < len(base)):
+            residual = plan_residual
+            if residual is None and titles.covers(prompts):
+                records = titles.ordered(prompts, bitset_ids(bits))
+            else:
+                # Checked in ID order, which is close to memory order, and put in display order after
+                records = [prompts[prompt_id] for prompt_id in bitset_ids(bits) if prompt_id in prompts]
+                in_order = False
+        elif base is None:
+            records = prompts.values()
+            residual = plan_residual
+            in_order = False
+    if residual is None:
+        matches = list(records)
+    else:
+        context = _RegexCandidates(prompt_filter) if prompt_filter.regex else prompt_filter
+        matches = []
+        for count, record in enumerate(records, 1):
+            if count % CANCEL_CHECK_INTERVAL == 0 and cancelled is not None and cancelled():
+                return None
+            if residual.matches(record, context):
+                matches.append(record)
+        if prompt_filter.regex_pattern is not None and matches:
+            try:
+                matching_ids = prompt_filter.search_index.regex_matcher.search(
+                    prompt_filter.regex_pattern, matches, deadline, cancelled)
+            except TimeoutError:
+                raise SearchTimeout(f"Search stopped after {prompt_filter.time_budget:g} s") from None
+            if matching_ids is None:
+                return None
+            matches = [record for record in matches if record.id in matching_ids]
+    if records is not base:
+        # The display order is picked out of the title index rather than sorted, unless the prompts
+        # changed since they were copied and the index may disagree with them, or are still loading
+        if prompt_filter.search_index.revision != prompt_filter.revision or not titles.covers(prompts):
+            matches.sort(key=titles.sort_key)
+        elif not in_order:
+            matches = titles.ordered(prompts, [record.id for record in matches])
+    cache.add(prompt_filter, matches)
+    return matches
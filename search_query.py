@@ -0,0 +1,511 @@
+import re
+from collections import OrderedDict
+
+from facet_index import ids_bitset
+
+# Search bar queries, e.g. tag:python category:"Software Development" fav:yes -draft "exact phrase" OR title:blog
+#   word, "a phrase"         title, prompt or note contains it (case and accents as set in the search bar)
+#   title: prompt: note:     only that field contains it
+#   category: tag:           the prompt has that category or tag (whole name, case-insensitive)
+#   fav:yes, fav:no          favorites only, or no favorites
+#   similar:42               near-duplicates of prompt 42 (see similarity_index), itself included
+#   id:3,7,12                those prompts (e.g. a group of near-duplicates)
+#   -term, -(...)            negation
+#   a OR b, (...)            OR binds tighter than the implicit AND between terms: x a OR b is x (a OR b)
+# Typing never makes a query invalid: an unclosed quote or group ends with the query, and a field
+# without a value (e.g. tag: while typing) matches every prompt.
+
+# Field names accepted before a colon; any other word:value is searched for as text (e.g. URLs)
+FIELDS = {'title': 'title', 'prompt': 'prompt', 'body': 'prompt', 'note': 'note',
+          'category': 'category', 'cat': 'category', 'tag': 'tag',
+          'fav': 'favorite', 'favorite': 'favorite', 'similar': 'similar', 'id': 'id'}
+FALSE_VALUES = ('no', 'false', '0', 'n')
+# Number of compiled regular expressions kept for the searches to come
+PATTERN_CACHE_SIZE = 64
+# Once the indexed predicates leave this few prompts, the text predicates are checked on them
+# rather than looked up in the trigram index
+PLAN_SCAN_SIZE = 256
+
+_FIELD = re.compile(r'(\w+):')
+_OPEN, _CLOSE, _NOT, _OR, _AND = '(', ')', '-', 'OR', 'AND'
+
+# Ordering of the predicates of an AND, see _cost(): facets first, then text, then nested queries,
+# then regular expressions
+_FACET_RANK, _TEXT_RANK, _COMPOUND_RANK, _REGEX_RANK = 0, 1, 2, 3
+
+_REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+
+_patterns = OrderedDict() # (pattern, flags) -> compiled pattern or re.error, most recently used last
+
+
+# Query nodes. plan(context, text_candidates) returns (bits, residual): bits is a bitset of the
+# only prompts that can match (None for every prompt) and residual the part of the query still to
+# check on each of them (None when bits is exact). context is the PromptFilter the query belongs to,
+# text_candidates(term) the IDs of the prompts that may contain term, or None.
+class TextTerm:
+    def __init__(self, value, field=None):
+        self.value = value # Folded like the search texts unless the search is case-sensitive
+        self.field = field # None for title, prompt or note
+        self.key = ('text', field, value)
+
+    def matches(self, record, context):
+        return self.value in context.field_text(record, self.field)
+
+    def plan(self, context, text_candidates):
+        candidate_ids = text_candidates(self.value)
+        if candidate_ids is None:
+            return None, self
+        return ids_bitset(candidate_ids), self
+
+    def implies(self, other):
+        # A longer term of the same field only matches prompts the shorter one matches
+        return isinstance(other, TextTerm) and other.field == self.field and other.value in self.value
+
+
+# The search bar text as a regular expression (regex mode), matched against title, prompt and note
+# separately. literal is text every match contains, folded like the search texts unless the search is
+# case-sensitive: prompts without it are discarded before running the regular expression.
+class RegexTerm:
+    def __init__(self, pattern, literal=''):
+        self.pattern = pattern
+        self.literal = literal
+        self.key = ('regex', pattern.pattern, pattern.flags)
+
+    def matches(self, record, context):
+        if self.literal and self.literal not in context.field_text(record, None):
+            return False
+        return context.regex_matches(self, record)
+
+    def plan(self, context, text_candidates):
+        candidate_ids = text_candidates(self.literal) if self.literal else None
+        if candidate_ids is None:
+            return None, self
+        return ids_bitset(candidate_ids), self
+
+    def implies(self, other):
+        return other.key == self.key
+
+
+class FacetTerm:
+    def __init__(self, facet, name, exact=False):
+        self.facet = facet # 'category' or 'tag'
+        self.exact = exact # Otherwise name is case-folded and matched regardless of case
+        self.name = name if exact else name.casefold()
+        self.key = (facet, self.name, exact)
+
+    def _name_matches(self, name):
+        return name == self.name if self.exact else name.casefold() == self.name
+
+    def matches(self, record, context):
+        if self.facet == 'category':
+            return self._name_matches(record.category)
+        return any(self._name_matches(tag) for tag in record.tags)
+
+    def bits(self, context):
+        facets = context.search_index.facets
+        names = facets.categories if self.facet == 'category' else facets.tags
+        if self.exact:
+            return names.get(self.name, 0)
+        bits = 0
+        for name, name_bits in list(names.items()):
+            if name.casefold() == self.name:
+                bits |= name_bits
+        return bits
+
+    def plan(self, context, text_candidates):
+        return self.bits(context), None
+
+    def implies(self, other):
+        # A prompt of one of the categories (tags) selected has one of any more selected
+        if isinstance(other, Or):
+            return any(self.implies(child) for child in other.children)
+        return other.key == self.key
+
+
+class FavoriteTerm:
+    def __init__(self, favorite=True):
+        self.favorite = favorite
+        self.key = ('favorite', favorite)
+
+    def matches(self, record, context):
+        return record.favorite == self.favorite
+
+    def bits(self, context):
+        facets = context.search_index.facets
+        return facets.favorites if self.favorite else facets.all & ~facets.favorites
+
+    def plan(self, context, text_candidates):
+        return self.bits(context), None
+
+    def implies(self, other):
+        return other.key == self.key
+
+
+class SimilarTerm:
+    def __init__(self, prompt_id, prompt_ids):
+        self.prompt_id = prompt_id
+        self.prompt_ids = prompt_ids # Of the near-duplicates, found when the query is parsed
+        # More are found once the prompts are all indexed, a cached result is only reused for the same ones
+        self.key = ('similar', prompt_id, frozenset(prompt_ids))
+
+    def matches(self, record, context):
+        return record.id in self.prompt_ids
+
+    def bits(self, context):
+        return ids_bitset(self.prompt_ids)
+
+    def plan(self, context, text_candidates):
+        return self.bits(context), None
+
+    def implies(self, other):
+        return other.key == self.key
+
+
+class IdTerm:
+    def __init__(self, prompt_ids):
+        self.prompt_ids = frozenset(prompt_ids)
+        self.key = ('id', self.prompt_ids)
+
+    def matches(self, record, context):
+        return record.id in self.prompt_ids
+
+    def bits(self, context):
+        return ids_bitset(self.prompt_ids)
+
+    def plan(self, context, text_candidates):
+        return self.bits(context), None
+
+    def implies(self, other):
+        return isinstance(other, IdTerm) and self.prompt_ids <= other.prompt_ids
+
+
+# Predicates answered exactly by bitsets
+_INDEXED_TERMS = (FacetTerm, FavoriteTerm, SimilarTerm, IdTerm)
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+        self.key = ('not', child.key)
+
+    def matches(self, record, context):
+        return not self.child.matches(record, context)
+
+    def plan(self, context, text_candidates):
+        bits, residual = self.child.plan(context, text_candidates)
+        if bits is None or residual is not None:
+            return None, self # The complement of a superset tells nothing
+        return context.search_index.facets.all & ~bits, None
+
+    def implies(self, other):
+        # Not containing a term implies not containing any longer one
+        return isinstance(other, Not) and (other.key == self.key or other.child.implies(self.child))
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+        self.key = ('or',) + tuple(child.key for child in children)
+
+    def matches(self, record, context):
+        return any(child.matches(record, context) for child in self.children)
+
+    def plan(self, context, text_candidates):
+        bits = 0
+        exact = True
+        for child in self.children:
+            child_bits, residual = child.plan(context, text_candidates)
+            if child_bits is None:
+                return None, self
+            bits |= child_bits
+            exact = exact and residual is None
+        return bits, None if exact else self
+
+    def implies(self, other):
+        if isinstance(other, Or):
+            return all(any(child.implies(other_child) for other_child in other.children) for child in self.children)
+        return other.key == self.key
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+        self.key = ('and',) + tuple(child.key for child in children)
+
+    def matches(self, record, context):
+        return all(child.matches(record, context) for child in self.children)
+
+    def plan(self, context, text_candidates):
+        # The most selective indexed predicates are combined first; the text ones are only looked up
+        # while the candidates are still many, and checked on each candidate last
+        bits = None
+        residuals = []
+        for child in sorted(self.children, key=lambda child: _cost(child, context)):
+            if bits is not None and not _is_indexed(child) and bits.bit_count() <= PLAN_SCAN_SIZE:
+                residuals.append(child)
+                continue
+            child_bits, residual = child.plan(context, text_candidates)
+            if residual is not None:
+                residuals.append(residual)
+            if child_bits is not None:
+                bits = child_bits if bits is None else bits & child_bits
+                if not bits:
+                    return 0, None
+        if not residuals:
+            return bits, None
+        return bits, residuals[0] if len(residuals) == 1 else And(residuals)
+
+    def implies(self, other):
+        return other.key == self.key
+
+
+def _is_indexed(node):
+    # Whether node is answered exactly by bitsets, e.g. any of several categories
+    if isinstance(node, Or):
+        return all(_is_indexed(child) for child in node.children)
+    return isinstance(node, _INDEXED_TERMS)
+
+
+def _cost(node, context):
+    # Sort key estimating how selective and how cheap to check a predicate is
+    if _is_indexed(node):
+        return (_FACET_RANK, node.plan(context, None)[0].bit_count())
+    if isinstance(node, TextTerm):
+        return (_TEXT_RANK, -len(node.value)) # Longer terms have rarer trigrams
+    if isinstance(node, RegexTerm):
+        return (_REGEX_RANK, 0)
+    return (_COMPOUND_RANK, 0)
+
+
+def positive_terms(node):
+    # Values of the text terms that prompts matching node may contain (the negated ones excluded)
+    if isinstance(node, TextTerm):
+        return [node.value]
+    if isinstance(node, (And, Or)):
+        return [value for child in node.children for value in positive_terms(child)]
+    return []
+
+
+def conjuncts(node):
+    # The predicates all of which a prompt matching node matches
+    return node.children if isinstance(node, And) else [node]
+
+
+def make_and(children):
+    flat = []
+    for child in children:
+        flat.extend(conjuncts(child))
+    return flat[0] if len(flat) == 1 else And(flat)
+
+
+def make_or(children):
+    return children[0] if len(children) == 1 else Or(children)
+
+
+def _tokens(text):
+    # Yields _OPEN, _CLOSE, _NOT, _OR, _AND, and (field, value, quoted) for terms
+    position = 0
+    depth = 0
+    length = len(text)
+    while True:
+        while position < length and text[position].isspace():
+            position += 1
+        if position >= length:
+            return
+        if text[position] == '-' and position + 1 < length and not text[position + 1].isspace():
+            yield _NOT
+            position += 1
+        if text[position] == '(':
+            yield _OPEN
+            depth += 1
+            position += 1
+            continue
+        if text[position] == ')' and depth:
+            yield _CLOSE
+            depth -= 1
+            position += 1
+            continue
+
+        field = None
+        match = _FIELD.match(text, position)
+        if match and match.group(1).lower() in FIELDS:
+            field = FIELDS[match.group(1).lower()]
+            position = match.end()
+        if position < length and text[position] == '"':
+            end = text.find('"', position + 1)
+            if end < 0:
+                end = length
+            yield field, text[position + 1:end], True
+            position = end + 1
+            continue
+
+        end = position
+        while end < length and not text[end].isspace():
+            end += 1
+        word = text[position:end]
+        position = end
+        # Closing parentheses at the end of a word close the groups still open
+        closes = 0
+        while closes < depth and word.endswith(')'):
+            word = word[:-1]
+            closes += 1
+        if field is None and word in (_OR, _AND):
+            yield word
+        elif word or field is not None:
+            yield field, word, False
+        for _ in range(closes):
+            yield _CLOSE
+        depth -= closes
+
+
+class _Parser:
+    def __init__(self, text, fold, similar_ids):
+        self.tokens = list(_tokens(text))
+        self.position = 0
+        self.fold = fold
+        self.similar_ids = similar_ids
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def query(self):
+        # clause* up to a closing parenthesis or the end
+        clauses = []
+        while self._peek() not in (None, _CLOSE):
+            if self._peek() in (_OR, _AND):
+                self.position += 1 # Nothing to combine with, or the implicit AND
+                continue
+            clause = self.clause()
+            if clause is not None:
+                clauses.append(clause)
+        return make_and(clauses)
+
+    def clause(self):
+        # unit (OR unit)*
+        units = [self.unit()]
+        while self._peek() == _OR:
+            self.position += 1
+            if self._peek() in (None, _CLOSE, _OR, _AND):
+                break # e.g. while typing 'a OR '
+            units.append(self.unit())
+        units = [unit for unit in units if unit is not None]
+        if not units:
+            return None
+        return units[0] if len(units) == 1 else Or(units)
+
+    def unit(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        if token == _NOT:
+            if self._peek() in (None, _CLOSE, _OR, _AND):
+                return None
+            unit = self.unit()
+            return Not(unit) if unit is not None else None
+        if token == _OPEN:
+            query = self.query()
+            if self._peek() == _CLOSE:
+                self.position += 1
+            return query if conjuncts(query) else None
+        field, value, quoted = token
+        if field == 'favorite':
+            return FavoriteTerm(value.lower() not in FALSE_VALUES) if value else None
+        if field in ('category', 'tag'):
+            return FacetTerm(field, value) if value else None
+        if field == 'similar':
+            if not value.isdigit() or self.similar_ids is None:
+                return None
+            return SimilarTerm(int(value), self.similar_ids(int(value)))
+        if field == 'id':
+            prompt_ids = [int(part) for part in value.split(',') if part.isdigit()]
+            return IdTerm(prompt_ids) if prompt_ids else None
+        value = self.fold(value)
+        return TextTerm(value, field) if value else None
+
+
+def parse_query(text, fold=str.casefold, similar_ids=None):
+    # Query node for the search bar text; fold is applied to the text terms, similar_ids(prompt_id)
+    # finds the near-duplicates of a prompt. An empty query is an empty And, which every prompt matches.
+    return _Parser(text, fold, similar_ids).query()
+
+
+def compile_pattern(pattern, flags=0):
+    # Compiled pattern, from the most recently used ones when possible; raises re.error
+    key = (pattern, flags)
+    compiled = _patterns.get(key)
+    if compiled is None:
+        try:
+            compiled = re.compile(pattern, flags)
+        except re.error as e:
+            compiled = e # Patterns being typed are often incomplete, the error is kept as well
+        _patterns[key] = compiled
+        while len(_patterns) > PATTERN_CACHE_SIZE:
+            _patterns.popitem(last=False)
+    else:
+        _patterns.move_to_end(key)
+    if isinstance(compiled, re.error):
+        raise compiled
+    return compiled
+
+
+def _has_top_level_alternation(pattern):
+    depth = 0
+    position = 0
+    length = len(pattern)
+    while position < length:
+        char = pattern[position]
+        if char == '\\':
+            position += 1
+        elif char == '[':
+            # Character class: up to the first ] that is not its first character
+            position += 2 if pattern.startswith('[^', position) else 1
+            position += 1 if pattern.startswith(']', position) else 0
+            while position < length and pattern[position] != ']':
+                position += 2 if pattern[position] == '\\' else 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth <= 0:
+            return True
+        position += 1
+    return False
+
+
+def literal_prefix(pattern):
+    # The literal text every match of pattern starts with ('' when it has none), e.g. 'Dear ' for
+    # 'Dear \w+,'. Only ASCII text is returned, which the folded search texts contain alike.
+    if _has_top_level_alternation(pattern):
+        return ''
+    prefix = []
+    position = 1 if pattern.startswith('^') else 0
+    length = len(pattern)
+    while position < length:
+        char = pattern[position]
+        if char == '\\':
+            if position + 1 >= length or pattern[position + 1].isalnum():
+                break # Character classes, anchors, back references...
+            char = pattern[position + 1]
+            step = 2
+        elif char in _REGEX_SPECIAL:
+            break
+        else:
+            step = 1
+        following = pattern[position + step:position + step + 1]
+        if following in ('*', '?', '{'):
+            break # The character may be missing from a match
+        if not char.isascii():
+            break
+        prefix.append(char)
+        position += step
+        if following == '+':
+            break
+    return ''.join(prefix)
+
+
+def regex_query(pattern, case_sensitive=False, fold=str.casefold):
+    # RegexTerm for the search bar text in regex mode (an empty And for no text); raises re.error
+    if not pattern:
+        return And([])
+    flags = re.MULTILINE if case_sensitive else re.MULTILINE | re.IGNORECASE
+    literal = literal_prefix(pattern)
+    return RegexTerm(compile_pattern(pattern, flags), literal if case_sensitive else fold(literal))
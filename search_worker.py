@@ -0,0 +1,67 @@
+import threading
+
+from search_index import SearchTimeout, filter_prompts
+
+
+# Runs the searches of the prompt list on a worker thread, so that typing never waits for them.
+# Only the latest search matters: submitting one drops the one still waiting, and makes the one
+# running stop at its next cancellation check. Each search is numbered; on_result is called from
+# the worker thread with that number, so the caller can tell whether the result is still current;
+# the result is None when the search ran out of time (see SearchTimeout).
+class SearchWorker:
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self.generation = 0 # Number of the latest search, or of the latest cancel()
+
+        self._condition = threading.Condition()
+        self._request = None # (generation, PromptFilter, prompts) not started yet
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="PromptVaultSearch", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt_filter, prompts):
+        # prompts: prompt_id -> PromptRecord, a copy the caller no longer modifies
+        with self._condition:
+            self.generation += 1
+            self._request = (self.generation, prompt_filter, prompts)
+            self._condition.notify_all()
+            return self.generation
+
+    def cancel(self):
+        # The searches submitted so far are out of date, their results are not delivered
+        with self._condition:
+            self.generation += 1
+            self._request = None
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def close(self):
+        with self._condition:
+            self.generation += 1
+            self._request = None
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                (generation, prompt_filter, prompts), self._request = self._request, None
+
+            try:
+                records = filter_prompts(prompts, prompt_filter, cancelled=lambda: generation != self.generation)
+            except SearchTimeout as e:
+                print(f"Warning: {e}: {prompt_filter.search_term!r}")
+                if generation == self.generation:
+                    self.on_result(generation, prompt_filter, None)
+                continue
+            except Exception as e:
+                print(f"Error: Search failed: {e}")
+                continue
+            if records is not None and generation == self.generation:
+                self.on_result(generation, prompt_filter, records)
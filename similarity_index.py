@@ -0,0 +1,176 @@
+import bisect
+import operator
+
+from array import array
+
+from rank_index import tokens
+
+# Number of MinHash values in the signature of a prompt, split into LSH_BANDS bands of LSH_ROWS values.
+# Two prompts are compared when all the values of one of their bands are equal, which happens with
+# a probability of 1 - (1 - s ** LSH_ROWS) ** LSH_BANDS for prompts of similarity s: about 0.99 at
+# s = 0.7, 0.05 at s = 0.3.
+SIGNATURE_SIZE = 64
+LSH_BANDS = 16
+LSH_ROWS = 4
+# Words per shingle
+SHINGLE_SIZE = 3
+# Estimated Jaccard similarity of the shingles of two prompts from which they are near-duplicates
+SIMILARITY_THRESHOLD = 0.7
+
+_NO_VALUE = 0xFFFFFFFF # Above every MinHash value
+_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+# Added to a value borrowed by an empty slot for each slot it is borrowed across (see signature())
+_BORROW_STEP = 0x9E3779B1
+
+
+def shingles(text):
+    # The runs of SHINGLE_SIZE consecutive words of text (all its words for shorter texts)
+    words = tokens(text.casefold())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return set(zip(*(words[start:] for start in range(SHINGLE_SIZE))))
+
+
+def signature(text):
+    # MinHash signature of the shingles of text, or None for a text without words.
+    # Each shingle is hashed once (one permutation hashing): the hash picks one of the SIGNATURE_SIZE
+    # slots, which keeps the smallest of the rest of the hashes falling into it. A slot no shingle
+    # fell into borrows the value of the next slot that has one, so short texts still compare.
+    text_shingles = shingles(text)
+    if not text_shingles:
+        return None
+    values = [_NO_VALUE] * SIGNATURE_SIZE
+    for shingle in text_shingles:
+        shingle_hash = hash(shingle) & _HASH_MASK
+        slot = shingle_hash % SIGNATURE_SIZE
+        value = (shingle_hash // SIGNATURE_SIZE) % _NO_VALUE
+        if value < values[slot]:
+            values[slot] = value
+    if _NO_VALUE in values:
+        filled = [slot for slot, value in enumerate(values) if value != _NO_VALUE]
+        for slot, value in enumerate(values):
+            if value == _NO_VALUE:
+                index = bisect.bisect_right(filled, slot)
+                source = filled[index] if index < len(filled) else filled[0] + SIGNATURE_SIZE
+                values[slot] = (values[source % SIGNATURE_SIZE] + (source - slot) * _BORROW_STEP) % _NO_VALUE
+    return array('I', values)
+
+
+def similarity(signature_a, signature_b):
+    # Estimated Jaccard similarity of the shingles the two signatures were computed from
+    return sum(map(operator.eq, signature_a, signature_b)) / SIGNATURE_SIZE
+
+
+def _band_keys(prompt_signature):
+    return array('q', [hash(tuple(prompt_signature[start:start + LSH_ROWS])) for start in range(0, SIGNATURE_SIZE, LSH_ROWS)])
+
+
+# MinHash signatures of the prompt bodies and their LSH band buckets, to find near-duplicates (lightly
+# edited copies) of prompts. Prompts are added by the indexing pass of the SearchIndex and kept up to
+# date as they are saved, so that a lookup only compares a prompt with the ones sharing a band with it.
+# Used on the GUI thread only.
+class SimilarityIndex:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._signatures = {} # prompt_id -> (prompt text it was computed from, signature or None)
+        self._buckets = [{} for _ in range(LSH_BANDS)] # band key -> prompt ID, or list of prompt IDs sharing it
+
+    def update(self, prompt_id, record):
+        # Indexes the current version of a prompt, added or edited
+        cached = self._signatures.get(prompt_id)
+        text = record.prompt
+        if cached is not None:
+            if cached[0] == text:
+                return
+            self.remove(prompt_id)
+        prompt_signature = signature(text)
+        self._signatures[prompt_id] = (text, prompt_signature)
+        if prompt_signature is not None:
+            for buckets, key in zip(self._buckets, _band_keys(prompt_signature)):
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = prompt_id
+                elif isinstance(bucket, list):
+                    bucket.append(prompt_id)
+                else:
+                    buckets[key] = [bucket, prompt_id]
+
+    def remove(self, prompt_id):
+        cached = self._signatures.pop(prompt_id, None)
+        if cached is None or cached[1] is None:
+            return
+        for buckets, key in zip(self._buckets, _band_keys(cached[1])):
+            bucket = buckets[key]
+            if not isinstance(bucket, list):
+                del buckets[key]
+            else:
+                bucket.remove(prompt_id)
+                if len(bucket) == 1:
+                    buckets[key] = bucket[0]
+
+    def similar_ids(self, prompt_id, threshold=SIMILARITY_THRESHOLD):
+        # IDs of the indexed prompts that are near-duplicates of prompt_id, itself included
+        similar = {prompt_id}
+        cached = self._signatures.get(prompt_id)
+        if cached is not None and cached[1] is not None:
+            similar.update(other_id for score, other_id in self._matches(cached[1], threshold))
+        return similar
+
+    def similar_texts(self, texts, threshold=SIMILARITY_THRESHOLD):
+        # For each of texts, the (similarity, prompt_id) of its near-duplicates among the indexed
+        # prompts, most similar first
+        results = []
+        for text in texts:
+            query = signature(text)
+            results.append(sorted(self._matches(query, threshold), reverse=True) if query is not None else [])
+        return results
+
+    def clusters(self, threshold=SIMILARITY_THRESHOLD):
+        # Groups of near-duplicate prompt IDs (at least two), largest first. Each prompt is only compared
+        # with the first prompt of every LSH bucket it falls into, which keeps this linear in the number
+        # of prompts; groups are joined when one of their prompts is similar to a prompt of the other.
+        signatures = self._signatures
+        parents = {}
+
+        def root(prompt_id):
+            while parents.get(prompt_id, prompt_id) != prompt_id:
+                parent = parents[prompt_id]
+                parents[prompt_id] = parents.get(parent, parent) # Path halving
+                prompt_id = parent
+            return prompt_id
+
+        for buckets in self._buckets:
+            for bucket in buckets.values():
+                if isinstance(bucket, list):
+                    first = bucket[0]
+                    for other_id in bucket[1:]:
+                        first_root, other_root = root(first), root(other_id)
+                        if (first_root != other_root
+                                and similarity(signatures[first][1], signatures[other_id][1]) >= threshold):
+                            parents[other_root] = first_root
+                            parents.setdefault(first_root, first_root)
+
+        groups = {}
+        for prompt_id in parents:
+            groups.setdefault(root(prompt_id), []).append(prompt_id)
+        clusters = [sorted(group) for group in groups.values() if len(group) > 1]
+        clusters.sort(key=len, reverse=True)
+        return clusters
+
+    def _matches(self, query, threshold):
+        # (similarity, prompt_id) of the indexed prompts sharing an LSH band with the signature query
+        # and similar enough to it
+        candidates = set()
+        for buckets, key in zip(self._buckets, _band_keys(query)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                candidates.update(bucket if isinstance(bucket, list) else (bucket,))
+        signatures = self._signatures
+        matches = []
+        for other_id in candidates:
+            score = similarity(query, signatures[other_id][1])
+            if score >= threshold:
+                matches.append((score, other_id))
+        return matches
@@ -0,0 +1,121 @@
+import codecs
+import json
+import os
+import re
+
+# Bytes read from the snapshot file at a time
+READ_CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'\s*')
+# Where parsing can resume after a damaged prompt entry: the comma before the next entry
+# ("<id>": {...}), or the end of the prompts object followed by another top-level key.
+# Quotes inside JSON strings are escaped, so neither can match within a valid entry.
+_RESYNC = re.compile(r',\s*(?="-?\d+"\s*:\s*\{)|\}\s*(?=,\s*"(?:next_id|categories|global_tags|journal_seq)"\s*:)')
+
+
+# Reads a JSON snapshot (see JsonPromptStorage.compact) a chunk at a time, so that prompts can be
+# handed out while the rest of the file is still being parsed. A damaged prompt entry is reported
+# and skipped on its own, parsing resumes at the next entry.
+class JsonSnapshotReader:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.stat = os.fstat(self._file.fileno()) # Of the file being read, even if it is replaced meanwhile
+        self.size = self.stat.st_size
+        self.bytes_read = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def close(self):
+        self._file.close()
+
+    def _read_more(self):
+        if self._eof:
+            return False
+        chunk = self._file.read(READ_CHUNK_SIZE)
+        self.bytes_read += len(chunk)
+        if not chunk:
+            self._eof = True
+        # Drop what has been parsed already, the buffer only holds the entry being read
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        # Next non-whitespace character, or '' at the end of the file
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._read_more():
+                break
+        return self._buffer[self._pos:self._pos + 1]
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' in {self.path}, found {self._buffer[self._pos:self._pos + 20]!r}")
+        self._pos += 1
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, self._pos = self._json.raw_decode(self._buffer, self._pos)
+                return value
+            except json.JSONDecodeError:
+                # Most likely cut at the end of the buffer
+                if not self._read_more():
+                    raise
+
+    def _parse_entry(self, pos):
+        # '"<id>": <value>' at pos within the buffer, without reading more of the file
+        key, pos = self._json.raw_decode(self._buffer, _WHITESPACE.match(self._buffer, pos).end())
+        pos = _WHITESPACE.match(self._buffer, pos).end()
+        if self._buffer[pos:pos + 1] != ':':
+            raise ValueError("Expected ':' after the prompt ID")
+        value, pos = self._json.raw_decode(self._buffer, _WHITESPACE.match(self._buffer, pos + 1).end())
+        return key, value, pos
+
+    def _read_prompt_entries(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            self._peek()
+            try:
+                key, value, self._pos = self._parse_entry(self._pos)
+                yield 'prompt', key, value
+            except (ValueError, IndexError) as e:
+                match = _RESYNC.search(self._buffer, self._pos)
+                if match is None:
+                    # The entry is not complete in the buffer yet
+                    if self._read_more():
+                        continue
+                    raise ValueError(f"{self.path} ends in the middle of a prompt entry") from e
+                damaged = self._buffer[self._pos:match.start()]
+                self._pos = match.start()
+                yield 'invalid', damaged[:40], str(e)
+            separator = self._peek()
+            if separator == '}':
+                self._pos += 1
+                return
+            self._expect(',')
+
+    def entries(self):
+        # Yields ('prompt', id, entry) and ('invalid', excerpt, error) for the prompts object,
+        # and ('field', key, value) for the other top-level keys, in file order
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._decode_value()
+            self._expect(':')
+            if key == 'prompts':
+                yield from self._read_prompt_entries()
+            else:
+                yield 'field', key, self._decode_value()
+            if self._peek() == '}':
+                return
+            self._expect(',')
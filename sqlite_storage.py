@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+import sys
+
+from prompt_model import PromptRecord, TextPool
+from prompt_storage import JsonPromptStorage, LoadBatches, normalize_prompt_entry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    prompt TEXT NOT NULL DEFAULT '',
+    note TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT 'No category',
+    favorite INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    rev INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS history (
+    prompt_id INTEGER NOT NULL REFERENCES prompts(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (prompt_id, version)
+);
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS global_tags (
+    name TEXT PRIMARY KEY
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+    title, prompt, note, content='prompts', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS prompts_fts_insert AFTER INSERT ON prompts BEGIN
+    INSERT INTO prompts_fts(rowid, title, prompt, note) VALUES (new.id, new.title, new.prompt, new.note);
+END;
+CREATE TRIGGER IF NOT EXISTS prompts_fts_delete AFTER DELETE ON prompts BEGIN
+    INSERT INTO prompts_fts(prompts_fts, rowid, title, prompt, note) VALUES ('delete', old.id, old.title, old.prompt, old.note);
+END;
+CREATE TRIGGER IF NOT EXISTS prompts_fts_update AFTER UPDATE ON prompts BEGIN
+    INSERT INTO prompts_fts(prompts_fts, rowid, title, prompt, note) VALUES ('delete', old.id, old.title, old.prompt, old.note);
+    INSERT INTO prompts_fts(rowid, title, prompt, note) VALUES (new.id, new.title, new.prompt, new.note);
+END;
+"""
+
+# PRAGMA user_version of the current layout: the history table only holds past versions,
+# the current version of a prompt is its row in the prompts table (1), which has the revision of
+# the prompt (2)
+SCHEMA_VERSION = 2
+
+# The trigram tokenizer cannot match anything shorter than this
+MIN_INDEXED_TERM_LENGTH = 3
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+# Same load/append/compact interface as JsonPromptStorage, backed by a SQLite database.
+# Every journal record becomes a row-level update, so there is nothing to compact.
+class SQLitePromptStorage:
+    def __init__(self, db_file):
+        self.data_file = db_file
+        # load() runs on the loader thread, everything else on the GUI thread once it is done
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode commits stay atomic and crash-safe without an fsync on every transaction
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self):
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version < 1:
+            # Histories used to end with a copy of the current version
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM history WHERE (prompt_id, version) IN "
+                    "(SELECT h.prompt_id, MAX(h.version) FROM history h JOIN prompts p ON p.id = h.prompt_id "
+                    "GROUP BY h.prompt_id HAVING h.data = p.data)")
+        if version < 2:
+            columns = {name for (_, name, *rest) in self.connection.execute("PRAGMA table_info(prompts)")}
+            if 'rev' not in columns: # Tables created by the current SCHEMA already have it
+                with self.connection:
+                    self.connection.execute("ALTER TABLE prompts ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def load(self, on_batch=None):
+        state = {'next_id': 0, 'prompts': {}, 'categories': [], 'global_tags': []}
+        cursor = self.connection.cursor()
+
+        row = cursor.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+        if row:
+            state['next_id'] = int(row[0])
+        state['categories'] = [name for (name,) in cursor.execute("SELECT name FROM categories ORDER BY name")]
+        state['global_tags'] = [name for (name,) in cursor.execute("SELECT name FROM global_tags ORDER BY name")]
+
+        prompts = state['prompts']
+        batches = LoadBatches(on_batch)
+        pool = TextPool()
+        (total,) = cursor.execute("SELECT COUNT(*) FROM prompts").fetchone()
+        for done, (prompt_id, data, rev) in enumerate(cursor.execute("SELECT id, data, rev FROM prompts"), 1):
+            try:
+                entry = normalize_prompt_entry({'data': json.loads(data)})
+            except json.JSONDecodeError:
+                entry = None
+            if entry is None:
+                print(f"Warning: Invalid data for prompt ID '{prompt_id}', ignored.")
+                continue
+            prompts[prompt_id] = PromptRecord.from_dict(entry['data'], pool, id=prompt_id, rev=rev)
+            batches.add(prompt_id, prompts[prompt_id], done, total)
+        batches.flush()
+        return state
+
+    def read_history(self, prompt_id):
+        rows = self.connection.execute("SELECT data FROM history WHERE prompt_id = ? ORDER BY version", (prompt_id,))
+        return [json.loads(data) for (data,) in rows]
+
+    def write_history(self, prompt_id, entries):
+        with self.connection:
+            self.connection.execute("DELETE FROM history WHERE prompt_id = ?", (prompt_id,))
+            self.connection.executemany(
+                "INSERT INTO history (prompt_id, version, data) VALUES (?, ?, ?)",
+                [(prompt_id, version, _dumps(entry)) for version, entry in enumerate(entries)])
+
+    def append(self, records):
+        if not records:
+            return
+        with self.connection:
+            for record in records:
+                self._apply_record(record)
+
+    def _apply_record(self, record):
+        op = record.get('op')
+        if op == 'meta':
+            self._write_meta(record)
+        elif op == 'put':
+            self._write_prompt(record['id'], record['data'], record.get('rev', 0))
+            self.connection.execute("DELETE FROM history WHERE prompt_id = ?", (record['id'],))
+        elif op == 'update':
+            self._write_prompt(record['id'], record['data'], record.get('rev', 0))
+            if 'past_version' in record:
+                self.connection.execute(
+                    "INSERT INTO history (prompt_id, version, data) "
+                    "SELECT ?, COALESCE(MAX(version), -1) + 1, ? FROM history WHERE prompt_id = ?",
+                    (record['id'], _dumps(record['past_version']), record['id']))
+        elif op == 'delete':
+            self.connection.execute("DELETE FROM prompts WHERE id = ?", (record['id'],))
+        else:
+            print(f"Warning: Unknown storage operation '{op}', ignored.")
+
+    def _write_prompt(self, prompt_id, data, rev):
+        self.connection.execute(
+            "INSERT INTO prompts (id, title, prompt, note, category, favorite, data, rev) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET title = excluded.title, prompt = excluded.prompt, note = excluded.note, "
+            "category = excluded.category, favorite = excluded.favorite, data = excluded.data, rev = excluded.rev",
+            (prompt_id, data.get('title', ''), data.get('prompt', ''), data.get('note', ''),
+             data.get('category') or 'No category', 1 if data.get('favorite', False) else 0, _dumps(data), rev))
+
+    def _write_meta(self, meta):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_id', ?)", (str(meta['next_id']),))
+        self.connection.execute("DELETE FROM categories")
+        self.connection.executemany("INSERT OR IGNORE INTO categories (name) VALUES (?)", [(c,) for c in meta['categories']])
+        self.connection.execute("DELETE FROM global_tags")
+        self.connection.executemany("INSERT OR IGNORE INTO global_tags (name) VALUES (?)", [(t,) for t in meta['global_tags']])
+
+    def needs_compaction(self):
+        return False
+
+    def watched_files(self):
+        # Not shared between instances: SQLite serializes the writers, but the other instances'
+        # changes are only seen after a restart
+        return []
+
+    def has_external_changes(self):
+        return False
+
+    def read_changes(self):
+        return []
+
+    def compact(self, state):
+        # Rewrites every prompt from an in-memory state (histories are left to write_history),
+        # used by the JSON migration
+        with self.connection:
+            self.connection.execute("DELETE FROM prompts")
+            self._write_meta(state)
+            for prompt_id, record in state['prompts'].items():
+                self._write_prompt(prompt_id, record.to_dict(), record.rev)
+
+    def search_ids(self, search_term, case_sensitive=False):
+        # Candidate IDs whose title, prompt or note contain search_term, or None when the term is too
+        # short for the index. The index is case-insensitive: for a case-sensitive search, its
+        # candidates are checked again with instr(), which compares exactly.
+        if len(search_term) < MIN_INDEXED_TERM_LENGTH:
+            return None
+        phrase = '"' + search_term.replace('"', '""') + '"'
+        if case_sensitive:
+            rows = self.connection.execute(
+                "SELECT p.id FROM prompts_fts JOIN prompts p ON p.id = prompts_fts.rowid "
+                "WHERE prompts_fts MATCH ? AND (instr(p.title, ?) OR instr(p.prompt, ?) OR instr(p.note, ?))",
+                (phrase, search_term, search_term, search_term))
+        else:
+            rows = self.connection.execute("SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?", (phrase,))
+        return {prompt_id for (prompt_id,) in rows}
+
+    def close(self):
+        self.connection.close()
+
+
+def migrate_json_to_sqlite(json_file, db_file):
+    if os.path.exists(db_file):
+        raise FileExistsError(f"{db_file} already exists, refusing to overwrite it.")
+    json_storage = JsonPromptStorage(json_file)
+    state = json_storage.load()
+    storage = SQLitePromptStorage(db_file)
+    try:
+        storage.compact(state)
+        for prompt_id in state['prompts']:
+            storage.write_history(prompt_id, json_storage.read_history(prompt_id))
+    finally:
+        storage.close()
+    return len(state['prompts'])
+
+
+if __name__ == '__main__':
+    # One-shot migration: python sqlite_storage.py [prompts_data.json] [prompts_data.db]
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    json_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, "prompts_data.json")
+    db_file = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_file)[0] + ".db"
+    try:
+        count = migrate_json_to_sqlite(json_file, db_file)
+    except (IOError, json.JSONDecodeError, sqlite3.Error) as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+    print(f"Migrated {count} prompt(s) from {json_file} to {db_file}.")
@@ -0,0 +1,64 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication
+
+import prompt_manager_widget
+from prompt_manager_widget import PromptManager
+from prompt_storage import JsonPromptStorage
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts_data_sample.json')
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+
+class LoadJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        data_file = os.path.join(self.directory, 'prompts_data.json')
+        shutil.copy(SAMPLE_FILE, data_file)
+        # A change journaled after the snapshot, e.g. by another instance or before a crash
+        storage = JsonPromptStorage(data_file)
+        storage.load()
+        storage.append([{'op': 'put', 'id': 10, 'rev': 1,
+                         'data': {'title': 'From the journal', 'prompt': 'Journaled prompt', 'note': '',
+                                  'category': 'JournalCat', 'tags': ['jtag'], 'favorite': False}}])
+        storage.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def wait(self, manager):
+        deadline = time.monotonic() + 30
+        while (manager.loading or manager.searchTimer.isActive() or manager._search_running) \
+                and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+
+    def test_lists_include_journaled_prompts(self):
+        module_file = os.path.join(self.directory, 'prompt_manager_widget.py')
+        with mock.patch.object(prompt_manager_widget, '__file__', module_file):
+            manager = PromptManager()
+        try:
+            self.wait(manager)
+            self.assertIn(10, manager.prompts)
+            self.assertEqual(manager.promptModel.rowCount(), len(manager.prompts))
+            categories = [manager.categoryList.item(row).data(Qt.ItemDataRole.UserRole)
+                          for row in range(manager.categoryList.count())]
+            tags = [manager.tagList.item(row).data(Qt.ItemDataRole.UserRole) for row in range(manager.tagList.count())]
+            self.assertIn('JournalCat', categories)
+            self.assertIn('jtag', tags)
+        finally:
+            manager.flush_saves()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import time
+import unittest
+
+from prompt_model import PromptRecord
+from search_index import REGEX_TIME_BUDGET, PromptFilter, SearchIndex, SearchTimeout, filter_prompts
+
+
+class RegexSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.prompts = {
+            1: PromptRecord(1, title="Backtracking", prompt="a" * 64 + "!"),
+            2: PromptRecord(2, title="Summary", prompt="Summarize the text below", note="aaa"),
+        }
+        self.search_index = SearchIndex()
+        self.search_index.reset(self.prompts)
+        self.search_index.build(self.prompts)
+
+    def tearDown(self):
+        self.search_index.regex_matcher.close()
+
+    def search(self, pattern):
+        return filter_prompts(self.prompts, PromptFilter(self.search_index, pattern, regex=True))
+
+    def test_matches(self):
+        self.assertEqual([record.id for record in self.search(r"^summ\w+")], [2])
+        self.assertEqual([record.id for record in self.search(r"a{3}$")], [2])
+
+    def test_catastrophic_pattern_stops_within_budget(self):
+        started = time.monotonic()
+        with self.assertRaises(SearchTimeout):
+            self.search(r"(a+)+$")
+        self.assertLess(time.monotonic() - started, REGEX_TIME_BUDGET + 1.0)
+        # The next search starts a new matching process
+        self.assertEqual([record.id for record in self.search("Summ")], [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import bisect
+import operator
+
+# Below this many candidates per prompt in the index, the candidates are sorted by their sort keys
+# rather than picked out of the whole order
+ORDER_WALK_COST = 16
+
+
+def title_key(record):
+    # Order of the prompt list: by title, as str compares them. Any function of a PromptRecord
+    # returning comparable values can replace it (e.g. a locale collation key of the title).
+    return record.title
+
+
+# The prompt IDs in display order, by sort key then ID, kept sorted as prompts change so that the
+# results of a search are picked out in order rather than sorted on every refresh. Built once the
+# vault is loaded, see covers().
+# Changes are made on the GUI thread while searches may walk the order on the search thread: the
+# order is replaced rather than modified, so a search reads one consistent order. Within a batch of
+# changes (begin_batch() / end_batch()), the order is replaced once at the end rather than at each one.
+class TitleIndex:
+    def __init__(self, key=title_key):
+        self.key = key
+        self._batches = 0 # Nesting of begin_batch()
+        self.reset()
+
+    def reset(self, prompts=None, key=None):
+        # prompts: prompt_id -> PromptRecord; key: a new sort key function
+        if key is not None:
+            self.key = key
+        key = self.key
+        entries = sorted((key(record), prompt_id) for prompt_id, record in (prompts or {}).items())
+        self._keys = {prompt_id: sort_key for sort_key, prompt_id in entries} # prompt_id -> its sort key
+        self._entries = entries # (sort key, prompt_id), sorted
+        self.order = list(map(operator.itemgetter(1), entries)) # The prompt IDs of _entries
+        self._order_stale = False # _entries changed in a batch, order is rebuilt by end_batch()
+
+    def begin_batch(self):
+        self._batches += 1
+
+    def end_batch(self):
+        self._batches -= 1
+        if not self._batches and self._order_stale:
+            self.order = list(map(operator.itemgetter(1), self._entries))
+            self._order_stale = False
+
+    def covers(self, prompts):
+        # Whether every prompt of prompts is in the order, e.g. not while the vault is loading or
+        # while a batch of changes has not been applied to it yet
+        return not self._order_stale and len(self._keys) == len(prompts)
+
+    def update(self, prompt_id, record):
+        sort_key = self.key(record)
+        old_key = self._keys.get(prompt_id)
+        if prompt_id in self._keys and old_key == sort_key:
+            return # e.g. a change to the body of the prompt
+        entries = self._entries
+        order = self._order_to_change()
+        if prompt_id in self._keys:
+            position = bisect.bisect_left(entries, (old_key, prompt_id))
+            del entries[position]
+            if order is not None:
+                del order[position]
+        position = bisect.bisect_left(entries, (sort_key, prompt_id))
+        entries.insert(position, (sort_key, prompt_id))
+        if order is not None:
+            order.insert(position, prompt_id)
+            self.order = order
+        self._keys[prompt_id] = sort_key
+
+    def remove(self, prompt_id):
+        if prompt_id not in self._keys:
+            return
+        position = bisect.bisect_left(self._entries, (self._keys.pop(prompt_id), prompt_id))
+        del self._entries[position]
+        order = self._order_to_change()
+        if order is not None:
+            del order[position]
+            self.order = order
+
+    def _order_to_change(self):
+        # Copy of the order to change along with _entries, or None within a batch
+        if self._batches:
+            self._order_stale = True
+            return None
+        return list(self.order)
+
+    def sort_key(self, record):
+        # Where a prompt goes in the order
+        return (self.key(record), record.id)
+
+    def ordered(self, prompts, prompt_ids=None):
+        # The PromptRecords of prompts (prompt_id -> PromptRecord), or of those of prompt_ids among
+        # them, in display order. Only in order while the prompts indexed are those of prompts.
+        order = self.order
+        if prompt_ids is not None:
+            if len(prompt_ids) * ORDER_WALK_COST < len(order):
+                records = [prompts[prompt_id] for prompt_id in prompt_ids if prompt_id in prompts]
+                records.sort(key=self.sort_key)
+                return records
+            if not isinstance(prompt_ids, (set, frozenset, dict)):
+                prompt_ids = set(prompt_ids)
+            order = list(filter(prompt_ids.__contains__, order))
+        try:
+            return list(map(prompts.__getitem__, order))
+        except KeyError: # Prompts deleted since
+            return [prompts[prompt_id] for prompt_id in order if prompt_id in prompts]
@@ -0,0 +1,70 @@
+import os
+
+from PyQt6.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+# Changes arriving within this many milliseconds of each other are reported once
+WATCH_DELAY_MS = 300
+# File system notifications are not delivered for changes made from other machines on most
+# network shares, so the files are also checked at this interval
+POLL_INTERVAL_MS = 5000
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Reports changes to the files of a vault, whether made by this process or another one.
+# Files replaced by a rename (or created later) are watched again after each change.
+class VaultWatcher(QObject):
+    filesChanged = pyqtSignal()
+
+    def __init__(self, paths, parent=None):
+        super().__init__(parent)
+        self.paths = list(paths)
+        self._signatures = {}
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._schedule)
+        self._watcher.directoryChanged.connect(self._schedule)
+
+        self._delay_timer = QTimer(self)
+        self._delay_timer.setSingleShot(True)
+        self._delay_timer.setInterval(WATCH_DELAY_MS)
+        self._delay_timer.timeout.connect(self._report)
+
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(POLL_INTERVAL_MS)
+        self._poll_timer.timeout.connect(self._poll)
+        self._poll_timer.start()
+
+        self._watch()
+
+    def _watch(self):
+        watched = set(self._watcher.files()) | set(self._watcher.directories())
+        directories = {os.path.dirname(os.path.abspath(path)) for path in self.paths}
+        for path in self.paths + sorted(directories):
+            if path not in watched and os.path.exists(path):
+                self._watcher.addPath(path)
+        self._signatures = {path: _signature(path) for path in self.paths}
+
+    def _schedule(self, path=None):
+        self._delay_timer.start()
+
+    def _poll(self):
+        if any(_signature(path) != signature for path, signature in self._signatures.items()):
+            self._schedule()
+
+    def _report(self):
+        self._watch()
+        self.filesChanged.emit()
+
+    def stop(self):
+        self._poll_timer.stop()
+        self._delay_timer.stop()
+        paths = self._watcher.files() + self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)